@@ -8,7 +8,39 @@ Usage:
 
     # All OpenAI / Anthropic / MiniMax calls are now tracked automatically.
     # Or use agentpulse.track(response) for manual tracking.
+
+    # One client per agent when a process hosts several:
+    support = agentpulse.AgentPulse(api_key="ap_...", agent_name="support")
+    with support.scope():
+        ...
 """
 __version__ = "0.3.0"
 
-from .sdk import init, auto_instrument, track, shutdown, set_user, set_context
+# `agentpulse run` imports this package in every child process, so the SDK
+# and submodules are only loaded when first used
+_SDK_EXPORTS = (
+    "AgentPulse", "init", "auto_instrument", "track", "shutdown", "aflush", "ashutdown", "set_user", "set_context",
+    "context", "ratelimit_headroom", "stats",
+)
+
+__all__ = list(_SDK_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _SDK_EXPORTS:
+        from . import sdk
+        value = getattr(sdk, name)
+    else:
+        import importlib
+        try:
+            value = importlib.import_module(f".{name}", __name__)
+        except ModuleNotFoundError as e:
+            if e.name != f"{__name__}.{name}":
+                raise
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted([*globals(), *_SDK_EXPORTS])
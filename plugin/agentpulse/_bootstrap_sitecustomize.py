@@ -4,6 +4,11 @@ Bootstrap module injected by `agentpulse run`.
 This file is placed in a temporary directory that's prepended to PYTHONPATH.
 Python loads sitecustomize.py automatically on startup, so this runs before
 the user's script — patching OpenAI/Anthropic SDKs transparently.
+
+It runs in every Python process started under `agentpulse run`, so it must
+stay cheap: settings come from the AGENTPULSE_* variables set by cmd_run
+(no YAML), and SDKs are patched when the script imports them. With
+`agentpulse run --profile`, AGENTPULSE_PROFILE also starts the sampler.
 """
 import os as _os
 import sys as _sys
@@ -19,6 +24,10 @@ def _agentpulse_bootstrap():
         import agentpulse
         agentpulse.init()
         agentpulse.auto_instrument()
+        profile_dir = _os.environ.get("AGENTPULSE_PROFILE")
+        if profile_dir:
+            from agentpulse import profiler
+            profiler.start(profile_dir, int(_os.environ.get("AGENTPULSE_PROFILE_HZ") or profiler.DEFAULT_HZ))
     except Exception:
         pass  # never crash the user's script
 
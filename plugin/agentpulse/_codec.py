@@ -0,0 +1,113 @@
+"""Internal JSON codec used by the parser, proxy, SDK and sender.
+
+Picks the fastest available backend at import time:
+
+  orjson  →  msgspec  →  stdlib json
+
+Set AGENTPULSE_JSON=orjson|msgspec|stdlib to force a specific backend.
+
+All backends share the same contract:
+  loads(data)  accepts str / bytes / bytearray / memoryview
+  dumps(obj)   returns compact UTF-8 bytes; values the backend can't
+               serialize natively are converted with str() (same as the
+               old `json.dumps(..., default=str)` calls)
+
+Decode failures raise one of the exceptions in DecodeError, so callers can
+write `except DecodeError:` regardless of the backend in use.
+"""
+
+import json as _stdjson
+import os
+
+BACKEND = "stdlib"
+
+
+def _std_loads(data):
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data).decode("utf-8")
+    return _stdjson.loads(data)
+
+
+def _std_dumps(obj, sort_keys=False):
+    return _stdjson.dumps(
+        obj, default=str, ensure_ascii=False, separators=(",", ":"), sort_keys=sort_keys,
+    ).encode("utf-8")
+
+
+def _load_orjson():
+    import orjson
+
+    base_opts = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    sorted_opts = base_opts | orjson.OPT_SORT_KEYS
+
+    def dumps(obj, sort_keys=False):
+        try:
+            return orjson.dumps(obj, default=str, option=sorted_opts if sort_keys else base_opts)
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits — stdlib handles these fine
+            return _std_dumps(obj, sort_keys)
+
+    return orjson.loads, dumps, (orjson.JSONDecodeError,)
+
+
+def _load_msgspec():
+    import msgspec
+
+    encoder = msgspec.json.Encoder(enc_hook=str)
+    sorted_encoder = msgspec.json.Encoder(enc_hook=str, order="sorted")
+    decoder = msgspec.json.Decoder()
+
+    def loads(data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        return decoder.decode(data)
+
+    def dumps(obj, sort_keys=False):
+        try:
+            return (sorted_encoder if sort_keys else encoder).encode(obj)
+        except (TypeError, msgspec.EncodeError):
+            # Non-string dict keys, oversized ints, ...
+            return _std_dumps(obj, sort_keys)
+
+    return loads, dumps, (msgspec.DecodeError,)
+
+
+_BACKENDS = {
+    "orjson": _load_orjson,
+    "msgspec": _load_msgspec,
+}
+
+loads = _std_loads
+dumps = _std_dumps
+DecodeError: tuple = (ValueError, TypeError)
+
+
+def set_backend(name: str = None) -> str:
+    """Select a JSON backend by name, or the fastest installed one if None.
+
+    Returns the name of the backend actually in use. Unknown or
+    uninstalled backends fall back to the stdlib.
+    """
+    global loads, dumps, DecodeError, BACKEND
+
+    candidates = [name] if name else list(_BACKENDS)
+    for candidate in candidates:
+        factory = _BACKENDS.get(candidate)
+        if not factory:
+            continue
+        try:
+            fast_loads, fast_dumps, errors = factory()
+        except ImportError:
+            continue
+        loads, dumps = fast_loads, fast_dumps
+        DecodeError = errors + (ValueError, TypeError)
+        BACKEND = candidate
+        return BACKEND
+
+    loads, dumps = _std_loads, _std_dumps
+    DecodeError = (ValueError, TypeError)
+    BACKEND = "stdlib"
+    return BACKEND
+
+
+set_backend(os.environ.get("AGENTPULSE_JSON") or None)
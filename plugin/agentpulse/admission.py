@@ -0,0 +1,286 @@
+"""Admission control for the LLM proxy.
+
+Limits are configured per provider, optionally narrowed per model:
+
+    proxy_limits:
+      anthropic:
+        concurrency: 8      # requests in flight
+        rpm: 50             # requests per minute
+        tpm: 40000          # tokens per minute (prompt estimate + max_tokens)
+        models:
+          claude-opus-4: {concurrency: 2}
+
+A request that would exceed any limit waits in a per-provider queue.
+Waiters are ordered by priority (from the X-AgentPulse-Priority header,
+higher first) and then by arrival. A waiter blocked only by its model's
+limits doesn't hold up waiters for other models of the same provider, but
+never jumps ahead of a higher-priority waiter for the same model.
+
+Token budgets are charged with an estimate at admission and corrected with
+the real usage once the response is captured.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from . import metrics
+
+logger = logging.getLogger("agentpulse.admission")
+
+WINDOW_SECONDS = 60.0
+
+PRIORITY_NAMES = {"low": -10, "normal": 0, "high": 10}
+
+
+class AdmissionRejected(Exception):
+    """The request could not be admitted (queue full or wait timed out)."""
+
+    def __init__(self, reason: str, queue_ms: int = 0):
+        super().__init__(reason)
+        self.reason = reason
+        self.queue_ms = queue_ms
+
+
+def parse_priority(value: Optional[str]) -> int:
+    """Map an X-AgentPulse-Priority header value to an int (higher = sooner)."""
+    if not value:
+        return 0
+    value = value.strip().lower()
+    if value in PRIORITY_NAMES:
+        return PRIORITY_NAMES[value]
+    try:
+        return int(value)
+    except ValueError:
+        return 0
+
+
+def estimate_request_tokens(request_json: dict, body_size: int) -> int:
+    """Rough token cost of a request for TPM budgeting."""
+    max_out = request_json.get("max_tokens") or request_json.get("max_completion_tokens") or 0
+    if not isinstance(max_out, int):
+        max_out = 0
+    return body_size // 4 + max_out
+
+
+class _Scope:
+    """Counters for one limit scope (a provider, or a provider's model)."""
+
+    __slots__ = ("concurrency", "rpm", "tpm", "in_flight", "window")
+
+    def __init__(self, limits: dict):
+        self.concurrency = limits.get("concurrency")
+        self.rpm = limits.get("rpm")
+        self.tpm = limits.get("tpm")
+        self.in_flight = 0
+        self.window: deque = deque()  # [admitted_at, tokens]
+
+    def prune(self, now):
+        cutoff = now - WINDOW_SECONDS
+        while self.window and self.window[0][0] <= cutoff:
+            self.window.popleft()
+
+    def wait_for(self, tokens, now) -> Optional[float]:
+        """0 if a request fits now, seconds until it might fit, or None if only a release can help."""
+        if self.concurrency and self.in_flight >= self.concurrency:
+            return None
+        self.prune(now)
+        if self.rpm and len(self.window) >= self.rpm:
+            return self.window[0][0] + WINDOW_SECONDS - now
+        if self.tpm and self.window:
+            used = sum(entry[1] for entry in self.window)
+            if used + tokens > self.tpm:
+                # Free up tokens oldest-first until the request fits
+                for admitted_at, spent in self.window:
+                    used -= spent
+                    if used + tokens <= self.tpm:
+                        return admitted_at + WINDOW_SECONDS - now
+                return self.window[-1][0] + WINDOW_SECONDS - now
+        return 0.0
+
+
+class Ticket:
+    """A request's place in the admission queue, and its grant once admitted."""
+
+    __slots__ = (
+        "provider", "model", "priority", "tokens", "sort_key", "granted", "entries", "enqueued_at", "granted_at",
+    )
+
+    def __init__(self, provider, model, priority, tokens, seq):
+        self.provider = provider
+        self.model = model
+        self.priority = priority
+        self.tokens = tokens
+        self.sort_key = (-priority, seq)
+        self.granted = False
+        self.entries = []  # window entries charged for this request
+        self.enqueued_at = time.perf_counter()
+        self.granted_at = None
+
+    def __lt__(self, other):
+        return self.sort_key < other.sort_key
+
+
+class AdmissionController:
+    """Enforces concurrency, RPM and TPM limits with a priority queue."""
+
+    def __init__(self, limits: dict, queue_timeout: float = 60.0, max_queue: int = 1000, clock=time.monotonic):
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._providers: dict[str, _Scope] = {}
+        self._models: dict[tuple, _Scope] = {}
+        self._waiting: dict[str, list] = {}  # provider -> heap of Tickets
+
+        for provider, provider_limits in (limits or {}).items():
+            provider_limits = provider_limits or {}
+            self._providers[provider] = _Scope(provider_limits)
+            for model, model_limits in (provider_limits.get("models") or {}).items():
+                self._models[(provider, model)] = _Scope(model_limits or {})
+
+    def limits_provider(self, provider: str) -> bool:
+        return provider in self._providers
+
+    def acquire(self, provider: str, model: str, tokens: int = 0, priority: int = 0) -> Optional[Ticket]:
+        """Block until the request may go upstream.
+
+        Returns a Ticket to pass to release(), or None if the provider has no
+        limits. Raises AdmissionRejected if the queue is full or the wait
+        exceeds queue_timeout.
+        """
+        if provider not in self._providers:
+            return None
+
+        ticket = Ticket(provider, model, priority, tokens, next(self._seq))
+        deadline = self._clock() + self.queue_timeout
+        queued = False
+        with self._cond:
+            heap = self._waiting.setdefault(provider, [])
+            if len(heap) >= self.max_queue:
+                metrics.PROXY_ADMISSION_REJECTED.labels(provider, "queue_full").inc()
+                raise AdmissionRejected("queue full")
+            heapq.heappush(heap, ticket)
+            try:
+                while True:
+                    retry_in = self._dispatch(provider)
+                    if ticket.granted:
+                        break
+                    if not queued:
+                        queued = True
+                        metrics.PROXY_QUEUE_DEPTH.labels(provider).inc()
+                    remaining = deadline - self._clock()
+                    if remaining <= 0:
+                        heap.remove(ticket)
+                        heapq.heapify(heap)
+                        metrics.PROXY_ADMISSION_REJECTED.labels(provider, "timeout").inc()
+                        raise AdmissionRejected("queue timeout", self._queue_ms(ticket))
+                    self._cond.wait(remaining if retry_in is None else min(remaining, retry_in))
+            finally:
+                if queued:
+                    metrics.PROXY_QUEUE_DEPTH.labels(provider).dec()
+                # Whatever happened to us, others may be able to go now
+                self._cond.notify_all()
+
+        metrics.PROXY_QUEUE_SECONDS.labels(provider).observe(ticket.granted_at - ticket.enqueued_at)
+        return ticket
+
+    def release(self, ticket: Optional[Ticket], tokens_used: Optional[int] = None):
+        """Return a ticket's concurrency slot and correct its token charge."""
+        if ticket is None:
+            return
+        with self._cond:
+            for scope in self._scopes(ticket.provider, ticket.model):
+                scope.in_flight -= 1
+            if tokens_used is not None:
+                self._charge(ticket, tokens_used)
+            self._cond.notify_all()
+
+    def charge(self, ticket: Ticket, tokens_used: int):
+        """Replace a ticket's estimated token charge with its real usage."""
+        with self._cond:
+            self._charge(ticket, tokens_used)
+            self._cond.notify_all()
+
+    def queue_ms(self, ticket: Optional[Ticket]) -> int:
+        return self._queue_ms(ticket) if ticket else 0
+
+    def stats(self) -> dict:
+        with self._cond:
+            now = self._clock()
+            result = {}
+            for provider, scope in self._providers.items():
+                scope.prune(now)
+                result[provider] = {
+                    "in_flight": scope.in_flight,
+                    "queued": len(self._waiting.get(provider, ())),
+                    "requests_last_minute": len(scope.window),
+                    "tokens_last_minute": sum(entry[1] for entry in scope.window),
+                }
+            return result
+
+    # ── internals (caller holds the lock) ──
+
+    @staticmethod
+    def _queue_ms(ticket):
+        end = ticket.granted_at if ticket.granted_at is not None else time.perf_counter()
+        return int((end - ticket.enqueued_at) * 1000)
+
+    def _scopes(self, provider, model):
+        scopes = [self._providers[provider]]
+        model_scope = self._models.get((provider, model))
+        if model_scope is not None:
+            scopes.append(model_scope)
+        return scopes
+
+    def _dispatch(self, provider) -> Optional[float]:
+        """Grant every waiter that fits, in priority order.
+
+        Returns the shortest time after which a still-waiting request could
+        fit because a rate window moves on (None if only releases help).
+        """
+        heap = self._waiting.get(provider)
+        if not heap:
+            return None
+        now = self._clock()
+        provider_scope = self._providers[provider]
+        blocked_models = set()
+        retry_in = None
+        for ticket in sorted(heap):
+            if ticket.model in blocked_models:
+                continue
+            wait = provider_scope.wait_for(ticket.tokens, now)
+            if wait != 0:
+                # Provider limits apply to everyone behind this waiter too
+                retry_in = wait
+                break
+            model_scope = self._models.get((provider, ticket.model))
+            wait = model_scope.wait_for(ticket.tokens, now) if model_scope else 0.0
+            if wait != 0:
+                blocked_models.add(ticket.model)
+                if wait is not None:
+                    retry_in = wait if retry_in is None else min(retry_in, wait)
+                continue
+            self._grant(ticket, now)
+            heap.remove(ticket)
+        heapq.heapify(heap)
+        return retry_in
+
+    @staticmethod
+    def _charge(ticket, tokens_used):
+        for entry in ticket.entries:
+            entry[1] = tokens_used
+
+    def _grant(self, ticket, now):
+        for scope in self._scopes(ticket.provider, ticket.model):
+            scope.in_flight += 1
+            entry = [now, ticket.tokens]
+            scope.window.append(entry)
+            ticket.entries.append(entry)
+        ticket.granted = True
+        ticket.granted_at = time.perf_counter()
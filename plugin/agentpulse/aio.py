@@ -0,0 +1,275 @@
+"""asyncio export path for the SDK.
+
+Events produced on a running event loop (AsyncCompletions.create,
+AsyncMessages.create, async stream wrappers) must not go through
+sdk._flush(), which blocks on urllib and would stall every coroutine on
+the loop while it waits for the API. Instead they're handed to a per-loop
+AsyncExporter: a background task that batches them and POSTs over asyncio
+streams.
+
+Events are added from the loop's own thread (that's how they're routed
+here), so the exporter's queue is only ever touched on the loop and needs
+no locking. Like the threaded exporter, events are queued per agent and
+each agent's batches go out as separate payloads.
+
+When the loop shuts down (asyncio.run() returning cancels the task), what
+is still queued is handed to the SDK's threaded exporter, and the exporter
+is forgotten, so repeated asyncio.run() calls neither strand events nor
+pile up exporters.
+"""
+
+import asyncio
+import logging
+import ssl
+import time
+import urllib.parse
+import weakref
+from typing import Optional
+
+from . import _codec
+from .sender import retryable_status
+
+logger = logging.getLogger("agentpulse.sdk")
+
+BATCH_SIZE = 50
+FLUSH_INTERVAL = 10.0
+SEND_TIMEOUT = 10.0
+MAX_PENDING = 10000  # events kept for retry while the API is unreachable
+MAX_REDIRECTS = 3
+
+_exporters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncExporter]" = weakref.WeakKeyDictionary()
+_ssl_context: Optional[ssl.SSLContext] = None
+# Counters of exporters whose loop has finished
+_retired = {"sent": 0, "dropped": 0, "exports": 0, "failures": 0, "export_ns": 0}
+
+
+def exporter_for(loop) -> "AsyncExporter":
+    """The exporter for loop, started on first use."""
+    exporter = _exporters.get(loop)
+    if exporter is None or exporter.closed:
+        exporter = _exporters[loop] = AsyncExporter()
+        exporter.start()
+    return exporter
+
+
+def current_exporter() -> Optional["AsyncExporter"]:
+    return _exporters.get(asyncio.get_running_loop())
+
+
+def stats() -> dict:
+    """Totals over every loop's exporter."""
+    totals = {
+        "pending": 0, "sent": _retired["sent"], "dropped": _retired["dropped"], "exports": _retired["exports"],
+        "failures": _retired["failures"], "export_ms": _retired["export_ns"] / 1e6,
+    }
+    for exporter in list(_exporters.values()):
+        totals["pending"] += exporter.pending()
+        totals["sent"] += exporter.sent
+        totals["dropped"] += exporter.dropped
+        totals["exports"] += exporter.exports
+        totals["failures"] += exporter.failures
+        totals["export_ms"] += exporter.export_ns / 1e6
+    return totals
+
+
+def take_stranded() -> list:
+    """(config, events) left on exporters whose loop is no longer running."""
+    stranded = []
+    for loop, exporter in list(_exporters.items()):
+        if not loop.is_running():
+            stranded.extend(exporter.take())
+    return stranded
+
+
+async def _get_ssl_context() -> ssl.SSLContext:
+    # Loading the CA bundle takes a few ms of disk I/O; keep it off the loop
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = await asyncio.get_running_loop().run_in_executor(None, ssl.create_default_context)
+    return _ssl_context
+
+
+async def _post(url: str, body: bytes) -> tuple:
+    """POST body to url over asyncio streams. Returns (status, location)."""
+    parts = urllib.parse.urlsplit(url)
+    secure = parts.scheme == "https"
+    port = parts.port or (443 if secure else 80)
+    context = await _get_ssl_context() if secure else None
+    reader, writer = await asyncio.open_connection(parts.hostname, port, ssl=context)
+    try:
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        head = (
+            f"POST {path} HTTP/1.1\r\n"
+            f"Host: {parts.netloc}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        status = int(status_line.split()[1])
+        location = None
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "location":
+                location = value.strip()
+        return status, location
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (OSError, ssl.SSLError):
+            pass
+
+
+class AsyncExporter:
+    """Batches events on an event loop and ships them from a background task."""
+
+    def __init__(self, batch_size: int = BATCH_SIZE, interval: float = FLUSH_INTERVAL,
+                 timeout: float = SEND_TIMEOUT):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.timeout = timeout
+        self.sent = 0
+        self.dropped = 0
+        self.exports = 0
+        self.failures = 0
+        self.export_ns = 0
+        self.closed = False
+        self._queues: dict[tuple, list] = {}  # agent -> [config, events]
+        self._wakeup = asyncio.Event()
+        self._send_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def add(self, config: dict, event: dict):
+        """Queue an event for config's agent. Never blocks; call from the loop thread."""
+        key = (config.get("endpoint"), config.get("api_key"), config.get("agent_name"), config.get("framework"))
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = [config, []]
+        queue[0] = config
+        queue[1].append(event)
+        if len(queue[1]) >= self.batch_size:
+            self._wakeup.set()
+
+    def pending(self) -> int:
+        return sum(len(events) for _, events in self._queues.values())
+
+    def take(self) -> list:
+        """Remove and return everything queued, as (config, events) per agent."""
+        queued, self._queues = self._queues, {}
+        return [(config, events) for config, events in queued.values() if events]
+
+    async def flush(self) -> bool:
+        """Send everything queued so far. Returns False if a batch failed."""
+        ok = True
+        async with self._send_lock:
+            for queue in list(self._queues.values()):
+                config, events = queue
+                while events:
+                    batch = events[:self.batch_size]
+                    del events[:self.batch_size]
+                    try:
+                        sent = await self._send(config, batch)
+                    except asyncio.CancelledError:
+                        events[:0] = batch
+                        raise
+                    if not sent:
+                        # Keep them for the next attempt, newest MAX_PENDING only
+                        events[:0] = batch
+                        overflow = len(events) - MAX_PENDING
+                        if overflow > 0:
+                            del events[:overflow]
+                            self.dropped += overflow
+                        ok = False
+                        break
+        return ok
+
+    async def aclose(self):
+        """Stop the background task and send what's left."""
+        self.closed = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task  # its last flush runs before the exporter is retired
+        else:
+            await self.flush()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while not self.closed:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                if not self.closed:
+                    await self.flush()
+            await self.flush()
+        except asyncio.CancelledError:
+            # The loop is going away; the threaded exporter outlives it
+            self.closed = True
+            from . import sdk
+            for config, events in self.take():
+                sdk._exporter.extend(config, events)
+            raise
+        finally:
+            self._task = None
+            if _exporters.get(loop) is self:
+                del _exporters[loop]
+            for name in _retired:
+                _retired[name] += getattr(self, name)
+
+    async def _send(self, config: dict, events: list) -> bool:
+        if not config.get("api_key"):
+            return True
+        started = time.perf_counter_ns()
+        try:
+            ok = await self._post(config, events)
+        finally:
+            self.exports += 1
+            self.export_ns += time.perf_counter_ns() - started
+        if not ok:
+            self.failures += 1
+        return ok
+
+    async def _post(self, config: dict, events: list) -> bool:
+        body = _codec.dumps({
+            "api_key": config["api_key"],
+            "agent_name": config["agent_name"],
+            "framework": config.get("framework", "python-sdk"),
+            "events": events,
+        })
+        url = config["endpoint"]
+        try:
+            for _ in range(MAX_REDIRECTS + 1):
+                status, location = await asyncio.wait_for(_post(url, body), self.timeout)
+                if status in (307, 308) and location:
+                    url = urllib.parse.urljoin(url, location)
+                    continue
+                break
+        except (OSError, ValueError, IndexError, asyncio.TimeoutError) as e:
+            logger.warning(f"AgentPulse: failed to send events: {e}")
+            return False
+        if not 200 <= status < 300:
+            if retryable_status(status):
+                logger.warning(f"AgentPulse: API returned {status}, will retry")
+                return False
+            # Rejected (bad key, bad payload): retrying won't help
+            self.failures += 1
+            self.dropped += len(events)
+            logger.warning(f"AgentPulse: API rejected {len(events)} events ({status}), dropping them")
+            return True
+        self.sent += len(events)
+        logger.debug(f"AgentPulse: sent {len(events)} events from event loop (total: {self.sent})")
+        return True
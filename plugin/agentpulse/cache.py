@@ -0,0 +1,250 @@
+"""Response cache for identical LLM requests going through the proxy.
+
+Requests are keyed by a canonical hash of (provider, path, normalized
+request JSON, accept-encoding, credentials). The credentials are part of the
+key so agents using different provider accounts never see each other's
+responses. Only deterministic requests are cached by default — temperature
+explicitly 0 and a single choice — because replaying a sampled completion
+would silently change agent behaviour.
+
+Two tiers:
+  memory  LRU bounded by entry count and total body bytes
+  disk    optional directory of one file per key, bounded by total bytes
+
+Both tiers expire entries after `ttl` seconds. Streaming responses are
+stored as the raw SSE bytes and replayed as-is.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from . import _codec, metrics
+
+logger = logging.getLogger("agentpulse.cache")
+
+# Request fields that don't change the model output
+_IGNORED_FIELDS = ("user", "metadata")
+
+# Response headers that must not be replayed from cache
+_SKIP_HEADERS = ("transfer-encoding", "connection", "keep-alive", "set-cookie", "date")
+
+
+def request_key(provider: str, path: str, request_json: dict, accept_encoding: str = "", scope: str = "") -> str:
+    """Canonical hash of a request: same inputs → same key, regardless of key order."""
+    normalized = {k: v for k, v in request_json.items() if k not in _IGNORED_FIELDS}
+    encoding = ",".join(sorted(e.strip().lower() for e in accept_encoding.split(",") if e.strip()))
+    blob = _codec.dumps([provider, path, normalized, encoding, scope], sort_keys=True)
+    return hashlib.sha256(blob).hexdigest()
+
+
+def auth_scope(headers) -> str:
+    """Short, non-reversible id for the credentials on a request."""
+    credential = headers.get("Authorization") or headers.get("x-api-key") or headers.get("x-goog-api-key") or ""
+    if not credential:
+        return ""
+    return hashlib.sha256(credential.encode("utf-8")).hexdigest()[:16]
+
+
+def is_deterministic(request_json: dict) -> bool:
+    """True if the request asks for a single greedy completion."""
+    if request_json.get("temperature") != 0:
+        return False
+    return request_json.get("n", 1) in (1, None)
+
+
+class CachedResponse:
+    __slots__ = ("status", "headers", "body", "model", "created")
+
+    def __init__(self, status: int, headers: list, body: bytes, model: str = "unknown", created: float = None):
+        self.status = status
+        self.headers = [(k, v) for k, v in headers if k.lower() not in _SKIP_HEADERS]
+        self.body = body
+        self.model = model
+        self.created = created if created is not None else time.time()
+
+    def to_bytes(self) -> bytes:
+        meta = {"status": self.status, "headers": self.headers, "model": self.model, "created": self.created}
+        return _codec.dumps(meta) + b"\n" + self.body
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CachedResponse":
+        header, _, body = data.partition(b"\n")
+        meta = _codec.loads(header)
+        return cls(meta["status"], [tuple(h) for h in meta["headers"]], body, meta["model"], meta["created"])
+
+
+class ResponseCache:
+    """Two-tier (memory LRU + disk) cache of upstream responses."""
+
+    def __init__(
+        self,
+        ttl: float = 86400,
+        max_entries: int = 1000,
+        max_bytes: int = 64 * 1024 * 1024,
+        disk_dir: Optional[str] = None,
+        disk_max_bytes: int = 512 * 1024 * 1024,
+        cache_nondeterministic: bool = False,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = os.path.expanduser(disk_dir) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        self.cache_nondeterministic = cache_nondeterministic
+
+        self._memory: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._stats: dict[str, list] = {}  # model -> [hits, misses]
+
+        self._disk_bytes = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+
+    def should_cache(self, request_json: dict) -> bool:
+        return self.cache_nondeterministic or is_deterministic(request_json)
+
+    # ── lookups ──
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry.created <= self.ttl:
+                    self._memory.move_to_end(key)
+                    return entry
+                self._remove_memory(key)
+
+        entry = self._disk_get(key, now)
+        if entry is not None:
+            with self._lock:
+                self._put_memory(key, entry)
+        return entry
+
+    def put(self, key: str, entry: CachedResponse):
+        with self._lock:
+            self._put_memory(key, entry)
+        if self.disk_dir:
+            self._disk_put(key, entry)
+
+    def record(self, model: str, hit: bool):
+        """Count a lookup for per-model hit ratios."""
+        counts = self._stats.get(model)
+        if counts is None:
+            counts = self._stats.setdefault(model, [0, 0])
+        counts[0 if hit else 1] += 1
+        metrics.PROXY_CACHE_LOOKUPS.labels(model, "hit" if hit else "miss").inc()
+
+    def stats(self) -> dict:
+        """Per-model {hits, misses, hit_ratio} plus tier sizes."""
+        models = {}
+        for model, (hits, misses) in list(self._stats.items()):
+            total = hits + misses
+            models[model] = {"hits": hits, "misses": misses, "hit_ratio": hits / total if total else 0.0}
+        return {
+            "models": models,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_bytes": self._disk_bytes,
+        }
+
+    # ── memory tier (caller holds the lock) ──
+
+    def _put_memory(self, key, entry):
+        if len(entry.body) > self.max_bytes:
+            return
+        if key in self._memory:
+            self._remove_memory(key)
+        self._memory[key] = entry
+        self._memory_bytes += len(entry.body)
+        while self._memory and (len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes):
+            self._remove_memory(next(iter(self._memory)))
+
+    def _remove_memory(self, key):
+        entry = self._memory.pop(key)
+        self._memory_bytes -= len(entry.body)
+
+    # ── disk tier ──
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key)
+
+    def _disk_get(self, key, now) -> Optional[CachedResponse]:
+        if not self.disk_dir:
+            return None
+        path = self._path(key)
+        try:
+            if now - os.path.getmtime(path) > self.ttl:
+                self._disk_remove(path)
+                return None
+            with open(path, "rb") as f:
+                return CachedResponse.from_bytes(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, KeyError, *_codec.DecodeError) as e:
+            logger.debug(f"Dropping unreadable cache entry {key}: {e}")
+            self._disk_remove(path)
+            return None
+
+    def _disk_put(self, key, entry):
+        path = self._path(key)
+        data = entry.to_bytes()
+        if len(data) > self.disk_max_bytes:
+            return
+        try:
+            replaced = os.path.getsize(path)  # a refresh of the same key
+        except OSError:
+            replaced = 0
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Could not write cache entry: {e}")
+            return
+        self._disk_bytes += len(data) - replaced
+        if self._disk_bytes > self.disk_max_bytes:
+            self._prune_disk()
+
+    def _disk_remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            self._disk_bytes -= size
+        except OSError:
+            pass
+
+    def _disk_files(self):
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def _prune_disk(self):
+        """Drop expired entries, then the oldest ones, until under 90% of the cap."""
+        files = sorted(self._disk_files(), key=lambda f: f[2])
+        total = sum(size for _, size, _ in files)
+        target = self.disk_max_bytes * 0.9
+        cutoff = time.time() - self.ttl
+        for path, size, mtime in files:
+            if total <= target and mtime >= cutoff:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._disk_bytes = total
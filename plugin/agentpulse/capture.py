@@ -0,0 +1,207 @@
+"""Capture policy for prompt and response bodies in SDK events.
+
+The SDK used to keep full message content, so an agent sending 100k-token
+contexts held a copy of each in the export buffer until the next flush.
+Bodies now go through a CapturePolicy as they are copied:
+
+- only text parts of structured content are kept (images, audio, tool
+  blocks are skipped)
+- each message (and the response text) is cut to max_message_bytes
+- prompt messages and response together get max_event_bytes, allocated to
+  the response first, then to prompt messages newest first
+
+Text over budget keeps its head and tail; the middle is replaced by a
+marker with its size and a hash, so identical removed spans can still be
+told apart (or matched) on the dashboard:
+
+    <head>…[48211 bytes removed, sha256:5f1c0e2a9b7d]…<tail>
+
+Budgets are in UTF-8 bytes and include the marker, so cut text is never
+longer than its budget (budgets under MARKER_BYTES leave only the marker).
+The event budget also counts each message's JSON framing. Once it runs
+out, all older messages are replaced by one message whose content gives
+their count and size, and they are neither copied nor hashed:
+
+    …[912 messages, 3811622 bytes removed]…
+"""
+
+MAX_MESSAGE_BYTES = 16384
+MAX_EVENT_BYTES = 65536
+MARKER_BYTES = 64  # room kept for the marker: 43 bytes plus up to 21 digits
+MESSAGE_FRAMING_BYTES = 30  # '{"role": "", "content": ""}, ' around each message, plus its role
+OMITTED_BYTES = MESSAGE_FRAMING_BYTES + 16 + MARKER_BYTES  # the message standing in for older ones
+
+_HASH_CHUNK = 65536  # chars encoded at a time while hashing a removed span
+
+
+def utf8_len(text: str) -> int:
+    if text.isascii():
+        return len(text)
+    return sum(
+        len(text[i:i + _HASH_CHUNK].encode("utf-8", "surrogatepass")) for i in range(0, len(text), _HASH_CHUNK)
+    )
+
+
+def _prefix(text: str, limit: int) -> str:
+    """Longest prefix of text that is at most limit bytes."""
+    head = text[:limit]
+    if head.isascii():
+        return head
+    return head.encode("utf-8", "surrogatepass")[:limit].decode("utf-8", "ignore")
+
+
+def _suffix(text: str, limit: int) -> str:
+    """Longest suffix of text that is at most limit bytes."""
+    if limit <= 0:
+        return ""
+    tail = text[-limit:]
+    if tail.isascii():
+        return tail
+    return tail.encode("utf-8", "surrogatepass")[-limit:].decode("utf-8", "ignore")
+
+
+def _marker(removed: int, hasher) -> str:
+    return f"…[{removed} bytes removed, sha256:{hasher.hexdigest()[:12]}]…"
+
+
+def _hash_span(hasher, text: str, start: int, end: int):
+    for i in range(start, end, _HASH_CHUNK):
+        hasher.update(text[i:min(i + _HASH_CHUNK, end)].encode("utf-8", "surrogatepass"))
+
+
+def _half(budget: int) -> int:
+    """Bytes of head (and of tail) kept of text over budget."""
+    return max(budget - MARKER_BYTES, 0) // 2
+
+
+def truncate(text: str, budget: int) -> str:
+    """text if it fits in budget bytes, else its head and tail around a marker."""
+    size = utf8_len(text)
+    if size <= budget:
+        return text
+    import hashlib
+
+    half = _half(budget)
+    head = _prefix(text, half)
+    tail = _suffix(text, half)
+    hasher = hashlib.sha256()
+    _hash_span(hasher, text, len(head), len(text) - len(tail))
+    return head + _marker(size - utf8_len(head) - utf8_len(tail), hasher) + tail
+
+
+class BoundedText:
+    """A text built up piece by piece (a streamed response) that never grows past budget.
+
+    Keeps the head and tail and hashes what falls out of the middle, so
+    render() gives the same result as truncate() on the whole text.
+    """
+
+    __slots__ = ("budget", "length", "_head", "_head_bytes", "_head_full", "_tail", "_removed", "_hasher")
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.length = 0  # chars fed, kept or not
+        self._head = ""
+        self._head_bytes = 0
+        self._head_full = False
+        self._tail = ""
+        self._removed = 0
+        self._hasher = None
+
+    def feed(self, text: str):
+        if not text:
+            return
+        self.length += len(text)
+        half = _half(self.budget)
+        if not self._head_full:
+            take = _prefix(text, half - self._head_bytes)
+            self._head += take
+            self._head_bytes += utf8_len(take)
+            if len(take) == len(text):
+                return
+            self._head_full = True
+            text = text[len(take):]
+        combined = self._tail + text
+        size = utf8_len(combined)
+        if self._removed == 0 and self._head_bytes + size <= self.budget:
+            self._tail = combined
+            return
+        keep = _suffix(combined, half)
+        if self._hasher is None:
+            import hashlib
+            self._hasher = hashlib.sha256()
+        _hash_span(self._hasher, combined, 0, len(combined) - len(keep))
+        self._removed += size - utf8_len(keep)
+        self._tail = keep
+
+    def kept(self) -> str:
+        """The head and tail, without the marker."""
+        return self._head + self._tail
+
+    def render(self) -> str:
+        if not self._removed:
+            return self._head + self._tail
+        return self._head + _marker(self._removed, self._hasher) + self._tail
+
+
+def content_text(content) -> str:
+    """The text of a message's content; non-text parts (images, tool blocks) are skipped."""
+    if isinstance(content, str):
+        return content
+    if content is None:
+        return ""
+    if isinstance(content, dict):
+        content = [content]
+    if isinstance(content, (list, tuple)):
+        return "\n".join(
+            part["text"] for part in content
+            if isinstance(part, dict) and part.get("type") == "text" and isinstance(part.get("text"), str)
+        )
+    return str(content)
+
+
+class CapturePolicy:
+    """Per-message and per-event byte budgets for captured bodies."""
+
+    def __init__(self, max_message_bytes: int = MAX_MESSAGE_BYTES, max_event_bytes: int = MAX_EVENT_BYTES):
+        self.max_message_bytes = max_message_bytes
+        self.max_event_bytes = max_event_bytes
+
+    def limited(self, max_message_bytes: int) -> "CapturePolicy":
+        """This policy with a tighter per-message budget."""
+        return CapturePolicy(min(self.max_message_bytes, max_message_bytes), self.max_event_bytes)
+
+    def text(self, text: str, budget: int = None) -> str:
+        """text cut to the per-message budget (or budget, if smaller)."""
+        limit = self.max_message_bytes if budget is None else min(budget, self.max_message_bytes)
+        return truncate(text, limit)
+
+    def messages(self, pairs, budget: int = None) -> list:
+        """[{"role", "content"}] from (role, content) pairs within budget bytes in total.
+
+        Newer messages are filled first, keeping room for one more message;
+        once the budget runs out, that message takes the role of the newest
+        one left out and stands in for all of them.
+        """
+        remaining = self.max_event_bytes if budget is None else budget
+        result = []
+        for index in range(len(pairs) - 1, -1, -1):
+            role, content = pairs[index]
+            text = content_text(content)
+            size = utf8_len(text)
+            framing = MESSAGE_FRAMING_BYTES + len(str(role))
+            room = min(self.max_message_bytes, remaining - framing - (OMITTED_BYTES if index else 0))
+            if size > room and room < MARKER_BYTES:
+                removed = size + sum(utf8_len(content_text(older)) for _, older in pairs[:index])
+                count = index + 1
+                noun = "message" if count == 1 else "messages"
+                result.append({"role": role, "content": f"…[{count} {noun}, {removed} bytes removed]…"})
+                break
+            text = truncate(text, room)
+            remaining -= framing + utf8_len(text)
+            result.append({"role": role, "content": text})
+        result.reverse()
+        return result
+
+
+DEFAULT_POLICY = CapturePolicy()
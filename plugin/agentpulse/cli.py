@@ -6,9 +6,11 @@ import argparse
 import shutil
 import subprocess
 import tempfile
+import time
 
 from .config import load_config, save_config, DEFAULT_CONFIG, DEFAULT_CONFIG_PATH, detect_openclaw_log_path
 from .daemon import AgentPulseDaemon
+from .sdk import _ENV_SETTINGS
 
 PID_FILE = "/tmp/agentpulse.pid"
 LOG_FILE = os.path.expanduser("~/.openclaw/agentpulse.log")
@@ -63,6 +65,7 @@ def cmd_run(args):
 
     Usage: agentpulse run python my_bot.py
            agentpulse run python -m my_module
+           agentpulse run --profile python my_bot.py
     """
     config = load_config()
     if not config.get("api_key"):
@@ -91,16 +94,30 @@ def cmd_run(args):
     # Tell the bootstrap where to find the agentpulse package
     env["_AGENTPULSE_PKG_PATH"] = pkg_parent
 
+    # Hand the settings down so children never read the YAML config
+    # (or scan /tmp for OpenClaw logs) on startup
+    env.update(_sdk_env(config))
+
     # Prepend bootstrap dir to PYTHONPATH so sitecustomize.py gets loaded
     existing = env.get("PYTHONPATH", "")
     env["PYTHONPATH"] = bootstrap_dir + (":" + existing if existing else "")
 
+    profile_dir = os.path.abspath(args.profile_dir) if getattr(args, "profile", False) else None
+    if profile_dir:
+        env["AGENTPULSE_PROFILE"] = profile_dir
+        env["AGENTPULSE_PROFILE_HZ"] = str(args.profile_hz)
+
     agent_name = config.get("agent_name", "default")
     print(f"🚀 AgentPulse: monitoring LLM calls for '{agent_name}'")
+    if profile_dir:
+        print(f"   Profiling at {args.profile_hz} Hz into {profile_dir}")
     print(f"   Running: {' '.join(args.cmd)}\n")
 
+    started = time.time()
     try:
         result = subprocess.run(args.cmd, env=env)
+        if profile_dir:
+            _print_profiles(profile_dir, started)
         sys.exit(result.returncode)
     except KeyboardInterrupt:
         sys.exit(130)
@@ -111,10 +128,35 @@ def cmd_run(args):
         shutil.rmtree(bootstrap_dir, ignore_errors=True)
 
 
+def _print_profiles(directory: str, since: float):
+    """Show the summaries the profiled processes wrote."""
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(directory, name)
+        if name.startswith("agentpulse-profile-") and name.endswith(".txt") and os.path.getmtime(path) >= since:
+            with open(path) as f:
+                print("\n" + f.read().rstrip())
+            print(f"   Flame graph input: {path[:-len('.txt')]}.folded")
+
+
+def _sdk_env(config) -> dict:
+    """AGENTPULSE_* variables the SDK reads instead of the config file."""
+    return {env_var: str(config[key]) for key, env_var in _ENV_SETTINGS.items() if config.get(key)}
+
+
+def _has_api_keys(config) -> bool:
+    """True if every watched agent ends up with an API key."""
+    watches = config.get("watches") or [{}]
+    return all(w.get("api_key") or config.get("api_key") for w in watches)
+
+
 def cmd_start(args):
     """Start the daemon (foreground or background)."""
     config = load_config()
-    if not config.get("api_key"):
+    if not _has_api_keys(config):
         print("❌ No API key configured.")
         print("   Run 'agentpulse init' to set up your API key.")
         print("   Don't have an account? Sign up at https://agentpulses.com/signup")
@@ -338,8 +380,13 @@ def cmd_status(args):
     print(f"   API Key: {'configured' if config.get('api_key') else 'NOT SET'}")
     print(f"   Endpoint: {config.get('endpoint', 'not set')}")
     print(f"   Log path: {config.get('log_path', 'not set')}")
+    for watch in config.get("watches") or []:
+        print(f"   Watch: {watch.get('agent_name', config.get('agent_name'))} "
+              f"→ {watch.get('log_path', config.get('log_path'))}")
     print(f"   Daemon log: {LOG_FILE}")
     print(f"   LLM Proxy: {'enabled (port {})'.format(proxy_port) if proxy_enabled else 'disabled'}")
+    if proxy_enabled and config.get("proxy_socket"):
+        print(f"   Proxy socket: {config['proxy_socket']}{'' if config.get('proxy_tcp', True) else ' (TCP off)'}")
     if proxy_enabled:
         print(f"\n🔌 Proxy active — ANTHROPIC_BASE_URL is configured in {_get_bashrc_path()}")
 
@@ -413,6 +460,17 @@ def _uninstall_proxy_env():
     return rc_path
 
 
+def _print_socket_client_config(path):
+    """Show how to point clients at the proxy's Unix socket."""
+    print(f"🔌 LLM proxy Unix socket: {path}")
+    print("   Python SDKs (httpx):")
+    print(f'     http_client = httpx.Client(transport=httpx.HTTPTransport(uds="{path}"))')
+    print('     OpenAI(base_url="http://localhost/openai/v1", http_client=http_client)')
+    print('     Anthropic(base_url="http://localhost/anthropic", http_client=http_client)')
+    print("   curl:")
+    print(f"     curl --unix-socket {path} http://localhost/openai/v1/models")
+
+
 def cmd_enable_proxy(args):
     """Enable or disable the LLM proxy for prompt capture."""
     config = load_config()
@@ -429,8 +487,21 @@ def cmd_enable_proxy(args):
     port = args.port or config.get("proxy_port", 8787)
     config["proxy_enabled"] = True
     config["proxy_port"] = port
+    if args.socket:
+        config["proxy_socket"] = os.path.abspath(os.path.expanduser(args.socket))
+    config["proxy_tcp"] = not args.no_tcp
+    if args.no_tcp and not config.get("proxy_socket"):
+        print("❌ --no-tcp needs a Unix socket (--socket PATH)")
+        sys.exit(1)
     save_config(config)
 
+    if config.get("proxy_socket"):
+        _print_socket_client_config(config["proxy_socket"])
+    if args.no_tcp:
+        _uninstall_proxy_env()
+        print(f"\n   Restart agentpulse to apply: agentpulse stop && agentpulse start -d")
+        return
+
     rc_path = _install_proxy_env(port)
 
     print(f"🔌 LLM proxy enabled on port {port}")
@@ -448,6 +519,13 @@ def main():
 
     subparsers.add_parser("init", help="Interactive setup")
     run_parser = subparsers.add_parser("run", help="Run a command with LLM monitoring")
+    run_parser.add_argument("--profile", action="store_true",
+                            help="Sample the process's stacks and write a profile split into time inside "
+                                 "and outside LLM calls")
+    run_parser.add_argument("--profile-dir", default=".", metavar="DIR",
+                            help="Where to write profiles (default: current directory)")
+    run_parser.add_argument("--profile-hz", type=int, default=100, metavar="HZ",
+                            help="Profiler sampling rate (default 100)")
     run_parser.add_argument("cmd", nargs=argparse.REMAINDER,
                             help="Command to run (e.g. python my_bot.py)")
     start_parser = subparsers.add_parser("start", help="Start the log-tail daemon (OpenClaw)")
@@ -460,6 +538,10 @@ def main():
                                           help="Enable LLM proxy for prompt/response capture")
     proxy_parser.add_argument("--port", type=int, default=None,
                                help="Proxy port (default: 8787)")
+    proxy_parser.add_argument("--socket", default=None, metavar="PATH",
+                               help="Also listen on a Unix domain socket at PATH")
+    proxy_parser.add_argument("--no-tcp", action="store_true",
+                               help="Only listen on the Unix socket, not on TCP")
     proxy_parser.add_argument("--disable", action="store_true",
                                help="Disable the proxy")
 
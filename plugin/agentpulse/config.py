@@ -41,9 +41,49 @@ DEFAULT_CONFIG = {
     "batch_interval": 30,
     "proxy_enabled": True,
     "proxy_port": 8787,
+    # Also (or, with proxy_tcp: false, only) listen on a Unix socket
+    "proxy_socket": "",
+    "proxy_socket_mode": "600",
+    "proxy_tcp": True,
+    # Turn every proxy capture straight into an event instead of waiting for
+    # a matching "prompt end" log line (log data then only enriches it)
+    "proxy_events": False,
+    # Replay identical temperature-0 requests from a local response cache
+    "proxy_cache": False,
+    "proxy_cache_ttl": 86400,
+    "proxy_cache_max_mb": 64,
+    "proxy_cache_dir": "",  # empty = memory only
+    "proxy_cache_disk_max_mb": 512,
+    # Share one upstream call between identical concurrent requests
+    "proxy_coalesce": False,
+    "proxy_coalesce_all": False,  # also coalesce sampled (temperature > 0) requests
+    # Per-provider concurrency / rpm / tpm limits, e.g. {"anthropic": {"concurrency": 8}}
+    "proxy_limits": {},
+    "proxy_queue_timeout": 60,
+    "proxy_queue_max": 1000,
+    # Alternate base URLs per provider, tried in order on errors / 5xx
+    "proxy_upstreams": {},
+    # Send a second copy of slow non-streaming requests
+    "proxy_hedge": False,
+    "proxy_hedge_delay_ms": 0,  # 0 = use the p95 of recent latencies
+    "proxy_hedge_percentile": 95,
+    # Background threads that parse captured calls off the request path
+    "proxy_capture_workers": 2,
+    "proxy_capture_queue": 1000,
+    # Proxy processes sharing proxy_port via SO_REUSEPORT (Linux/BSD)
+    "proxy_workers": 1,
+    "run_ttl": 3600,  # seconds before an idle run (no "run done" line) is dropped
+    "max_runs": 1000,
+    # Optional list of agents to watch from one daemon process. Each entry
+    # may set log_path, agent_name, api_key and model; anything it leaves
+    # out is taken from the top-level settings above.
+    "watches": [],
+    # Local Prometheus-style /metrics endpoint for the daemon and proxy
+    "metrics_enabled": False,
+    "metrics_port": 9464,
 }
 
-def load_config(path: str = DEFAULT_CONFIG_PATH) -> dict:
+def load_config(path: str = DEFAULT_CONFIG_PATH, detect_log_path: bool = True) -> dict:
     if os.path.exists(path):
         with open(path, "r") as f:
             config = yaml.safe_load(f) or {}
@@ -52,7 +92,7 @@ def load_config(path: str = DEFAULT_CONFIG_PATH) -> dict:
         merged = DEFAULT_CONFIG.copy()
 
     # Auto-detect log path if not explicitly configured
-    if not merged.get("log_path"):
+    if detect_log_path and not merged.get("log_path"):
         merged["log_path"] = detect_openclaw_log_path()
 
     return merged
@@ -2,39 +2,93 @@ import os
 import glob
 import time
 import logging
+from collections import deque
 from datetime import datetime
 
+from . import metrics
 from .config import load_config
 from .parser import parse_openclaw_line, estimate_cost
+from .runs import (
+    RunStateTable, DEFAULT_RUN_TTL, DEFAULT_MAX_RUNS,
+    parse_log_timestamp, start_tool, end_tool, close_segment, run_breakdown,
+)
 from .sender import EventSender
 
 logger = logging.getLogger("agentpulse")
 
+# Proxy-native events wait this long for their "prompt end" line before
+# being sent without log enrichment
+ENRICH_WINDOW = 30.0
+MAX_PENDING_ENRICH = 1000
+# How far outside a prompt's own span a proxy call may have ended and still
+# be matched to it by time
+MATCH_SLACK = 2.0
 
-class AgentPulseDaemon:
-    def __init__(self, config_path: str = None):
-        self.config = load_config(config_path) if config_path else load_config()
+
+class AgentWatch:
+    """One watched OpenClaw agent: its log directory, identity, sender and run state.
+
+    Per-watch settings (log_path, agent_name, api_key, model, ...) override
+    the top-level config, so a watch only needs to list what differs.
+    """
+
+    def __init__(self, watch: dict, defaults: dict):
+        cfg = {**defaults, **watch}
+        self.log_path = cfg.get("log_path") or defaults["log_path"]
+        self.agent_name = cfg["agent_name"]
+        self.api_key = cfg["api_key"]
+        # Default model for cost estimation (OpenClaw uses MiniMax by default)
+        self.default_model = cfg.get("model", "MiniMax-M2.5")
         self.sender = EventSender(
-            api_key=self.config["api_key"],
-            endpoint=self.config["endpoint"],
-            agent_name=self.config["agent_name"],
-            framework=self.config["framework"],
+            api_key=cfg["api_key"],
+            endpoint=cfg["endpoint"],
+            agent_name=cfg["agent_name"],
+            framework=cfg["framework"],
         )
-        self.running = False
         self.file_positions: dict[str, int] = {}
+        self.current_file: str | None = None
+        # Proxy-native (queued_at, event, run_hint), oldest first, waiting for their "prompt end" line
+        self.pending_enrich: deque = deque()
+        self._m_lines = metrics.LINES_TAILED.labels(self.agent_name)
 
         # Per-run state: collect tool calls, model info between prompt_end events
         # { run_id: { "tools": set(), "errors": [], "model": str, "provider": str } }
-        self._runs: dict[str, dict] = {}
+        self.runs = RunStateTable(
+            ttl=cfg.get("run_ttl", DEFAULT_RUN_TTL),
+            max_runs=cfg.get("max_runs", DEFAULT_MAX_RUNS),
+        )
 
-        # Default model for cost estimation (OpenClaw uses MiniMax by default)
-        self._default_model = self.config.get("model", "MiniMax-M2.5")
+
+class AgentPulseDaemon:
+    def __init__(self, config_path: str = None):
+        self.config = load_config(config_path) if config_path else load_config()
+        self.running = False
+
+        # One watch per agent. Without a `watches:` list the top-level
+        # config describes the single agent, as before.
+        self.watches = [
+            AgentWatch(watch, self.config)
+            for watch in (self.config.get("watches") or [{}])
+        ]
 
         # Proxy server (started if enabled in config)
         self._proxy = None
-
-    def get_latest_log_file(self) -> str | None:
-        log_path = self.config["log_path"]
+        self._metrics_server = None
+
+        # Proxy-native mode: the proxy emits complete events itself and log
+        # lines only enrich them. Events are routed to a watch by the agent
+        # the proxy attributed them to (unattributed ones go to the first).
+        self._proxy_events = bool(self.config.get("proxy_events"))
+        self._watch_by_agent = {watch.agent_name: watch for watch in self.watches}
+        self._warned_unattributed = False
+
+    @property
+    def sender(self) -> EventSender:
+        """Sender of the primary (first) watch."""
+        return self.watches[0].sender
+
+    def get_latest_log_file(self, watch: AgentWatch = None) -> str | None:
+        log_path = (watch or self.watches[0]).log_path
         today = datetime.now().strftime("%Y-%m-%d")
 
         today_file = os.path.join(log_path, f"openclaw-{today}.log")
@@ -46,38 +100,29 @@ class AgentPulseDaemon:
         files = sorted(glob.glob(pattern), reverse=True)
         return files[0] if files else None
 
-    def tail_file(self, filepath: str) -> list[str]:
+    def tail_file(self, filepath: str, watch: AgentWatch = None) -> list[str]:
         """Read new lines from file since last position."""
-        if filepath not in self.file_positions:
+        file_positions = (watch or self.watches[0]).file_positions
+        if filepath not in file_positions:
             # Start from end of file for existing files (don't re-parse old data)
             try:
-                self.file_positions[filepath] = os.path.getsize(filepath)
+                file_positions[filepath] = os.path.getsize(filepath)
                 logger.info(f"New file discovered, watching from end: {filepath}")
             except OSError:
-                self.file_positions[filepath] = 0
+                file_positions[filepath] = 0
                 logger.info(f"New file discovered, reading from start: {filepath}")
 
         try:
             with open(filepath, "r") as f:
-                f.seek(self.file_positions[filepath])
+                f.seek(file_positions[filepath])
                 new_lines = f.readlines()
-                self.file_positions[filepath] = f.tell()
+                file_positions[filepath] = f.tell()
+                (watch or self.watches[0])._m_lines.inc(len(new_lines))
                 return new_lines
         except Exception as e:
             logger.error(f"Error reading {filepath}: {e}")
             return []
 
-    def _get_run(self, run_id: str) -> dict:
-        """Get or create per-run tracking state."""
-        if run_id not in self._runs:
-            self._runs[run_id] = {
-                "tools": set(),
-                "errors": [],
-                "model": None,
-                "provider": None,
-            }
-        return self._runs[run_id]
-
     def _try_get_proxy_capture(self, retries=4, delay=0.3):
         """Try to get the most recent unclaimed proxy capture.
 
@@ -94,8 +139,10 @@ class AgentPulseDaemon:
                 time.sleep(delay)
         return None
 
-    def process_lines(self, lines: list[str]):
-        """Parse OpenClaw JSON log lines and emit events."""
+    def process_lines(self, lines: list[str], watch: AgentWatch = None):
+        """Parse OpenClaw JSON log lines and emit events for one watch."""
+        watch = watch or self.watches[0]
+        runs = watch.runs
         for raw_line in lines:
             parsed = parse_openclaw_line(raw_line)
             if not parsed:
@@ -105,38 +152,48 @@ class AgentPulseDaemon:
 
             # ── "run_start" = new LLM run, captures model/provider ──
             if event_type == "run_start":
-                run = self._get_run(parsed["run_id"])
+                run = runs.get(parsed["run_id"])
                 run["model"] = parsed["model"]
                 run["provider"] = parsed["provider"]
+                run["started_at"] = parse_log_timestamp(parsed["timestamp"])
                 continue
 
             # ── Collect tool calls per run ──
             if event_type == "tool_start":
-                run = self._get_run(parsed["run_id"])
+                run = runs.get(parsed["run_id"])
                 tool = parsed["tool"]
                 if tool != "message":  # skip message tool (just TG output)
                     run["tools"].add(tool)
+                start_tool(run, tool, parsed["tool_call_id"], parse_log_timestamp(parsed["timestamp"]))
                 continue
 
             if event_type == "tool_end":
-                continue  # nothing extra needed
+                run = runs.get(parsed["run_id"])
+                tool_ms = end_tool(run, parsed["tool_call_id"], parse_log_timestamp(parsed["timestamp"]))
+                if tool_ms is not None:
+                    logger.debug(f"Tool {parsed['tool']} took {tool_ms:.0f}ms (run {parsed['run_id']})")
+                continue
 
             # ── Collect tool errors ──
             if event_type == "tool_error":
                 # Attach to the most recent run if we can
-                if self._runs:
-                    last_run = list(self._runs.values())[-1]
+                last_run = runs.most_recent()
+                if last_run is not None:
                     last_run["errors"].append(f"{parsed['tool']}: {parsed['error']}")
                 continue
 
             # ── "prompt_end" = one LLM call completed ──
+            if event_type == "prompt_end" and self._proxy_events:
+                self._enrich_proxy_event(parsed, runs.get(parsed["run_id"]), watch)
+                continue
+
             if event_type == "prompt_end":
                 run_id = parsed["run_id"]
-                run = self._get_run(run_id)
+                run = runs.get(run_id)
                 duration_ms = parsed["duration_ms"]
 
                 # Use real model/provider from run_start, fall back to defaults
-                model = run.get("model") or self._default_model
+                model = run.get("model") or watch.default_model
                 provider = run.get("provider") or (
                     model.split("/")[0] if "/" in model else "minimax"
                 )
@@ -154,18 +211,31 @@ class AgentPulseDaemon:
                     if capture.get("model"):
                         model = capture["model"]
                 else:
-                    # Estimate tokens from duration (rough heuristic)
+                    # No proxy capture, so no text to count: estimate from duration (rough heuristic)
                     output_tokens = max(50, int(duration_ms / 1000 * 50))
                     input_tokens = max(100, output_tokens * 2)
                     prompt_messages = []
                     response_text = None
 
-                cost = estimate_cost(model, input_tokens, output_tokens)
+                if capture and (capture.get("cache_hit") or capture.get("coalesced")):
+                    # Served from the proxy cache or a shared in-flight call,
+                    # so this prompt didn't cost anything on its own
+                    cost = 0.0
+                    source = "cache" if capture.get("cache_hit") else "coalesced"
+                else:
+                    cost = estimate_cost(model, input_tokens, output_tokens)
+                    source = "proxy" if capture else "estimated"
+                    if capture and capture.get("tokens_estimated"):
+                        source = "proxy, tokens counted locally"
 
                 tools_list = sorted(run["tools"]) if run["tools"] else []
                 error_msg = "; ".join(run["errors"]) if run["errors"] else None
 
-                source = "proxy" if capture else "estimated"
+                metrics.CAPTURE_MATCHES.labels("matched" if capture else "unmatched").inc()
+
+                tool_timings, breakdown = close_segment(
+                    run, parse_log_timestamp(parsed["timestamp"]), duration_ms
+                )
 
                 event = {
                     "timestamp": parsed["timestamp"],
@@ -181,11 +251,21 @@ class AgentPulseDaemon:
                     "tools_used": tools_list,
                     "prompt_messages": prompt_messages,
                     "response_text": response_text,
+                    "tool_timings": tool_timings,
+                    "latency_breakdown": breakdown,
+                    "cache_hit": bool(capture and capture.get("cache_hit")),
+                    "coalesced": bool(capture and capture.get("coalesced")),
                 }
+                if not capture or capture.get("tokens_estimated"):
+                    event["tokens_estimated"] = True
+                if capture and capture.get("ratelimit"):
+                    event["ratelimit"] = capture["ratelimit"]
 
-                self.sender.add_event(event)
+                watch.sender.add_event(event)
                 logger.info(
                     f"LLM call: {provider}/{model} {duration_ms}ms "
+                    f"(llm {breakdown['llm_ms']}ms, tools {breakdown['tool_ms']}ms, "
+                    f"idle {breakdown['idle_ms']}ms) "
                     f"{input_tokens}in/{output_tokens}out "
                     f"${cost:.4f} tools={tools_list} [{source}]"
                 )
@@ -199,7 +279,14 @@ class AgentPulseDaemon:
             if event_type == "run_done":
                 run_id = parsed["run_id"]
                 # Clean up run state
-                self._runs.pop(run_id, None)
+                run = runs.pop(run_id)
+                if run is not None and run["prompt_count"]:
+                    summary = run_breakdown(run, parsed["duration_ms"])
+                    logger.info(
+                        f"Run {run_id} done in {summary['wall_ms']}ms: "
+                        f"llm {summary['llm_ms']}ms, tools {summary['tool_ms']}ms, "
+                        f"idle {summary['idle_ms']}ms over {summary['prompts']} prompt(s)"
+                    )
                 continue
 
             # ── Usage data (if gateway ever logs it) ──
@@ -207,7 +294,7 @@ class AgentPulseDaemon:
                 # Exact token data — emit directly
                 input_t = parsed.get("input_tokens", 0)
                 output_t = parsed.get("output_tokens", 0)
-                model = parsed.get("model", self._default_model)
+                model = parsed.get("model", watch.default_model)
                 cost = estimate_cost(model, input_t, output_t)
 
                 event = {
@@ -226,7 +313,7 @@ class AgentPulseDaemon:
                     "response_text": None,
                 }
 
-                self.sender.add_event(event)
+                watch.sender.add_event(event)
                 logger.info(f"Exact usage: {model} {input_t}in/{output_t}out ${cost:.4f}")
                 continue
 
@@ -235,7 +322,7 @@ class AgentPulseDaemon:
                 event = {
                     "timestamp": parsed["timestamp"],
                     "provider": "openclaw",
-                    "model": self._default_model,
+                    "model": watch.default_model,
                     "input_tokens": 0,
                     "output_tokens": 0,
                     "cost_usd": 0,
@@ -248,10 +335,115 @@ class AgentPulseDaemon:
                     "response_text": None,
                 }
 
-                self.sender.add_event(event)
+                watch.sender.add_event(event)
                 logger.info(f"Error event: {parsed.get('message', '')[:80]}")
                 continue
 
+    def _watch_for(self, agent: str | None) -> AgentWatch:
+        """The watch a proxy event attributed to agent belongs to."""
+        watch = self._watch_by_agent.get(agent) if agent else None
+        if watch is not None:
+            return watch
+        if len(self.watches) > 1 and not self._warned_unattributed:
+            self._warned_unattributed = True
+            logger.warning(
+                f"Proxy event {'for unknown agent ' + repr(agent) if agent else 'without an agent'} "
+                f"reported under {self.watches[0].agent_name}; point each agent at "
+                f"http://127.0.0.1:<port>/agent/<agent_name>/<provider>"
+            )
+        return self.watches[0]
+
+    def _drain_proxy_events(self):
+        """Queue events emitted by the proxy on their watch, to wait for enrichment."""
+        if not self._proxy:
+            return
+        now = time.monotonic()
+        for event in self._proxy.drain_events():
+            watch = self._watch_for(event.pop("agent", None))
+            watch.pending_enrich.append((now, event, event.pop("run_hint", None)))
+            if len(watch.pending_enrich) > MAX_PENDING_ENRICH:
+                watch.sender.add_event(watch.pending_enrich.popleft()[1])
+            logger.info(
+                f"LLM call: {event['provider']}/{event['model']} {event['latency_ms']}ms "
+                f"{event['input_tokens']}in/{event['output_tokens']}out "
+                f"${event['cost_usd']:.4f} [{event['status']}] [proxy, {watch.agent_name}]"
+            )
+
+    def _release_pending(self, watch: AgentWatch, max_age: float = ENRICH_WINDOW):
+        """Send proxy events that waited max_age seconds without a "prompt end" line."""
+        cutoff = time.monotonic() - max_age
+        pending = watch.pending_enrich
+        while pending and pending[0][0] <= cutoff:
+            watch.sender.add_event(pending.popleft()[1])
+
+    @staticmethod
+    def _take_pending(watch: AgentWatch, parsed: dict) -> tuple:
+        """Remove and return the waiting proxy event a "prompt end" line belongs to.
+
+        Returns (result, event): event is None unless result is "matched".
+        An event the client tagged with its run (or session) only matches
+        that run, oldest first. Untagged events match a prompt when exactly
+        one of them ended during it; if several did, which is which can't
+        be told, so none is taken.
+        """
+        pending = watch.pending_enrich
+        run_id, session_id = parsed["run_id"], parsed.get("session_id")
+        for index, (_, event, hint) in enumerate(pending):
+            if hint and (hint["run_id"] == run_id if hint.get("run_id") else hint.get("session_id") == session_id):
+                del pending[index]
+                return "matched", event
+
+        ended = parse_log_timestamp(parsed["timestamp"])
+        began = ended - parsed["duration_ms"] / 1000 if ended is not None else None
+        candidates = []
+        for index, (_, event, hint) in enumerate(pending):
+            if hint:
+                continue
+            at = parse_log_timestamp(event.get("timestamp"))
+            if at is None or began is None or began - MATCH_SLACK <= at <= ended + MATCH_SLACK:
+                candidates.append(index)
+        if not candidates:
+            return "unmatched", None
+        if len(candidates) > 1:
+            return "ambiguous", None
+        event = pending[candidates[0]][1]
+        del pending[candidates[0]]
+        return "matched", event
+
+    def _enrich_proxy_event(self, parsed: dict, run: dict, watch: AgentWatch = None):
+        """Attach log-derived run context to the proxy event for this prompt, then send it.
+
+        Events wait in pending_enrich for up to ENRICH_WINDOW seconds, so
+        enrichment happens before the sender sees them. Nothing is sent if no
+        proxy event matches (e.g. the call bypassed the proxy); an ambiguous
+        match is left to be sent unenriched.
+        """
+        watch = watch or self.watches[0]
+        tools_list = sorted(run["tools"]) if run["tools"] else []
+        errors = list(run["errors"])
+        tool_timings, breakdown = close_segment(
+            run, parse_log_timestamp(parsed["timestamp"]), parsed["duration_ms"]
+        )
+        run["tools"] = set()
+        run["errors"] = []
+
+        self._release_pending(watch)
+        result, event = self._take_pending(watch, parsed)
+        metrics.CAPTURE_MATCHES.labels(result).inc()
+        if event is None:
+            if result == "ambiguous":
+                logger.debug(f"Several proxy calls match prompt of run {parsed['run_id']}; not enriching")
+            return
+
+        event["task_context"] = f"session:{parsed.get('session_id', 'unknown')}"
+        event["tools_used"] = tools_list
+        event["tool_timings"] = tool_timings
+        event["latency_breakdown"] = breakdown
+        if errors and event["status"] == "success":
+            event["status"] = "error"
+            event["error_message"] = "; ".join(errors)
+        watch.sender.add_event(event)
+
     def _start_proxy(self):
         """Start the LLM proxy if enabled in config."""
         if not self.config.get("proxy_enabled"):
@@ -259,9 +451,12 @@ class AgentPulseDaemon:
 
         try:
             from .proxy import LLMProxyServer
-            port = self.config.get("proxy_port", 8787)
-            self._proxy = LLMProxyServer(port=port)
+            self._proxy = LLMProxyServer.from_config(self.config)
             self._proxy.start()
+            if not self._proxy.tcp:
+                # Unix socket only: clients are configured explicitly
+                return
+            port = self._proxy.port
 
             # Auto-set env vars so child processes route through the proxy
             env_map = {
@@ -309,10 +504,79 @@ class AgentPulseDaemon:
             self._proxy.stop()
             self._proxy = None
 
+    def poll_once(self, batch_interval: int = 30):
+        """Tail every watched log directory once and flush due batches."""
+        if self._proxy_events:
+            self._drain_proxy_events()
+
+        for watch in self.watches:
+            log_file = self.get_latest_log_file(watch)
+            watch.current_file = log_file
+            if log_file:
+                new_lines = self.tail_file(log_file, watch)
+                if new_lines:
+                    self.process_lines(new_lines, watch)
+
+            watch.runs.expire()
+            self._release_pending(watch)
+
+            if watch.sender.should_flush(batch_interval):
+                watch.sender.flush()
+
+    def _collect_metrics(self):
+        """Refresh scrape-time gauges (tail lag, buffer depth, run table)."""
+        now = time.time()
+        for watch in self.watches:
+            agent = watch.agent_name
+            lag_bytes, lag_seconds = 0, 0.0
+            if watch.current_file:
+                try:
+                    st = os.stat(watch.current_file)
+                    lag_bytes = max(0, st.st_size - watch.file_positions.get(watch.current_file, 0))
+                    if lag_bytes:
+                        lag_seconds = max(0.0, now - st.st_mtime)
+                except OSError:
+                    pass
+            metrics.TAIL_LAG_BYTES.labels(agent).set(lag_bytes)
+            metrics.TAIL_LAG_SECONDS.labels(agent).set(lag_seconds)
+            metrics.BUFFER_EVENTS.labels(agent).set(len(watch.sender.buffer))
+            stats = watch.runs.stats()
+            metrics.RUNS_ACTIVE.labels(agent).set(stats["active"])
+            metrics.RUNS_EVICTED.labels(agent, "ttl").set(stats["evicted_ttl"])
+            metrics.RUNS_EVICTED.labels(agent, "size").set(stats["evicted_size"])
+            metrics.RUNS_EVICTED.labels(agent, "orphaned").set(stats["orphaned"])
+
+    def _start_metrics(self):
+        """Start the local /metrics endpoint if enabled in config."""
+        if not self.config.get("metrics_enabled"):
+            return
+        try:
+            self._metrics_server = metrics.MetricsServer(port=self.config.get("metrics_port", 9464))
+            self._metrics_server.start()
+            metrics.add_collect_hook(self._collect_metrics)
+        except Exception as e:
+            logger.error(f"Failed to start metrics endpoint: {e}")
+            self._metrics_server = None
+
+    def _stop_metrics(self):
+        if self._metrics_server:
+            metrics.remove_collect_hook(self._collect_metrics)
+            self._metrics_server.stop()
+            self._metrics_server = None
+
+    def flush_all(self):
+        for watch in self.watches:
+            self._release_pending(watch, max_age=0)
+            watch.sender.flush()
+
     def run(self):
         """Main daemon loop."""
-        if not self.config.get("api_key"):
-            logger.error("No API key configured. Run 'agentpulse init' first.")
+        missing = [w.agent_name for w in self.watches if not w.api_key]
+        if missing:
+            logger.error(
+                f"No API key configured for: {', '.join(missing)}. "
+                f"Run 'agentpulse init' first."
+            )
             return
 
         self.running = True
@@ -320,33 +584,28 @@ class AgentPulseDaemon:
         batch_interval = self.config.get("batch_interval", 30)
 
         logger.info(f"AgentPulse daemon started")
-        logger.info(f"Watching: {self.config['log_path']}")
-        logger.info(f"Agent: {self.config['agent_name']} ({self.config['framework']})")
-        logger.info(f"Default model: {self._default_model}")
+        for watch in self.watches:
+            logger.info(f"Watching: {watch.log_path}")
+            logger.info(f"Agent: {watch.agent_name} ({self.config['framework']})")
+            logger.info(f"Default model: {watch.default_model}")
         logger.info(f"Endpoint: {self.config['endpoint']}")
         logger.info(f"Poll interval: {poll_interval}s, Batch interval: {batch_interval}s")
 
-        # Start proxy if enabled
+        # Start proxy and metrics endpoint if enabled
         self._start_proxy()
+        self._start_metrics()
 
         while self.running:
             try:
-                log_file = self.get_latest_log_file()
-                if log_file:
-                    new_lines = self.tail_file(log_file)
-                    if new_lines:
-                        self.process_lines(new_lines)
-
-                if self.sender.should_flush(batch_interval):
-                    self.sender.flush()
-
+                self.poll_once(batch_interval)
                 time.sleep(poll_interval)
 
             except KeyboardInterrupt:
                 logger.info("Shutting down...")
                 self.running = False
                 self._stop_proxy()
-                self.sender.flush()
+                self._stop_metrics()
+                self.flush_all()
                 break
             except Exception as e:
                 logger.error(f"Daemon error: {e}", exc_info=True)
@@ -355,4 +614,5 @@ class AgentPulseDaemon:
     def stop(self):
         self.running = False
         self._stop_proxy()
-        self.sender.flush()
+        self._stop_metrics()
+        self.flush_all()
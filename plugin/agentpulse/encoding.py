@@ -0,0 +1,158 @@
+"""Content-Encoding support for proxy captures.
+
+The proxy relays compressed responses to the client untouched and decodes
+a copy for capture in the worker pool. Decoding is incremental with a cap
+on the output size, so a small malicious or corrupt body can't blow up
+memory in the capture workers.
+
+gzip and deflate use zlib. br needs the optional `brotli` package at 1.1
+or later, whose decoder can bound each step's output (output_buffer_limit).
+A brotli decoder without that limit (brotlicffi, older brotli) can expand a
+few KB into gigabytes in one call, so it's treated like no brotli at all:
+br is removed from the Accept-Encoding the proxy sends upstream, and we
+never receive a body we can't read safely.
+"""
+
+import zlib
+
+try:
+    import brotli as _brotli
+except ImportError:
+    try:
+        import brotlicffi as _brotli
+    except ImportError:
+        _brotli = None
+
+MAX_DECODED_BYTES = 32 * 1024 * 1024
+_CHUNK = 64 * 1024
+
+_brotli_checked = (None, False)  # (module, whether its decoder bounds output)
+
+
+class DecodeError(ValueError):
+    """The body couldn't be decoded with its declared Content-Encoding."""
+
+
+def _brotli_bounded() -> bool:
+    """Whether the installed brotli decoder takes output_buffer_limit."""
+    global _brotli_checked
+    module, bounded = _brotli_checked
+    if module is not _brotli:
+        bounded = False
+        if _brotli is not None:
+            try:
+                _brotli.Decompressor().process(b"", output_buffer_limit=1)
+                bounded = True
+            except TypeError:
+                pass
+        _brotli_checked = (_brotli, bounded)
+    return bounded
+
+
+def supported_encodings() -> tuple:
+    encodings = ("gzip", "x-gzip", "deflate", "identity")
+    if _brotli_bounded():
+        encodings += ("br",)
+    return encodings
+
+
+def filter_accept_encoding(value: str) -> str:
+    """Drop codings we can't decode from a client's Accept-Encoding header."""
+    if not value:
+        return value
+    supported = supported_encodings()
+    kept = [part.strip() for part in value.split(",") if part.split(";", 1)[0].strip().lower() in supported]
+    return ", ".join(kept) if kept else "identity"
+
+
+def header_value(headers, name: str) -> str:
+    """Case-insensitive lookup in a list of (name, value) pairs."""
+    name = name.lower()
+    for key, value in headers or ():
+        if key.lower() == name:
+            return value
+    return ""
+
+
+class _ZlibDecoder:
+    def __init__(self, encoding):
+        # gzip: 16 + MAX_WBITS; deflate is zlib-wrapped in practice but some
+        # servers send raw deflate, which we detect on the first chunk
+        self._wbits = 16 + zlib.MAX_WBITS if encoding in ("gzip", "x-gzip") else zlib.MAX_WBITS
+        self._obj = zlib.decompressobj(self._wbits)
+        self._started = False
+
+    chunk = _CHUNK
+
+    def decompress(self, data, max_length):
+        try:
+            out = self._obj.decompress(data, max_length)
+        except zlib.error:
+            if self._started or self._wbits != zlib.MAX_WBITS:
+                raise
+            self._obj = zlib.decompressobj(-zlib.MAX_WBITS)
+            out = self._obj.decompress(data, max_length)
+        self._started = True
+        return out
+
+    def next_input(self):
+        """Input to pass to the next decompress() call, or None when it wants new data."""
+        return self._obj.unconsumed_tail or None
+
+
+class _BrotliDecoder:
+    def __init__(self):
+        self._obj = _brotli.Decompressor()
+
+    chunk = _CHUNK
+
+    def decompress(self, data, max_length):
+        return self._obj.process(data, output_buffer_limit=max_length)
+
+    def next_input(self):
+        # The decoder keeps the input it hasn't used; it's drained with empty calls
+        if not self._obj.can_accept_more_data():
+            return b""
+        return None
+
+
+def _decoder(encoding):
+    if encoding in ("gzip", "x-gzip", "deflate"):
+        return _ZlibDecoder(encoding)
+    if encoding == "br" and _brotli_bounded():
+        return _BrotliDecoder()
+    raise DecodeError(f"unsupported content-encoding: {encoding}")
+
+
+def _decode_one(body: bytes, encoding: str, max_size: int) -> bytes:
+    decoder = _decoder(encoding)
+    out = bytearray()
+    view = memoryview(body)
+    chunk = decoder.chunk
+    try:
+        for start in range(0, len(body), chunk):
+            data = view[start:start + chunk]
+            while data is not None:
+                out += decoder.decompress(data, max_size - len(out) + 1)
+                if len(out) > max_size:
+                    raise DecodeError(f"decoded body exceeds {max_size} bytes")
+                data = decoder.next_input()
+    except (zlib.error, OSError) as e:
+        raise DecodeError(str(e)) from e
+    except Exception as e:
+        if _brotli is not None and isinstance(e, getattr(_brotli, "error", ())):
+            raise DecodeError(str(e)) from e
+        raise
+    return bytes(out)
+
+
+def decode_body(body: bytes, content_encoding: str, max_size: int = MAX_DECODED_BYTES) -> bytes:
+    """Undo a Content-Encoding (which may list several codings, applied in order)."""
+    if not body or not content_encoding:
+        return body
+    codings = [c.strip().lower() for c in content_encoding.split(",") if c.strip()]
+    for encoding in reversed(codings):
+        if encoding == "identity":
+            continue
+        body = _decode_one(body, encoding, max_size)
+    return body
@@ -0,0 +1,144 @@
+"""Event-loop lag and thread scheduling delay around instrumented calls.
+
+Optional, enabled with init(lag_probe_interval=0.1). Two low-frequency
+probes run while it is on:
+
+- on each event loop that makes an instrumented call, a callback scheduled
+  every interval; how late it runs is loop lag (other callbacks held the
+  loop)
+- one daemon thread waking every interval; how late it wakes is scheduling
+  delay (GIL contention or CPU starvation)
+
+Each probe keeps a running total of the lag it has seen. Calls take a
+mark() when they start and since() at the end, so an event gets the lag
+that accrued while it was in flight. Concurrent calls on one loop all see
+the same lag, since it delayed each of them.
+"""
+
+import asyncio
+import threading
+import time
+import weakref
+
+DEFAULT_INTERVAL = 0.1  # seconds between probes
+NOISE_NS = 1_000_000  # lateness under 1ms is timer slack, not lag
+
+_perf_counter_ns = time.perf_counter_ns
+
+
+class _LoopProbe:
+    """A callback rescheduled on one loop every interval, totalling how late it ran."""
+
+    __slots__ = ("_loop", "_monitor", "_interval", "_due", "_stopped", "lag_ns")
+
+    def __init__(self, loop, monitor: "LagMonitor"):
+        self._loop = weakref.ref(loop)
+        self._monitor = monitor
+        self._interval = monitor.interval
+        self._stopped = False
+        self.lag_ns = 0
+        self._schedule(loop)
+
+    def _schedule(self, loop):
+        self._due = _perf_counter_ns() + int(self._interval * 1e9)
+        loop.call_later(self._interval, self._tick)
+
+    def _tick(self):
+        late = _perf_counter_ns() - self._due
+        if late > NOISE_NS:
+            self.lag_ns += late
+            self._monitor.add_loop_lag(late)
+        loop = self._loop()
+        if loop is not None and not self._stopped:
+            self._schedule(loop)
+
+    def stop(self):
+        # Called from any thread: the pending callback just doesn't reschedule
+        self._stopped = True
+
+
+class _ThreadProbe:
+    """A daemon thread waking every interval, totalling how late it woke."""
+
+    def __init__(self, interval: float):
+        self._interval = interval
+        self._stop = threading.Event()
+        self.delay_ns = 0
+        self.max_delay_ns = 0
+        self._thread = threading.Thread(target=self._run, daemon=True, name="agentpulse-lag")
+        self._thread.start()
+
+    def _run(self):
+        interval_ns = int(self._interval * 1e9)
+        while True:
+            began = _perf_counter_ns()
+            if self._stop.wait(self._interval):
+                return
+            late = _perf_counter_ns() - began - interval_ns
+            if late > NOISE_NS:
+                self.delay_ns += late
+                if late > self.max_delay_ns:
+                    self.max_delay_ns = late
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=1)
+
+
+class LagMonitor:
+    """Loop and thread probes, and the lag each instrumented call was in flight for."""
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL):
+        self.interval = interval
+        # Over every loop probed, including loops since closed
+        self.loop_lag_ns = 0
+        self.max_loop_lag_ns = 0
+        self._loops: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopProbe]" = weakref.WeakKeyDictionary()
+        self._thread = _ThreadProbe(interval)
+
+    def _probe_for(self, loop) -> _LoopProbe:
+        probe = self._loops.get(loop)
+        if probe is None:
+            probe = self._loops[loop] = _LoopProbe(loop, self)
+        return probe
+
+    def add_loop_lag(self, late_ns: int):
+        self.loop_lag_ns += late_ns
+        if late_ns > self.max_loop_lag_ns:
+            self.max_loop_lag_ns = late_ns
+
+    def mark(self) -> tuple:
+        """Lag totals so far, taken when a call starts (probing its loop from then on)."""
+        try:
+            probe = self._probe_for(asyncio.get_running_loop())
+        except RuntimeError:
+            probe = None
+        return probe, probe.lag_ns if probe is not None else 0, self._thread.delay_ns
+
+    def since(self, mark: tuple, called_ns: int = None, sent_ns: int = None) -> dict:
+        """Latency components of a call that took mark at called_ns and was sent at sent_ns.
+
+        queued_before_send_ms  create() called -> request handed to httpx
+        loop_lag_ms            loop lag while in flight (None off any loop)
+        thread_delay_ms        thread scheduling delay while in flight
+        """
+        probe, loop_lag_ns, thread_delay_ns = mark
+        return {
+            "queued_before_send_ms": round((sent_ns - called_ns) / 1e6, 2) if sent_ns and called_ns else None,
+            "loop_lag_ms": round((probe.lag_ns - loop_lag_ns) / 1e6, 2) if probe is not None else None,
+            "thread_delay_ms": round((self._thread.delay_ns - thread_delay_ns) / 1e6, 2),
+        }
+
+    def snapshot(self) -> dict:
+        return {
+            "loop_lag_ms": self.loop_lag_ns / 1e6,
+            "max_loop_lag_ms": self.max_loop_lag_ns / 1e6,
+            "thread_delay_ms": self._thread.delay_ns / 1e6,
+            "max_thread_delay_ms": self._thread.max_delay_ns / 1e6,
+        }
+
+    def stop(self):
+        self._thread.stop()
+        for probe in list(self._loops.values()):
+            probe.stop()
+        self._loops.clear()
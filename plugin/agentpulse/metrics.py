@@ -0,0 +1,374 @@
+"""Self-metrics for the daemon and proxy, served in Prometheus text format.
+
+Hot paths only ever touch per-thread cells: each thread increments its own
+slot in a dict keyed by its Thread object, so there is no lock and no lost
+update. Values are summed when /metrics is scraped; cells of threads that
+have exited (the proxy serves each request on a new thread) are folded into
+one cell at that point, so the dicts only grow with the live thread count.
+Keying on the Thread rather than its id means a new thread that reuses an
+exited thread's id never shares (or loses) its cell. Label children are
+created once (under a lock) and should be cached by the caller, e.g.:
+
+    self._m_lines = metrics.LINES_TAILED.labels(agent_name)
+    ...
+    self._m_lines.inc(len(lines))
+
+Gauges that are cheap to compute on demand (buffer depth, tail lag) are
+filled in by collect hooks right before rendering instead of being updated
+on every change.
+"""
+
+import bisect
+import logging
+import threading
+
+logger = logging.getLogger("agentpulse.metrics")
+
+_current_thread = threading.current_thread
+_fold_lock = threading.Lock()
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+REGISTRY: list = []
+_collect_hooks: list = []
+
+
+def _fold_dead(cells: dict, folded: list):
+    """Add the cells of exited threads into folded and drop them. Call under _fold_lock."""
+    threads = list(cells)
+    # Taken after listing the cells, so every thread listed had started: not live means exited
+    live = set(threading.enumerate())
+    for thread in threads:
+        if thread not in live:
+            for i, value in enumerate(cells.pop(thread)):
+                folded[i] += value
+
+
+class _CounterChild:
+    __slots__ = ("_cells", "_folded")
+
+    def __init__(self):
+        self._cells = {}
+        self._folded = [0]
+
+    def inc(self, amount=1):
+        try:
+            self._cells[_current_thread()][0] += amount
+        except KeyError:
+            self._cells[_current_thread()] = [amount]
+
+    def get(self):
+        with _fold_lock:
+            _fold_dead(self._cells, self._folded)
+            return self._folded[0] + sum(cell[0] for cell in list(self._cells.values()))
+
+    def merge(self, amount):
+        """Add an amount counted elsewhere (a proxy worker process)."""
+        with _fold_lock:
+            self._folded[0] += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ("_base",)
+
+    def __init__(self):
+        super().__init__()
+        self._base = 0
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        self._base = value - super().get()
+
+    def get(self):
+        return self._base + super().get()
+
+
+class _HistogramChild:
+    __slots__ = ("_bounds", "_cells", "_folded")
+
+    def __init__(self, bounds):
+        self._bounds = bounds
+        self._cells = {}
+        self._folded = [0] * (len(bounds) + 1) + [0.0]
+
+    def observe(self, value):
+        cell = self._cells.get(_current_thread())
+        if cell is None:
+            # [bucket counts..., +Inf count, sum]
+            cell = self._cells[_current_thread()] = [0] * (len(self._bounds) + 1) + [0.0]
+        cell[bisect.bisect_left(self._bounds, value)] += 1
+        cell[-1] += value
+
+    def get(self):
+        with _fold_lock:
+            _fold_dead(self._cells, self._folded)
+            totals = list(self._folded)
+            for cell in list(self._cells.values()):
+                for i, v in enumerate(cell):
+                    totals[i] += v
+        return totals
+
+    def merge(self, totals):
+        """Add bucket counts and sum (as from get()) observed elsewhere."""
+        with _fold_lock:
+            for i, v in enumerate(totals):
+                self._folded[i] += v
+
+
+class _Metric:
+    kind = ""
+    child_class = None
+
+    def __init__(self, name: str, help: str, labelnames=(), register=True):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+        if register:
+            REGISTRY.append(self)
+
+    def _new_child(self):
+        return self.child_class()
+
+    def labels(self, *values):
+        """Return the child for these label values (cache it on hot paths)."""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def remove(self, *values):
+        self._children.pop(tuple(str(v) for v in values), None)
+
+    def _samples(self):
+        for key, child in list(self._children.items()):
+            yield self._label_str(key), child.get()
+
+    def _label_str(self, key, extra=""):
+        parts = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self._samples():
+            lines.append(f"{self.name}{labels} {_fmt(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+    child_class = _CounterChild
+
+    def inc(self, amount=1):
+        self._children[()].inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+    child_class = _GaugeChild
+
+    def inc(self, amount=1):
+        self._children[()].inc(amount)
+
+    def dec(self, amount=1):
+        self._children[()].dec(amount)
+
+    def set(self, value):
+        self._children[()].set(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS, register=True):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, register)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._children[()].observe(value)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in list(self._children.items()):
+            totals = child.get()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), totals[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _fmt(bound)
+                labels = self._label_str(key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_str(key)} {_fmt(totals[-1])}")
+            lines.append(f"{self.name}_count{self._label_str(key)} {cumulative}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt(value) -> str:
+    if isinstance(value, float):
+        if value == int(value) and abs(value) < 1e15:
+            return str(int(value))
+        return repr(value)
+    return str(value)
+
+
+def add_collect_hook(fn):
+    """Register fn() to refresh gauges right before each scrape."""
+    _collect_hooks.append(fn)
+
+
+def remove_collect_hook(fn):
+    try:
+        _collect_hooks.remove(fn)
+    except ValueError:
+        pass
+
+
+def render() -> str:
+    """Render every registered metric in Prometheus text format."""
+    for hook in list(_collect_hooks):
+        try:
+            hook()
+        except Exception as e:
+            logger.debug(f"Metrics collect hook failed: {e}")
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ─── Daemon ───
+
+LINES_TAILED = Counter("agentpulse_lines_tailed_total", "Log lines read by the daemon", ["agent"])
+PARSE_ERRORS = Counter("agentpulse_parse_errors_total", "Log lines that were not valid JSON")
+TAIL_LAG_BYTES = Gauge("agentpulse_tail_lag_bytes", "Unread bytes at the end of the watched log file", ["agent"])
+TAIL_LAG_SECONDS = Gauge(
+    "agentpulse_tail_lag_seconds", "Seconds since the watched log file was written, if it has unread data", ["agent"]
+)
+RUNS_ACTIVE = Gauge("agentpulse_runs_active", "Runs currently tracked by the daemon", ["agent"])
+RUNS_EVICTED = Gauge("agentpulse_runs_evicted", "Runs dropped without a 'run done' line", ["agent", "reason"])
+CAPTURE_MATCHES = Counter(
+    "agentpulse_capture_matches_total", "Prompt-end events by whether a proxy capture was found", ["result"]
+)
+
+# ─── Sender ───
+
+BUFFER_EVENTS = Gauge("agentpulse_sender_buffer_events", "Events waiting in the sender buffer", ["agent"])
+EVENTS_SENT = Counter("agentpulse_events_sent_total", "Events delivered to the AgentPulse API", ["agent"])
+FLUSH_SECONDS = Histogram("agentpulse_flush_duration_seconds", "Time spent sending one batch", ["agent"])
+FLUSH_FAILURES = Counter("agentpulse_flush_failures_total", "Batches that failed to send", ["agent"])
+
+# ─── Proxy ───
+
+PROXY_IN_FLIGHT = Gauge("agentpulse_proxy_in_flight_requests", "Requests currently being proxied")
+PROXY_REQUESTS = Counter("agentpulse_proxy_requests_total", "Proxied requests", ["provider", "status"])
+PROXY_UPSTREAM_SECONDS = Histogram(
+    "agentpulse_proxy_upstream_duration_seconds", "Time from forwarding a request to the upstream response headers",
+    ["provider"],
+)
+PROXY_CAPTURES = Counter("agentpulse_proxy_captures_total", "Requests captured by the proxy", ["provider"])
+PROXY_CACHE_LOOKUPS = Counter(
+    "agentpulse_proxy_cache_lookups_total", "Response cache lookups by model and result", ["model", "result"]
+)
+PROXY_COALESCED = Counter(
+    "agentpulse_proxy_coalesced_total", "Requests answered by an identical request already in flight", ["provider"]
+)
+PROXY_QUEUE_DEPTH = Gauge("agentpulse_proxy_queue_depth", "Requests waiting for an admission slot", ["provider"])
+PROXY_QUEUE_SECONDS = Histogram(
+    "agentpulse_proxy_queue_duration_seconds", "Time requests waited for an admission slot", ["provider"]
+)
+PROXY_ADMISSION_REJECTED = Counter(
+    "agentpulse_proxy_admission_rejected_total", "Requests turned away by admission control", ["provider", "reason"]
+)
+PROXY_FAILOVERS = Counter(
+    "agentpulse_proxy_failovers_total", "Requests moved to an alternate base URL after an error or 5xx", ["provider"]
+)
+PROXY_HEDGES = Counter(
+    "agentpulse_proxy_hedges_total", "Hedged requests by which attempt answered first", ["provider", "winner"]
+)
+PROXY_CAPTURES_DROPPED = Counter(
+    "agentpulse_proxy_captures_dropped_total", "Captures dropped because the capture queue was full"
+)
+PROXY_EVENTS_DROPPED = Counter(
+    "agentpulse_proxy_events_dropped_total", "Proxy events dropped because the event queue was full"
+)
+PROXY_WORKER_RESTARTS = Counter(
+    "agentpulse_proxy_worker_restarts_total", "Proxy worker processes respawned after dying"
+)
+
+# ─── SDK streaming (in the instrumented process) ───
+
+SDK_TTFT_SECONDS = Histogram(
+    "agentpulse_sdk_ttft_seconds", "Time from request to first streamed token", ["provider"]
+)
+SDK_STREAM_SECONDS = Histogram(
+    "agentpulse_sdk_stream_duration_seconds", "Time from first streamed token to end of stream", ["provider"]
+)
+
+# ─── Provider rate limits (from response headers) ───
+
+RATELIMIT_REMAINING = Gauge(
+    "agentpulse_ratelimit_remaining", "Remaining provider rate limit as last reported", ["provider", "key", "resource"]
+)
+RATELIMIT_LIMIT = Gauge(
+    "agentpulse_ratelimit_limit", "Provider rate limit as last reported", ["provider", "key", "resource"]
+)
+RATELIMIT_RETRY_AFTER = Gauge(
+    "agentpulse_ratelimit_retry_after_seconds", "Last retry-after sent by the provider", ["provider", "key"]
+)
+
+
+class MetricsServer:
+    """Serves /metrics on localhost from a background thread."""
+
+    def __init__(self, port: int = 9464, host: str = "127.0.0.1"):
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        import http.server
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f"Metrics endpoint listening on http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
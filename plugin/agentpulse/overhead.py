@@ -0,0 +1,140 @@
+"""Self-overhead accounting and adaptive capture degradation for the SDK.
+
+Instrumented calls measure the time the SDK itself spends on them (event
+extraction, prompt copying, enqueueing; per-chunk handling for streams)
+with perf_counter_ns and compare it with the call's own latency. When that
+ratio stays over the overhead budget for a window of calls, capture steps
+down one level:
+
+    full -> truncate      bodies cut to TRUNCATE_BYTES (see capture.py)
+         -> sample        bodies (truncated) kept on 1 in SAMPLE_EVERY events
+         -> metrics_only  no prompt / response bodies at all
+
+and steps back up after RECOVER_WINDOWS windows well under budget.
+Token counts, cost and latency are always kept.
+"""
+
+import logging
+import threading
+from typing import Optional
+
+logger = logging.getLogger("agentpulse.sdk")
+
+LEVELS = ("full", "truncate", "sample", "metrics_only")
+DEFAULT_BUDGET = 0.01  # fraction of call latency
+TRUNCATE_BYTES = 2000
+SAMPLE_EVERY = 10
+WINDOW = 20  # calls per budget check
+RECOVER_FRACTION = 0.25  # a window counts as "well under" below budget * this
+RECOVER_WINDOWS = 5
+
+_EVENT_BASE_BYTES = 300  # fixed fields of a serialized event, roughly
+
+
+def approx_size(event: dict) -> int:
+    """Rough serialized size of an event: fixed fields plus its text bodies."""
+    size = _EVENT_BASE_BYTES
+    text = event.get("response_text")
+    if isinstance(text, str):
+        size += len(text)
+    for message in event.get("prompt_messages") or ():
+        content = message.get("content") if isinstance(message, dict) else None
+        size += len(content) if isinstance(content, str) else 32
+    return size
+
+
+class OverheadMonitor:
+    """Totals of the SDK's own time per call, and the capture level they imply."""
+
+    def __init__(self, budget: Optional[float] = DEFAULT_BUDGET, window: int = WINDOW):
+        self.budget = budget
+        self.window = window
+        self.level = 0
+        self.calls = 0
+        self.overhead_ns = 0
+        self.call_ns = 0
+        self.max_overhead_ns = 0
+        self.level_changes = 0
+        self._window_overhead_ns = 0
+        self._window_call_ns = 0
+        self._window_calls = 0
+        self._calm_windows = 0
+        self._bodies_seen = 0
+        self._lock = threading.Lock()
+
+    def body_limit(self) -> Optional[int]:
+        """How much body to capture for the next event: None = all, 0 = none, n = n bytes per body."""
+        level = self.level
+        if level == 0:
+            return None
+        if level == 1:
+            return TRUNCATE_BYTES
+        if level == 2:
+            self._bodies_seen += 1  # unlocked: an occasional miscount only shifts the sample
+            return TRUNCATE_BYTES if self._bodies_seen % SAMPLE_EVERY == 1 else 0
+        return 0
+
+    def shape(self, event: dict, limit: int):
+        """Drop event's prompt / response bodies if limit is 0 and tag the level.
+
+        Bodies under a non-zero limit were already cut while copied (capture.py).
+        """
+        if limit == 0:
+            event["prompt_messages"] = []
+            event["response_text"] = None
+        event["capture_level"] = LEVELS[self.level]
+
+    def record(self, overhead_ns: int, call_ns: int):
+        """Account one instrumented call: our time and the call's own latency."""
+        with self._lock:
+            self.calls += 1
+            self.overhead_ns += overhead_ns
+            self.call_ns += call_ns
+            if overhead_ns > self.max_overhead_ns:
+                self.max_overhead_ns = overhead_ns
+            self._window_overhead_ns += overhead_ns
+            self._window_call_ns += call_ns
+            self._window_calls += 1
+            if self._window_calls >= self.window:
+                self._check_budget()
+
+    def _check_budget(self):
+        ratio = self._window_overhead_ns / self._window_call_ns if self._window_call_ns > 0 else 0.0
+        self._window_overhead_ns = self._window_call_ns = self._window_calls = 0
+        if not self.budget:
+            self._set_level(0, ratio)
+        elif ratio > self.budget:
+            self._calm_windows = 0
+            if self.level < len(LEVELS) - 1:
+                self._set_level(self.level + 1, ratio)
+        elif ratio < self.budget * RECOVER_FRACTION and self.level > 0:
+            self._calm_windows += 1
+            if self._calm_windows >= RECOVER_WINDOWS:
+                self._calm_windows = 0
+                self._set_level(self.level - 1, ratio)
+        else:
+            self._calm_windows = 0
+
+    def _set_level(self, level: int, ratio: float):
+        if level == self.level:
+            return
+        logger.info(
+            f"AgentPulse: capture level {LEVELS[self.level]} -> {LEVELS[level]} "
+            f"(overhead {ratio:.2%} of call time, budget {self.budget or 0:.2%})"
+        )
+        self.level = level
+        self.level_changes += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            calls = self.calls
+            return {
+                "calls": calls,
+                "overhead_ms": self.overhead_ns / 1e6,
+                "overhead_us_per_call": self.overhead_ns / calls / 1e3 if calls else 0.0,
+                "max_overhead_us": self.max_overhead_ns / 1e3,
+                "overhead_ratio": self.overhead_ns / self.call_ns if self.call_ns else 0.0,
+                "overhead_budget": self.budget,
+                "capture_level": LEVELS[self.level],
+                "capture_level_changes": self.level_changes,
+            }
@@ -1,153 +1,56 @@
 import re
-import json
 import logging
 from typing import Optional
 
+from . import _codec, metrics
+from .pricing import MODEL_PRICING, _PROVIDER_PREFIXES, _lookup_pricing, estimate_cost  # noqa: F401 (re-exported)
+
 logger = logging.getLogger("agentpulse.parser")
 
-# ─── Model pricing per million tokens (USD) ───
-MODEL_PRICING = {
-    # MiniMax
-    "minimax/MiniMax-M2.5": {"input": 0.30, "output": 1.20},
-    "MiniMax-M2.5": {"input": 0.30, "output": 1.20},
-    "minimax-m1": {"input": 5, "output": 40},
-    "MiniMax-Text-02": {"input": 1, "output": 5},
-    "abab6.5s-chat": {"input": 1, "output": 5},
-    "abab6.5-chat": {"input": 5, "output": 25},
-    # Anthropic
-    "claude-opus-4": {"input": 15, "output": 75},
-    "claude-opus-4-6": {"input": 15, "output": 75},
-    "claude-opus-4-5": {"input": 15, "output": 75},
-    "claude-sonnet-4-6": {"input": 3, "output": 15},
-    "claude-sonnet-4-5": {"input": 3, "output": 15},
-    "claude-sonnet-4": {"input": 3, "output": 15},
-    "claude-haiku-4-5": {"input": 1, "output": 5},
-    "claude-haiku-4": {"input": 1, "output": 5},
-    "claude-haiku-3.5": {"input": 0.80, "output": 4},
-    "claude-3.5-sonnet": {"input": 3, "output": 15},
-    "claude-3-5-sonnet": {"input": 3, "output": 15},
-    "claude-3-5-haiku": {"input": 0.80, "output": 4},
-    "claude-3-opus": {"input": 15, "output": 75},
-    "claude-3-sonnet": {"input": 3, "output": 15},
-    "claude-3-haiku": {"input": 0.25, "output": 1.25},
-    # OpenAI
-    "gpt-4o": {"input": 2.50, "output": 10},
-    "gpt-4o-mini": {"input": 0.15, "output": 0.60},
-    "gpt-4-turbo": {"input": 10, "output": 30},
-    "gpt-4": {"input": 30, "output": 60},
-    "gpt-3.5-turbo": {"input": 0.50, "output": 1.50},
-    "o3": {"input": 2, "output": 8},
-    "o3-mini": {"input": 1.10, "output": 4.40},
-    "o1": {"input": 15, "output": 60},
-    "o1-mini": {"input": 3, "output": 12},
-    "o1-preview": {"input": 15, "output": 60},
-    # Google
-    "gemini-2.0-flash": {"input": 0.10, "output": 0.40},
-    "gemini-2.0-pro": {"input": 1.25, "output": 10},
-    "gemini-1.5-pro": {"input": 1.25, "output": 5},
-    "gemini-1.5-flash": {"input": 0.075, "output": 0.30},
-    "gemini-1.0-pro": {"input": 0.50, "output": 1.50},
-    # Mistral
-    "mistral-large-latest": {"input": 2, "output": 6},
-    "mistral-large": {"input": 2, "output": 6},
-    "mistral-medium": {"input": 2.70, "output": 8.10},
-    "mistral-small-latest": {"input": 0.20, "output": 0.60},
-    "mistral-small": {"input": 0.20, "output": 0.60},
-    "codestral-latest": {"input": 0.30, "output": 0.90},
-    "codestral": {"input": 0.30, "output": 0.90},
-    "open-mixtral-8x22b": {"input": 2, "output": 6},
-    "open-mixtral-8x7b": {"input": 0.70, "output": 0.70},
-    # Cohere
-    "command-r-plus": {"input": 2.50, "output": 10},
-    "command-r": {"input": 0.15, "output": 0.60},
-    "command-r-plus-08-2024": {"input": 2.50, "output": 10},
-    # Meta / Llama
-    "llama-3.3-70b": {"input": 0.79, "output": 0.79},
-    "llama-3.1-405b": {"input": 3, "output": 3},
-    "llama-3.1-70b": {"input": 0.79, "output": 0.79},
-    "llama-3.1-8b": {"input": 0.05, "output": 0.05},
-    "llama-3-70b": {"input": 0.79, "output": 0.79},
-    "llama-3-8b": {"input": 0.05, "output": 0.05},
-    # DeepSeek
-    "deepseek-chat": {"input": 0.14, "output": 0.28},
-    "deepseek-coder": {"input": 0.14, "output": 0.28},
-    "deepseek-r1": {"input": 0.55, "output": 2.19},
-    "deepseek-v3": {"input": 0.27, "output": 1.10},
-    # xAI / Grok
-    "grok-2": {"input": 2, "output": 10},
-    "grok-3": {"input": 3, "output": 15},
-    "grok-3-mini": {"input": 0.30, "output": 0.50},
-    # Amazon
-    "amazon.nova-pro": {"input": 0.80, "output": 3.20},
-    "amazon.nova-lite": {"input": 0.06, "output": 0.24},
-    "amazon.nova-micro": {"input": 0.035, "output": 0.14},
-    # Perplexity
-    "sonar-pro": {"input": 3, "output": 15},
-    "sonar": {"input": 1, "output": 1},
+# ─── Regex patterns for extracting data from OpenClaw message strings ───
+# Compiled on first use (see _compile_patterns), so importing parser for
+# extract_usage_from_api_response or the pricing re-exports stays cheap.
+_PATTERN_SOURCES = {
+    # "embedded run prompt end: runId=xxx sessionId=xxx durationMs=121466"
+    "PROMPT_END_RE": (r'embedded run prompt end:.*?runId=(\S+).*?sessionId=(\S+).*?durationMs=(\d+)', 0),
+    # "embedded run done: runId=xxx sessionId=xxx durationMs=121751 aborted=false"
+    "RUN_DONE_RE": (
+        r'embedded run done:.*?runId=(\S+).*?sessionId=(\S+).*?durationMs=(\d+)(?:.*?aborted=(\w+))?', 0
+    ),
+    # "embedded run tool start: runId=xxx tool=exec toolCallId=xxx"
+    "TOOL_START_RE": (r'embedded run tool start:.*?runId=(\S+)\s+tool=(\S+)\s+toolCallId=(\S+)', 0),
+    # "embedded run tool end: runId=xxx tool=exec toolCallId=xxx"
+    "TOOL_END_RE": (r'embedded run tool end:.*?runId=(\S+)\s+tool=(\S+)\s+toolCallId=(\S+)', 0),
+    # "embedded run start: runId=xxx sessionId=xxx provider=anthropic model=claude-haiku-4-5 thinking=low ..."
+    "RUN_START_RE": (r'embedded run start:.*?runId=(\S+).*?sessionId=(\S+).*?provider=(\S+).*?model=(\S+)', 0),
+    # "embedded run agent end: runId=xxx"
+    "AGENT_END_RE": (r'embedded run agent end:.*?runId=(\S+)', 0),
+    # "[tools] edit failed: ..."
+    "TOOL_ERROR_RE": (r'\[tools\]\s+(\w+)\s+failed:\s*(.*)', 0),
+    # Token/usage patterns (in case gateway logs them)
+    "TOKEN_JSON_RE": (
+        r'"(?:prompt|input)[_ ]?tokens?":\s*(\d+).*?"(?:completion|output)[_ ]?tokens?":\s*(\d+)', re.IGNORECASE
+    ),
+    # Model name in message (in case gateway logs it)
+    "MODEL_IN_MSG_RE": (r'model[=:\s]+(\S+)', re.IGNORECASE),
 }
+_compiled = False
 
-_PROVIDER_PREFIXES = [
-    "anthropic/", "openai/", "google/", "mistral/", "cohere/",
-    "meta/", "deepseek/", "xai/", "minimax/", "amazon/",
-    "together/", "groq/", "fireworks/", "perplexity/", "anyscale/",
-]
 
-# ─── Regex patterns for extracting data from OpenClaw message strings ───
-# "embedded run prompt end: runId=xxx sessionId=xxx durationMs=121466"
-PROMPT_END_RE = re.compile(
-    r'embedded run prompt end:.*?runId=(\S+).*?sessionId=(\S+).*?durationMs=(\d+)'
-)
-# "embedded run done: runId=xxx sessionId=xxx durationMs=121751 aborted=false"
-RUN_DONE_RE = re.compile(
-    r'embedded run done:.*?runId=(\S+).*?sessionId=(\S+).*?durationMs=(\d+)(?:.*?aborted=(\w+))?'
-)
-# "embedded run tool start: runId=xxx tool=exec toolCallId=xxx"
-TOOL_START_RE = re.compile(
-    r'embedded run tool start:.*?runId=(\S+)\s+tool=(\S+)\s+toolCallId=(\S+)'
-)
-# "embedded run tool end: runId=xxx tool=exec toolCallId=xxx"
-TOOL_END_RE = re.compile(
-    r'embedded run tool end:.*?runId=(\S+)\s+tool=(\S+)\s+toolCallId=(\S+)'
-)
-# "embedded run start: runId=xxx sessionId=xxx provider=anthropic model=claude-haiku-4-5 thinking=low messageChannel=unknown"
-RUN_START_RE = re.compile(
-    r'embedded run start:.*?runId=(\S+).*?sessionId=(\S+).*?provider=(\S+).*?model=(\S+)'
-)
-# "embedded run agent end: runId=xxx"
-AGENT_END_RE = re.compile(r'embedded run agent end:.*?runId=(\S+)')
-# "[tools] edit failed: ..."
-TOOL_ERROR_RE = re.compile(r'\[tools\]\s+(\w+)\s+failed:\s*(.*)')
-# Token/usage patterns (in case gateway logs them)
-TOKEN_JSON_RE = re.compile(
-    r'"(?:prompt|input)[_ ]?tokens?":\s*(\d+).*?"(?:completion|output)[_ ]?tokens?":\s*(\d+)',
-    re.IGNORECASE,
-)
-# Model name in message (in case gateway logs it)
-MODEL_IN_MSG_RE = re.compile(r'model[=:\s]+(\S+)', re.IGNORECASE)
-
-
-def _lookup_pricing(model: str) -> Optional[dict]:
-    """Look up pricing for a model, handling provider prefixes and fuzzy matching."""
-    if model in MODEL_PRICING:
-        return MODEL_PRICING[model]
-    for prefix in _PROVIDER_PREFIXES:
-        if model.startswith(prefix):
-            stripped = model[len(prefix):]
-            if stripped in MODEL_PRICING:
-                return MODEL_PRICING[stripped]
-    model_lower = model.lower()
-    for key, val in MODEL_PRICING.items():
-        if key.lower() in model_lower or model_lower in key.lower():
-            return val
-    return None
+def _compile_patterns():
+    global _compiled
+    namespace = globals()
+    for name, (pattern, flags) in _PATTERN_SOURCES.items():
+        namespace[name] = re.compile(pattern, flags)
+    _compiled = True
 
 
-def estimate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
-    """Calculate cost from model pricing."""
-    pricing = _lookup_pricing(model)
-    if not pricing:
-        return 0.0
-    return (input_tokens / 1_000_000) * pricing["input"] + (output_tokens / 1_000_000) * pricing["output"]
+def __getattr__(name):
+    # parser.PROMPT_END_RE etc. from outside, before any line was parsed
+    if name in _PATTERN_SOURCES:
+        _compile_patterns()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def extract_usage_from_api_response(response_json: dict) -> Optional[dict]:
@@ -211,10 +114,15 @@ def parse_openclaw_line(raw_line: str) -> Optional[dict]:
     raw_line = raw_line.strip()
     if not raw_line:
         return None
+    if not _compiled:
+        _compile_patterns()
 
     try:
-        obj = json.loads(raw_line)
-    except (json.JSONDecodeError, ValueError):
+        obj = _codec.loads(raw_line)
+    except _codec.DecodeError:
+        metrics.PARSE_ERRORS.inc()
+        return None
+    if not isinstance(obj, dict):
         return None
 
     # Extract fields
@@ -226,7 +134,7 @@ def parse_openclaw_line(raw_line: str) -> Optional[dict]:
 
     # Some log lines have a dict instead of a string in the message field
     if isinstance(message, dict):
-        message = json.dumps(message)
+        message = _codec.dumps(message).decode("utf-8")
 
     # Parse subsystem name from the JSON-encoded "0" field
     subsystem = ""
@@ -234,9 +142,9 @@ def parse_openclaw_line(raw_line: str) -> Optional[dict]:
         subsystem = subsystem_raw.get("subsystem", "")
     else:
         try:
-            sub_obj = json.loads(subsystem_raw)
+            sub_obj = _codec.loads(subsystem_raw)
             subsystem = sub_obj.get("subsystem", "")
-        except (json.JSONDecodeError, ValueError, TypeError):
+        except (*_codec.DecodeError, AttributeError):
             subsystem = subsystem_raw
 
     if not message:
@@ -350,7 +258,7 @@ def parse_openclaw_line(raw_line: str) -> Optional[dict]:
     brace_idx = message.find("{")
     if brace_idx != -1 and '"usage"' in message:
         try:
-            inner = json.loads(message[brace_idx:])
+            inner = _codec.loads(message[brace_idx:])
             usage = extract_usage_from_api_response(inner)
             if usage:
                 return {
@@ -361,7 +269,7 @@ def parse_openclaw_line(raw_line: str) -> Optional[dict]:
                     "timestamp": timestamp,
                     "subsystem": subsystem,
                 }
-        except (json.JSONDecodeError, ValueError):
+        except (*_codec.DecodeError, AttributeError):
             pass
 
     return None
@@ -0,0 +1,117 @@
+"""Model pricing and cost estimation.
+
+Kept apart from parser so the SDK can price calls without importing the
+log parser in every instrumented process. parser re-exports these names.
+"""
+
+from typing import Optional
+
+# ─── Model pricing per million tokens (USD) ───
+MODEL_PRICING = {
+    # MiniMax
+    "minimax/MiniMax-M2.5": {"input": 0.30, "output": 1.20},
+    "MiniMax-M2.5": {"input": 0.30, "output": 1.20},
+    "minimax-m1": {"input": 5, "output": 40},
+    "MiniMax-Text-02": {"input": 1, "output": 5},
+    "abab6.5s-chat": {"input": 1, "output": 5},
+    "abab6.5-chat": {"input": 5, "output": 25},
+    # Anthropic
+    "claude-opus-4": {"input": 15, "output": 75},
+    "claude-opus-4-6": {"input": 15, "output": 75},
+    "claude-opus-4-5": {"input": 15, "output": 75},
+    "claude-sonnet-4-6": {"input": 3, "output": 15},
+    "claude-sonnet-4-5": {"input": 3, "output": 15},
+    "claude-sonnet-4": {"input": 3, "output": 15},
+    "claude-haiku-4-5": {"input": 1, "output": 5},
+    "claude-haiku-4": {"input": 1, "output": 5},
+    "claude-haiku-3.5": {"input": 0.80, "output": 4},
+    "claude-3.5-sonnet": {"input": 3, "output": 15},
+    "claude-3-5-sonnet": {"input": 3, "output": 15},
+    "claude-3-5-haiku": {"input": 0.80, "output": 4},
+    "claude-3-opus": {"input": 15, "output": 75},
+    "claude-3-sonnet": {"input": 3, "output": 15},
+    "claude-3-haiku": {"input": 0.25, "output": 1.25},
+    # OpenAI
+    "gpt-4o": {"input": 2.50, "output": 10},
+    "gpt-4o-mini": {"input": 0.15, "output": 0.60},
+    "gpt-4-turbo": {"input": 10, "output": 30},
+    "gpt-4": {"input": 30, "output": 60},
+    "gpt-3.5-turbo": {"input": 0.50, "output": 1.50},
+    "o3": {"input": 2, "output": 8},
+    "o3-mini": {"input": 1.10, "output": 4.40},
+    "o1": {"input": 15, "output": 60},
+    "o1-mini": {"input": 3, "output": 12},
+    "o1-preview": {"input": 15, "output": 60},
+    # Google
+    "gemini-2.0-flash": {"input": 0.10, "output": 0.40},
+    "gemini-2.0-pro": {"input": 1.25, "output": 10},
+    "gemini-1.5-pro": {"input": 1.25, "output": 5},
+    "gemini-1.5-flash": {"input": 0.075, "output": 0.30},
+    "gemini-1.0-pro": {"input": 0.50, "output": 1.50},
+    # Mistral
+    "mistral-large-latest": {"input": 2, "output": 6},
+    "mistral-large": {"input": 2, "output": 6},
+    "mistral-medium": {"input": 2.70, "output": 8.10},
+    "mistral-small-latest": {"input": 0.20, "output": 0.60},
+    "mistral-small": {"input": 0.20, "output": 0.60},
+    "codestral-latest": {"input": 0.30, "output": 0.90},
+    "codestral": {"input": 0.30, "output": 0.90},
+    "open-mixtral-8x22b": {"input": 2, "output": 6},
+    "open-mixtral-8x7b": {"input": 0.70, "output": 0.70},
+    # Cohere
+    "command-r-plus": {"input": 2.50, "output": 10},
+    "command-r": {"input": 0.15, "output": 0.60},
+    "command-r-plus-08-2024": {"input": 2.50, "output": 10},
+    # Meta / Llama
+    "llama-3.3-70b": {"input": 0.79, "output": 0.79},
+    "llama-3.1-405b": {"input": 3, "output": 3},
+    "llama-3.1-70b": {"input": 0.79, "output": 0.79},
+    "llama-3.1-8b": {"input": 0.05, "output": 0.05},
+    "llama-3-70b": {"input": 0.79, "output": 0.79},
+    "llama-3-8b": {"input": 0.05, "output": 0.05},
+    # DeepSeek
+    "deepseek-chat": {"input": 0.14, "output": 0.28},
+    "deepseek-coder": {"input": 0.14, "output": 0.28},
+    "deepseek-r1": {"input": 0.55, "output": 2.19},
+    "deepseek-v3": {"input": 0.27, "output": 1.10},
+    # xAI / Grok
+    "grok-2": {"input": 2, "output": 10},
+    "grok-3": {"input": 3, "output": 15},
+    "grok-3-mini": {"input": 0.30, "output": 0.50},
+    # Amazon
+    "amazon.nova-pro": {"input": 0.80, "output": 3.20},
+    "amazon.nova-lite": {"input": 0.06, "output": 0.24},
+    "amazon.nova-micro": {"input": 0.035, "output": 0.14},
+    # Perplexity
+    "sonar-pro": {"input": 3, "output": 15},
+    "sonar": {"input": 1, "output": 1},
+}
+
+_PROVIDER_PREFIXES = [
+    "anthropic/", "openai/", "google/", "mistral/", "cohere/",
+    "meta/", "deepseek/", "xai/", "minimax/", "amazon/",
+    "together/", "groq/", "fireworks/", "perplexity/", "anyscale/",
+]
+
+def _lookup_pricing(model: str) -> Optional[dict]:
+    """Look up pricing for a model, handling provider prefixes and fuzzy matching."""
+    if model in MODEL_PRICING:
+        return MODEL_PRICING[model]
+    for prefix in _PROVIDER_PREFIXES:
+        if model.startswith(prefix):
+            stripped = model[len(prefix):]
+            if stripped in MODEL_PRICING:
+                return MODEL_PRICING[stripped]
+    model_lower = model.lower()
+    for key, val in MODEL_PRICING.items():
+        if key.lower() in model_lower or model_lower in key.lower():
+            return val
+    return None
+
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    """Calculate cost from model pricing."""
+    pricing = _lookup_pricing(model)
+    if not pricing:
+        return 0.0
+    return (input_tokens / 1_000_000) * pricing["input"] + (output_tokens / 1_000_000) * pricing["output"]
@@ -0,0 +1,209 @@
+"""Sampling profiler for processes started by `agentpulse run --profile`.
+
+A wall-clock timer (setitimer/SIGALRM, 100 Hz by default) samples the
+Python stacks of the process's threads. Each sample is filed under "llm"
+when its thread is inside an instrumented call and under "app" otherwise.
+A thread is inside a call when one of these is true:
+- a patched create() is on its stack;
+- a sync stream is waiting for its next chunk;
+- its event loop is idle while an async create() or stream is awaited.
+At exit the profiler writes:
+
+  agentpulse-profile-<pid>.folded  folded stacks ("llm;mod.func;... 12"), for
+                                   flamegraph.pl, speedscope or inferno
+  agentpulse-profile-<pid>.txt     LLM vs app share and the busiest functions
+
+Worker threads idle in a wait (thread pools, queues) are skipped so they
+don't drown out the agent's own time; the main thread is always sampled.
+The SDK's own threads are never sampled. The signal handler takes no locks
+(it can interrupt a thread holding any of them), so the set of SDK threads
+is refreshed by a helper thread rather than looked up per sample.
+"""
+
+import atexit
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+from . import sdk
+
+logger = logging.getLogger("agentpulse.sdk")
+
+DEFAULT_HZ = 100
+MAX_DEPTH = 128
+TOP_FUNCTIONS = 15
+SKIP_REFRESH = 1.0  # seconds between refreshes of the SDK's thread idents
+
+# (module, function) a thread's top frame is in while it waits for work
+_IDLE = {
+    ("selectors", "select"),
+    ("threading", "wait"),
+    ("queue", "get"),
+    ("concurrent.futures.thread", "_worker"),
+}
+
+_profiler = None
+
+
+class Profiler:
+    """Folded-stack sample counts, split into time inside and outside LLM calls."""
+
+    def __init__(self, directory: str, hz: int = DEFAULT_HZ):
+        self.directory = directory
+        self.hz = hz
+        self.counts: dict = {}  # (category, labels from the root) -> samples
+        self._labels: dict = {}  # code object -> "module.qualname"
+        self._main = threading.main_thread().ident
+        self._started = time.monotonic()
+        self._running = False
+        self._skip = frozenset()  # idents of the SDK's own threads
+        self._stopped = threading.Event()
+
+    def start(self) -> bool:
+        if not hasattr(signal, "setitimer"):
+            logger.warning("AgentPulse: profiling needs setitimer, not available on this platform")
+            return False
+        if threading.current_thread() is not threading.main_thread():
+            logger.warning("AgentPulse: the profiler must be started from the main thread")
+            return False
+        if signal.getsignal(signal.SIGALRM) not in (signal.SIG_DFL, None):
+            logger.warning("AgentPulse: SIGALRM is already in use, not profiling")
+            return False
+        self._start_refresher()
+        signal.signal(signal.SIGALRM, self._sample)
+        signal.setitimer(signal.ITIMER_REAL, 1 / self.hz, 1 / self.hz)
+        self._running = True
+        return True
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, signal.SIG_DFL)
+        self._stopped.set()
+
+    def restart_in_child(self):
+        # Timers aren't inherited across fork(): a forked child profiles itself
+        self.counts = {}
+        self._main = threading.main_thread().ident
+        self._started = time.monotonic()
+        if self._running:
+            self._start_refresher()
+            signal.setitimer(signal.ITIMER_REAL, 1 / self.hz, 1 / self.hz)
+
+    def _start_refresher(self):
+        self._stopped = threading.Event()
+        refresher = threading.Thread(
+            target=self._refresh_loop, args=(self._stopped,), name="agentpulse-profiler", daemon=True
+        )
+        refresher.start()
+        self._refresh_skip()
+
+    def _refresh_loop(self, stopped: threading.Event):
+        while not stopped.wait(SKIP_REFRESH):
+            self._refresh_skip()
+
+    def _refresh_skip(self):
+        # threading.enumerate() takes a lock, so never from the signal handler
+        self._skip = frozenset(t.ident for t in threading.enumerate() if t.name.startswith("agentpulse"))
+
+    def _label(self, frame) -> str:
+        code = frame.f_code
+        label = self._labels.get(code)
+        if label is None:
+            name = getattr(code, "co_qualname", code.co_name)
+            label = f"{frame.f_globals.get('__name__', '?')}.{name}".replace(";", ":").replace(" ", "_")
+            self._labels[code] = label
+        return label
+
+    def _sample(self, signum, frame):
+        frames = sys._current_frames()
+        frames[self._main] = frame  # the interrupted frame, not this handler's
+        skip = self._skip
+        llm_code = sdk._LLM_CODE
+        counts = self.counts
+        for thread, top in frames.items():
+            if thread in skip or top is None:
+                continue
+            category = None
+            labels = []
+            current = top
+            while current is not None and len(labels) < MAX_DEPTH:
+                if current.f_code in llm_code:
+                    category = "llm"
+                labels.append(self._label(current))
+                current = current.f_back
+            if category is None:
+                if (top.f_globals.get("__name__"), top.f_code.co_name) in _IDLE:
+                    if sdk._llm_in_flight.get(thread):
+                        category = "llm"  # the loop is waiting on the model
+                    elif thread != self._main:
+                        continue  # an idle worker
+                    else:
+                        category = "app"
+                else:
+                    category = "app"
+            labels.append(category)
+            key = tuple(reversed(labels))
+            counts[key] = counts.get(key, 0) + 1
+
+    def summary(self) -> str:
+        total = sum(self.counts.values())
+        by_category = {"llm": 0, "app": 0}
+        self_time: dict = {}
+        for stack, count in self.counts.items():
+            by_category[stack[0]] += count
+            if stack[0] == "app" and len(stack) > 1:
+                self_time[stack[-1]] = self_time.get(stack[-1], 0) + count
+        elapsed = time.monotonic() - self._started
+        lines = [
+            f"AgentPulse profile of pid {os.getpid()}: {' '.join(sys.argv) or sys.executable}",
+            f"  {elapsed:.1f}s wall, {total} samples at {self.hz} Hz",
+            f"  inside LLM calls   {by_category['llm'] / total:6.1%}",
+            f"  outside (app)      {by_category['app'] / total:6.1%}",
+            "",
+            "Busiest functions outside LLM calls (self samples):",
+        ]
+        for label, count in sorted(self_time.items(), key=lambda item: -item[1])[:TOP_FUNCTIONS]:
+            lines.append(f"  {count / total:6.1%}  {label}")
+        return "\n".join(lines) + "\n"
+
+    def write(self) -> str:
+        """Write the .folded and .txt files, returning the path prefix (None if nothing sampled)."""
+        if not self.counts:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"agentpulse-profile-{os.getpid()}")
+        with open(base + ".folded", "w") as f:
+            for stack, count in sorted(self.counts.items()):
+                f.write(f"{';'.join(stack)} {count}\n")
+        with open(base + ".txt", "w") as f:
+            f.write(self.summary())
+        return base
+
+
+def _finish():
+    if _profiler is not None:
+        _profiler.stop()
+        try:
+            _profiler.write()
+        except OSError as e:
+            logger.warning(f"AgentPulse: could not write profile: {e}")
+
+
+def start(directory: str, hz: int = DEFAULT_HZ) -> bool:
+    """Sample this process until exit, then write its profile to directory."""
+    global _profiler
+    if _profiler is not None:
+        return True
+    profiler = Profiler(directory, hz)
+    if not profiler.start():
+        return False
+    _profiler = profiler
+    atexit.register(_finish)
+    os.register_at_fork(after_in_child=profiler.restart_in_child)
+    return True
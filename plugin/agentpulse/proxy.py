@@ -14,19 +14,32 @@ Usage:
     OPENAI_BASE_URL=http://127.0.0.1:8787/openai
 """
 
-import http.client
+import functools
 import http.server
-import json
 import logging
-import ssl
+import os
+import queue
+import socket
+import socketserver
+import stat
 import threading
+import time
 import urllib.parse
 from collections import deque
 from datetime import datetime, timezone
 
+from . import _codec, metrics, proxy_workers, ratelimit, tokens
+from .admission import AdmissionController, AdmissionRejected, estimate_request_tokens, parse_priority
+from .cache import CachedResponse, ResponseCache, auth_scope, request_key
+from .encoding import DecodeError, decode_body, filter_accept_encoding, header_value
+from .parser import estimate_cost
+from .singleflight import SingleFlight
+from .upstream import HedgePolicy, open_with_failover
+
 logger = logging.getLogger("agentpulse.proxy")
 
-# Provider API base URLs
+# Provider API base URLs. LLMProxyServer also accepts a list of base URLs
+# per provider, tried in order on connection errors and 5xx responses.
 PROVIDERS = {
     "anthropic": "https://api.anthropic.com",
     "openai": "https://api.openai.com",
@@ -39,13 +52,21 @@ PROVIDERS = {
     "fireworks": "https://api.fireworks.ai",
 }
 
-# Reusable SSL context for outbound HTTPS
-_ssl_ctx = ssl.create_default_context()
-
-
 class ProxyHandler(http.server.BaseHTTPRequestHandler):
     """HTTP handler that proxies LLM API requests and captures data."""
 
+    _agent = None  # agent the current request is attributed to
+    _run_hint = None  # {"run_id", "session_id"} the client tagged the request with
+
+    def setup(self):
+        # SSE relays many small writes; don't let Nagle hold them back.
+        # Unix socket connections have no client address and no TCP options.
+        self.disable_nagle_algorithm = isinstance(self.client_address, tuple)
+        super().setup()
+
+    def address_string(self):
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
     def log_message(self, format, *args):
         # Suppress default access logs; we log our own
         pass
@@ -72,20 +93,42 @@ class ProxyHandler(http.server.BaseHTTPRequestHandler):
 
     def _proxy_request(self, method):
         """Forward request to the real API, capturing POST body/response."""
-        # Parse path: /<provider>/<api-path>
-        parts = self.path.lstrip("/").split("/", 1)
+        metrics.PROXY_IN_FLIGHT.inc()
+        try:
+            self._forward(method)
+        finally:
+            metrics.PROXY_IN_FLIGHT.dec()
+
+    def _forward(self, method):
+        started = time.perf_counter()
+
+        # Parse path: [/agent/<agent_name>]/<provider>/<api-path>
+        path = self.path
+        self._agent = self.headers.get("X-AgentPulse-Agent")
+        if path.startswith("/agent/"):
+            agent, _, path = path[len("/agent/"):].partition("/")
+            self._agent = urllib.parse.unquote(agent)
+        hint = {
+            "run_id": self.headers.get("X-AgentPulse-Run"),
+            "session_id": self.headers.get("X-AgentPulse-Session"),
+        }
+        self._run_hint = hint if any(hint.values()) else None
+        parts = path.lstrip("/").split("/", 1)
         provider_name = parts[0].lower() if parts else ""
         api_path = "/" + parts[1] if len(parts) > 1 else "/"
 
-        if provider_name not in PROVIDERS:
+        providers = self.server.providers
+        if provider_name not in providers:
             self.send_error(
                 404,
                 f"Unknown provider '{provider_name}'. "
-                f"Use one of: {', '.join(sorted(PROVIDERS))}",
+                f"Use one of: {', '.join(sorted(providers))}",
             )
             return
 
-        target_base = PROVIDERS[provider_name]
+        targets = providers[provider_name]
+        if isinstance(targets, str):
+            targets = [targets]
 
         # Read request body
         content_length = int(self.headers.get("Content-Length", 0))
@@ -95,114 +138,416 @@ class ProxyHandler(http.server.BaseHTTPRequestHandler):
         request_json = {}
         if method == "POST" and request_body:
             try:
-                request_json = json.loads(request_body)
-            except (json.JSONDecodeError, ValueError):
+                request_json = _codec.loads(request_body)
+            except _codec.DecodeError:
                 pass
+            if not isinstance(request_json, dict):
+                request_json = {}
 
         # Build forward headers (pass through auth, content-type, etc.)
         forward_headers = {}
         for key in self.headers:
             lower = key.lower()
-            if lower in ("host", "transfer-encoding"):
+            if lower in ("host", "transfer-encoding") or lower.startswith("x-agentpulse-"):
                 continue
             forward_headers[key] = self.headers[key]
+            if lower == "accept-encoding":
+                # Keep compression on the wire, but only codings we can decode for capture
+                forward_headers[key] = filter_accept_encoding(self.headers[key])
         if request_body:
             forward_headers["Content-Length"] = str(len(request_body))
 
         # Determine if streaming
         is_streaming = request_json.get("stream", False)
 
-        # Forward the request
-        try:
-            parsed = urllib.parse.urlparse(target_base)
-            if parsed.scheme == "https":
-                conn = http.client.HTTPSConnection(
-                    parsed.hostname, parsed.port or 443, context=_ssl_ctx, timeout=300
+        cache = self.server.cache
+        flights = self.server.flights
+        req_key = None
+        if method == "POST" and request_json and (cache is not None or flights is not None):
+            req_key = request_key(
+                provider_name, api_path, request_json,
+                self.headers.get("Accept-Encoding", ""), auth_scope(self.headers),
+            )
+
+        # Serve identical deterministic requests from the response cache
+        cache_key = None
+        if cache is not None and req_key and cache.should_cache(request_json):
+            cache_key = req_key
+            cached = cache.get(cache_key)
+            cache.record(request_json.get("model", "unknown"), cached is not None)
+            if cached is not None:
+                self._replay_cached(cached, is_streaming)
+                timing = {"latency_ms": int((time.perf_counter() - started) * 1000), "ttft_ms": None}
+                self._capture(
+                    provider_name, request_json, cached.body, is_streaming, cached.status, timing,
+                    cache_hit=True, content_encoding=header_value(cached.headers, "Content-Encoding"),
                 )
+                return
+
+        # Share the upstream call of an identical request already in flight
+        flight = None
+        if flights is not None and req_key and flights.should_coalesce(request_json):
+            flight, leader = flights.join(req_key)
+            if not leader:
+                if self._follow(flight, provider_name, request_json, is_streaming, started):
+                    return
+                # The leader failed before getting a response; go upstream ourselves
+                flight = None
+
+        # Wait for an admission slot if this provider has limits
+        admission = self.server.admission
+        ticket = None
+        queue_ms = 0
+        if admission is not None and admission.limits_provider(provider_name):
+            try:
+                ticket = admission.acquire(
+                    provider_name,
+                    request_json.get("model", "unknown"),
+                    estimate_request_tokens(request_json, len(request_body)),
+                    parse_priority(self.headers.get("X-AgentPulse-Priority")),
+                )
+            except AdmissionRejected as e:
+                if flight is not None:
+                    flights.land(req_key, flight)
+                self._send_rejection(provider_name, e)
+                return
+            queue_ms = admission.queue_ms(ticket)
+            # Upstream latency is measured from admission; queueing is reported on its own
+            started = time.perf_counter()
+
+        # Forward the request (hedged if it's slow and safe to send twice)
+        hedge = self.server.hedge
+        conn = None
+        try:
+            sent_at = time.perf_counter()
+            if hedge is not None and hedge.eligible(method, request_json, is_streaming):
+                resp = hedge.run(provider_name, targets, method, api_path, request_body, forward_headers)
+                headers_at = resp.headers_at  # the winner's, not after its body was read
             else:
-                conn = http.client.HTTPConnection(
-                    parsed.hostname, parsed.port or 80, timeout=300
+                conn, resp = open_with_failover(
+                    provider_name, targets, method, api_path, request_body, forward_headers,
                 )
-
-            conn.request(method, api_path, body=request_body, headers=forward_headers)
-            resp = conn.getresponse()
+                headers_at = time.perf_counter()
+            metrics.PROXY_UPSTREAM_SECONDS.labels(provider_name).observe(headers_at - sent_at)
+            metrics.PROXY_REQUESTS.labels(provider_name, resp.status).inc()
 
             # Forward response headers to client
-            self.send_response(resp.status)
             resp_headers = resp.getheaders()
+            limits = ratelimit.parse_headers(resp_headers)
+            if limits:
+                credential = self.headers.get("Authorization") or self.headers.get("x-api-key")
+                ratelimit.TRACKER.observe(provider_name, ratelimit.key_id(credential), limits)
+            if flight is not None and is_streaming:
+                flight.start(resp.status, resp_headers)
+            self.send_response(resp.status)
             for key, val in resp_headers:
                 lower = key.lower()
                 if lower in ("transfer-encoding",):
                     continue
                 self.send_header(key, val)
+            if cache_key:
+                self.send_header("X-AgentPulse-Cache", "MISS")
+            if ticket is not None:
+                self.send_header("X-AgentPulse-Queue-Ms", str(queue_ms))
             self.end_headers()
 
             # Read and forward response body
+            first_byte_at = None
             if is_streaming:
-                response_body = self._forward_streaming(resp)
+                response_body, first_byte_at = self._forward_streaming(resp, flight)
             else:
                 response_body = resp.read()
+                if flight is not None:
+                    # Only now: followers relay the headers (Content-Length
+                    # included), so they need the body that goes with them
+                    flight.start(resp.status, resp_headers)
+                    flight.write(response_body)
+
+            if conn is not None:
+                conn.close()
+            finished_at = time.perf_counter()
+            if hedge is not None and not is_streaming:
+                hedge.record(provider_name, finished_at - sent_at)
+
+            # Publish before answering our own client, so a repeat of this
+            # request hits the cache instead of joining a finished flight
+            if cache_key and resp.status == 200:
+                cache.put(cache_key, CachedResponse(
+                    resp.status, resp_headers, response_body, request_json.get("model", "unknown"),
+                ))
+            if flight is not None:
+                flights.land(req_key, flight)
+            if not is_streaming:
                 self.wfile.write(response_body)
 
-            conn.close()
-
-            # Capture data from POST requests to chat/message endpoints
-            if method == "POST" and resp.status < 400 and request_json:
-                self._capture(provider_name, request_json, response_body, is_streaming)
+            # Capture data from POST requests to chat/message endpoints.
+            # Failed calls are only worth capturing when they become events.
+            if method == "POST" and request_json and (resp.status < 400 or self.server.emit_events):
+                timing = {
+                    "latency_ms": int((finished_at - started) * 1000),
+                    "ttft_ms": int((first_byte_at - started) * 1000) if first_byte_at else None,
+                    "queue_ms": queue_ms if ticket is not None else None,
+                }
+                on_done = functools.partial(_charge_usage, admission, ticket) if ticket is not None else None
+                self._capture(
+                    provider_name, request_json, response_body, is_streaming, resp.status, timing,
+                    on_done=on_done, limits=limits,
+                    content_encoding=header_value(resp_headers, "Content-Encoding"),
+                )
 
         except Exception as e:
             logger.error(f"Proxy forward error: {e}")
+            metrics.PROXY_REQUESTS.labels(provider_name, "error").inc()
+            if flight is not None:
+                flight.fail()
             try:
                 self.send_error(502, f"Proxy error: {e}")
             except Exception:
                 pass
+        finally:
+            if flight is not None:
+                flights.land(req_key, flight)
+            if ticket is not None:
+                admission.release(ticket)
+
+    def _send_rejection(self, provider, rejection):
+        """Answer a request the admission controller turned away."""
+        body = _codec.dumps({
+            "error": {
+                "type": "agentpulse_admission",
+                "message": f"AgentPulse proxy: {provider} {rejection.reason}",
+            }
+        })
+        try:
+            self.send_response(503)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Retry-After", "1")
+            self.send_header("X-AgentPulse-Queue-Ms", str(rejection.queue_ms))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            pass
+
+    def _forward_streaming(self, resp, flight=None):
+        """Forward streaming response chunks while buffering for capture.
 
-    def _forward_streaming(self, resp):
-        """Forward streaming response chunks while buffering for capture."""
+        Returns (body, first_byte_at) where first_byte_at is the
+        perf_counter() time the first chunk arrived from upstream.
+        """
         buf = bytearray()
+        first_byte_at = None
+        client_gone = False
         while True:
-            chunk = resp.read(4096)
+            chunk = resp.read1(4096)
             if not chunk:
                 break
-            self.wfile.write(chunk)
-            self.wfile.flush()
+            if first_byte_at is None:
+                first_byte_at = time.perf_counter()
+            if flight is not None:
+                flight.write(chunk)
+            if not client_gone:
+                try:
+                    self.wfile.write(chunk)
+                    self.wfile.flush()
+                except OSError:
+                    if flight is None or not flight.followers:
+                        raise
+                    # Keep reading for the coalesced requests still attached
+                    client_gone = True
             buf.extend(chunk)
-        return bytes(buf)
+        return bytes(buf), first_byte_at
 
-    def _capture(self, provider, request_json, response_body, is_streaming):
-        """Extract prompt/response data and store for the daemon."""
-        try:
-            prompt_messages = _extract_prompt(provider, request_json)
-            model = request_json.get("model", "unknown")
+    def _follow(self, flight, provider, request_json, is_streaming, started):
+        """Answer a request from an identical one already in flight.
 
-            if is_streaming:
-                response_text, input_tokens, output_tokens = _extract_streaming_response(
-                    provider, response_body
-                )
-            else:
-                response_text, input_tokens, output_tokens = _extract_response(
-                    provider, response_body
-                )
+        Returns False if the leader failed before getting a response.
+        """
+        if not flight.wait_start(timeout=300):
+            return False
+        metrics.PROXY_COALESCED.labels(provider).inc()
 
-            capture = {
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-                "provider": provider,
-                "model": model,
-                "prompt_messages": prompt_messages,
-                "response_text": response_text,
-                "input_tokens": input_tokens,
-                "output_tokens": output_tokens,
-                "claimed": False,
+        buf = bytearray()
+        first_byte_at = None
+        try:
+            self.send_response(flight.status)
+            for key, val in flight.headers:
+                if key.lower() == "transfer-encoding":
+                    continue
+                self.send_header(key, val)
+            self.send_header("X-AgentPulse-Coalesced", "1")
+            self.end_headers()
+            for chunk in flight.chunks():
+                if first_byte_at is None:
+                    first_byte_at = time.perf_counter()
+                self.wfile.write(chunk)
+                if is_streaming:
+                    self.wfile.flush()
+                buf.extend(chunk)
+        except OSError as e:
+            logger.debug(f"Coalesced client went away: {e}")
+            return True
+
+        if flight.status < 400 or self.server.emit_events:
+            timing = {
+                "latency_ms": int((time.perf_counter() - started) * 1000),
+                "ttft_ms": int((first_byte_at - started) * 1000) if first_byte_at else None,
             }
-
-            self.server.captures.append(capture)
-            logger.info(
-                f"Captured: {provider}/{model} "
-                f"{input_tokens}in/{output_tokens}out "
-                f"prompt_msgs={len(prompt_messages)}"
+            self._capture(
+                provider, request_json, bytes(buf), is_streaming, flight.status, timing, coalesced=True,
+                content_encoding=header_value(flight.headers, "Content-Encoding"),
             )
-        except Exception as e:
-            logger.error(f"Capture extraction error: {e}")
+        return True
+
+    def _replay_cached(self, cached, is_streaming):
+        """Send a cached response to the client."""
+        self.send_response(cached.status)
+        for key, val in cached.headers:
+            self.send_header(key, val)
+        self.send_header("X-AgentPulse-Cache", "HIT")
+        self.end_headers()
+        if is_streaming:
+            # Replay SSE in chunks so clients see a stream, not one big write
+            body = cached.body
+            for i in range(0, len(body), 4096):
+                self.wfile.write(body[i:i + 4096])
+                self.wfile.flush()
+        else:
+            self.wfile.write(cached.body)
+
+    def _capture(self, provider, request_json, response_body, is_streaming, status=200, timing=None,
+                 on_done=None, **flags):
+        """Queue the raw request/response for the capture workers.
+
+        Parsing happens off the request thread, so it never adds latency for
+        the client. on_done(capture) is called by the worker afterwards.
+        """
+        job = dict(
+            provider=provider, request_json=request_json, response_body=response_body,
+            is_streaming=is_streaming, status=status, timing=timing, agent=self._agent,
+            run_hint=self._run_hint, **flags,
+        )
+        self.server.capture_pool.submit(job, on_done)
+
+
+def build_capture(provider, request_json, response_body, is_streaming, status=200, timing=None,
+                  cache_hit=False, coalesced=False, limits=None, content_encoding="", agent=None,
+                  run_hint=None) -> dict:
+    """Extract prompt/response data from a proxied call.
+
+    agent and run_hint ({"run_id", "session_id"}) say who made it, if the client said.
+    """
+    if content_encoding:
+        try:
+            response_body = decode_body(response_body, content_encoding)
+        except DecodeError as e:
+            logger.warning(f"Could not decode {content_encoding} response for capture: {e}")
+    prompt_messages = _extract_prompt(provider, request_json)
+    model = request_json.get("model", "unknown")
+    timing = timing or {}
+
+    if status >= 400:
+        response_text, input_tokens, output_tokens = None, 0, 0
+    elif is_streaming:
+        response_text, input_tokens, output_tokens = _extract_streaming_response(
+            provider, response_body
+        )
+    else:
+        response_text, input_tokens, output_tokens = _extract_response(
+            provider, response_body
+        )
+    tokens_estimated = status < 400 and not input_tokens and not output_tokens
+    if tokens_estimated:
+        # No usage block (e.g. a stream without include_usage): count the full request locally
+        system = request_json.get("system") if provider == "anthropic" else None
+        input_tokens = tokens.count_messages(request_json.get("messages") or [], model, system)
+        output_tokens = tokens.count_text(response_text, model)
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "provider": provider,
+        "model": model,
+        "prompt_messages": prompt_messages,
+        "response_text": response_text,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "tokens_estimated": tokens_estimated,
+        "status_code": status,
+        "latency_ms": timing.get("latency_ms"),
+        "ttft_ms": timing.get("ttft_ms"),
+        "queue_ms": timing.get("queue_ms"),
+        "error_body": (
+            response_body.decode("utf-8", errors="replace")[:2000] if status >= 400 else None
+        ),
+        "cache_hit": cache_hit,
+        "coalesced": coalesced,
+        "ratelimit": limits or None,
+        "agent": agent or None,
+        "run_hint": run_hint or None,
+        "claimed": False,
+    }
+
+
+class CaptureWorkerPool:
+    """A few background threads that turn raw proxied calls into captures.
+
+    The queue is bounded: when the workers can't keep up, new jobs are
+    dropped (and counted) rather than slowing down the proxy.
+    """
+
+    def __init__(self, handle, workers: int = 2, max_queue: int = 1000):
+        self._handle = handle
+        self.workers = max(1, workers)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self.dropped = 0
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"agentpulse-capture-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, job: dict, on_done=None) -> bool:
+        try:
+            self._queue.put_nowait((job, on_done))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            metrics.PROXY_CAPTURES_DROPPED.inc()
+            if self.dropped == 1 or self.dropped % 100 == 0:
+                logger.warning(f"Capture queue full, dropped capture ({self.dropped} total)")
+            return False
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def stop(self, timeout: float = 5.0):
+        """Finish queued jobs, then stop the workers."""
+        for _ in self._threads:
+            self._queue.put((None, None))
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self):
+        while True:
+            job, on_done = self._queue.get()
+            if job is None:
+                return
+            try:
+                capture = self._handle(job)
+                if on_done is not None and capture is not None:
+                    on_done(capture)
+            except Exception as e:
+                logger.error(f"Capture extraction error: {e}")
+
+
+def _charge_usage(admission, ticket, capture):
+    """Correct a request's TPM charge once its real token usage is known."""
+    used = capture["input_tokens"] + capture["output_tokens"]
+    if used:
+        admission.charge(ticket, used)
 
 
 # ─── Prompt/response extraction helpers ───
@@ -270,8 +615,10 @@ def _extract_response(provider, response_body):
     output_tokens = 0
 
     try:
-        resp = json.loads(response_body)
-    except (json.JSONDecodeError, ValueError):
+        resp = _codec.loads(response_body)
+    except _codec.DecodeError:
+        return response_text, input_tokens, output_tokens
+    if not isinstance(resp, dict):
         return response_text, input_tokens, output_tokens
 
     if provider == "anthropic":
@@ -313,8 +660,10 @@ def _extract_streaming_response(provider, response_body):
         if data == "[DONE]":
             break
         try:
-            event = json.loads(data)
-        except (json.JSONDecodeError, ValueError):
+            event = _codec.loads(data)
+        except _codec.DecodeError:
+            continue
+        if not isinstance(event, dict):
             continue
 
         if provider == "anthropic":
@@ -356,28 +705,181 @@ def _extract_streaming_response(provider, response_body):
     return "".join(text_parts), input_tokens, output_tokens
 
 
+def capture_to_event(capture: dict) -> dict:
+    """Turn a proxy capture into a complete AgentPulse event."""
+    status_code = capture.get("status_code", 200)
+    if status_code == 429:
+        status = "rate_limit"
+    elif status_code >= 400:
+        status = "error"
+    else:
+        status = "success"
+
+    model = capture["model"]
+    # Cache hits and coalesced followers never reached the provider, so they cost nothing
+    if capture.get("cache_hit") or capture.get("coalesced"):
+        cost = 0.0
+    else:
+        cost = estimate_cost(model, capture["input_tokens"], capture["output_tokens"])
+    return {
+        "timestamp": capture["timestamp"],
+        "provider": capture["provider"],
+        "model": model,
+        "input_tokens": capture["input_tokens"],
+        "output_tokens": capture["output_tokens"],
+        "cost_usd": round(cost, 6),
+        "latency_ms": capture.get("latency_ms"),
+        "ttft_ms": capture.get("ttft_ms"),
+        "queue_ms": capture.get("queue_ms"),
+        "status": status,
+        "error_message": capture.get("error_body") if status != "success" else None,
+        "task_context": None,
+        "tools_used": [],
+        "prompt_messages": capture["prompt_messages"],
+        "response_text": capture["response_text"] or None,
+        "cache_hit": bool(capture.get("cache_hit")),
+        "coalesced": bool(capture.get("coalesced")),
+        "tokens_estimated": bool(capture.get("tokens_estimated")),
+        "ratelimit": capture.get("ratelimit"),
+        "agent": capture.get("agent"),
+        "run_hint": capture.get("run_hint"),
+    }
+
+
 # ─── Server wrapper ───
 
 
+class _ReusePortHTTPServer(http.server.ThreadingHTTPServer):
+    """Listener that shares its port with the other proxy worker processes."""
+
+    def server_bind(self):
+        proxy_workers.reuse_port(self.socket)
+        super().server_bind()
+
+
+class _UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    """Proxy listener on an already bound and listening Unix socket."""
+
+    daemon_threads = True
+
+    def __init__(self, sock, handler):
+        super().__init__(sock.getsockname(), handler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock
+
+
+def parse_socket_mode(mode) -> int:
+    """File mode for the proxy socket: an int, or an octal string like "660"."""
+    if isinstance(mode, str):
+        return int(mode, 8)
+    return int(mode)
+
+
+def bind_unix_socket(path: str, mode: int = 0o600) -> socket.socket:
+    """Listen on a Unix socket at path, replacing a stale socket file."""
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.bind(path)
+        os.chmod(path, mode)
+        sock.listen(socketserver.UnixStreamServer.request_queue_size)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
 class LLMProxyServer:
-    """Manages the LLM API proxy server in a background thread."""
+    """Manages the LLM API proxy server in a background thread.
 
-    def __init__(self, port=8787):
+    By default captures go into a small ring that the log-tail daemon
+    claims on each "prompt end" line. With emit_events=True every capture
+    is turned into a complete event right away and queued on a bounded
+    queue for drain_events(); nothing depends on the logs any more.
+
+    With workers > 1 (and SO_REUSEPORT available) the proxy runs as that
+    many forked processes sharing the port; see proxy_workers.
+
+    socket_path adds a Unix socket listener (permissions from socket_mode),
+    alongside TCP or, with tcp=False, instead of it.
+    """
+
+    def __init__(self, port=8787, providers=None, emit_events=False, event_queue_size=10000, cache=None,
+                 flights=None, admission=None, hedge=None, capture_workers=2, capture_queue_size=1000, workers=1,
+                 socket_path=None, socket_mode=0o600, tcp=True):
         self.port = port
+        self.workers = workers
+        self.socket_path = socket_path
+        self.socket_mode = socket_mode
+        self.tcp = tcp
+        self.providers = dict(providers or PROVIDERS)
+        self.cache = cache
+        self.flights = flights
+        self.admission = admission
+        self.hedge = hedge
         self.captures = deque(maxlen=200)
+        self.emit_events = emit_events
+        self.events = queue.Queue(maxsize=event_queue_size)
+        self.events_dropped = 0
+        self.capture_pool = CaptureWorkerPool(self._process_capture, capture_workers, capture_queue_size)
         self.server = None
-        self.thread = None
+        self.unix_server = None
+        self.threads = []
+        self.supervisor = None
+        self._unix_sock = None
+
+    def _make_servers(self, reuse_port=False) -> list:
+        """Build the TCP and/or Unix socket servers for this process."""
+        servers = []
+        if self.tcp:
+            server_class = _ReusePortHTTPServer if reuse_port else http.server.ThreadingHTTPServer
+            self.server = self._configure(server_class(("127.0.0.1", self.port), ProxyHandler))
+            self.port = self.server.server_address[1]
+            servers.append(self.server)
+        if self._unix_sock is not None:
+            self.unix_server = self._configure(_UnixHTTPServer(self._unix_sock, ProxyHandler))
+            servers.append(self.unix_server)
+        return servers
+
+    def _configure(self, server):
+        server.captures = self.captures
+        server.providers = self.providers
+        server.emit_events = self.emit_events
+        server.cache = self.cache
+        server.flights = self.flights
+        server.admission = self.admission
+        server.hedge = self.hedge
+        server.capture_pool = self.capture_pool
+        return server
 
     def start(self):
-        """Start proxy server in a daemon thread."""
-        self.server = http.server.ThreadingHTTPServer(
-            ("127.0.0.1", self.port), ProxyHandler
-        )
-        self.server.captures = self.captures
-
-        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
-        self.thread.start()
-
+        """Start proxy server in daemon threads (or in worker processes)."""
+        if not self.tcp and not self.socket_path:
+            raise ValueError("proxy needs a TCP port or a Unix socket path")
+        if self.socket_path:
+            # Bound here so forked workers inherit and share one listener
+            self._unix_sock = bind_unix_socket(self.socket_path, self.socket_mode)
+        if self.workers > 1 and not proxy_workers.supported():
+            logger.warning("proxy_workers needs fork() and SO_REUSEPORT; running a single proxy process")
+        if self.workers > 1 and proxy_workers.supported():
+            self.supervisor = proxy_workers.WorkerSupervisor(self, self.workers)
+            self.supervisor.start()
+        else:
+            servers = self._make_servers()
+            self.capture_pool.start()
+            for server in servers:
+                thread = threading.Thread(target=server.serve_forever, daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+        if self.socket_path:
+            logger.info(f"LLM proxy listening on unix:{self.socket_path}")
+        if not self.tcp:
+            return
         logger.info(f"LLM proxy listening on http://127.0.0.1:{self.port}")
         logger.info(
             "Configure provider base URLs to route through proxy, e.g.:"
@@ -389,11 +891,108 @@ class LLMProxyServer:
             f"  OPENAI_BASE_URL=http://127.0.0.1:{self.port}/openai"
         )
 
+    @classmethod
+    def from_config(cls, config: dict) -> "LLMProxyServer":
+        """Build a proxy from the agentpulse config settings."""
+        cache = None
+        if config.get("proxy_cache"):
+            cache = ResponseCache(
+                ttl=config.get("proxy_cache_ttl", 86400),
+                max_bytes=int(config.get("proxy_cache_max_mb", 64) * 1024 * 1024),
+                disk_dir=config.get("proxy_cache_dir") or None,
+                disk_max_bytes=int(config.get("proxy_cache_disk_max_mb", 512) * 1024 * 1024),
+            )
+        flights = None
+        if config.get("proxy_coalesce"):
+            flights = SingleFlight(deterministic_only=not config.get("proxy_coalesce_all", False))
+        admission = None
+        if config.get("proxy_limits"):
+            admission = AdmissionController(
+                config["proxy_limits"],
+                queue_timeout=config.get("proxy_queue_timeout", 60),
+                max_queue=config.get("proxy_queue_max", 1000),
+            )
+        providers = dict(PROVIDERS)
+        providers.update(config.get("proxy_upstreams") or {})
+        hedge = None
+        if config.get("proxy_hedge"):
+            hedge = HedgePolicy(
+                delay_ms=config.get("proxy_hedge_delay_ms") or None,
+                percentile=config.get("proxy_hedge_percentile", 95),
+            )
+        return cls(
+            port=config.get("proxy_port", 8787),
+            providers=providers,
+            emit_events=bool(config.get("proxy_events")),
+            cache=cache,
+            flights=flights,
+            admission=admission,
+            hedge=hedge,
+            capture_workers=config.get("proxy_capture_workers", 2),
+            capture_queue_size=config.get("proxy_capture_queue", 1000),
+            workers=config.get("proxy_workers", 1),
+            socket_path=config.get("proxy_socket") or None,
+            socket_mode=parse_socket_mode(config.get("proxy_socket_mode", "600")),
+            tcp=config.get("proxy_tcp", True),
+        )
+
     def stop(self):
         """Stop the proxy server."""
-        if self.server:
-            self.server.shutdown()
-            logger.info("LLM proxy stopped")
+        if self.supervisor:
+            self.supervisor.stop()
+            self.supervisor = None
+        elif self.threads:
+            for server in (self.server, self.unix_server):
+                if server is not None:
+                    server.shutdown()
+                    server.server_close()
+            self.capture_pool.stop()
+            self.threads = []
+        else:
+            return
+        if self._unix_sock is not None:
+            self._unix_sock.close()
+            self._unix_sock = None
+            try:
+                os.unlink(self.socket_path)
+            except FileNotFoundError:
+                pass
+        logger.info("LLM proxy stopped")
+
+    def _process_capture(self, job: dict) -> dict:
+        """Worker side of a capture: parse, then store or emit it."""
+        capture = build_capture(**job)
+        self._on_capture(capture)
+        metrics.PROXY_CAPTURES.labels(capture["provider"]).inc()
+        logger.info(
+            f"Captured: {capture['provider']}/{capture['model']} "
+            f"{capture['input_tokens']}in/{capture['output_tokens']}out "
+            f"prompt_msgs={len(capture['prompt_messages'])}"
+            f"{' (cache hit)' if capture['cache_hit'] else ''}"
+            f"{' (coalesced)' if capture['coalesced'] else ''}"
+        )
+        return capture
+
+    def _on_capture(self, capture):
+        if not self.emit_events:
+            self.captures.append(capture)
+            return
+        try:
+            self.events.put_nowait(capture_to_event(capture))
+        except queue.Full:
+            self.events_dropped += 1
+            metrics.PROXY_EVENTS_DROPPED.inc()
+            logger.warning(f"Proxy event queue full, dropped event ({self.events_dropped} total)")
+
+    def drain_events(self, max_events=None) -> list:
+        """Take all queued proxy events (emit_events mode)."""
+        drained = []
+        while max_events is None or len(drained) < max_events:
+            try:
+                drained.append(self.events.get_nowait())
+            except queue.Empty:
+                break
+        return drained
 
     def get_latest_capture(self):
         """Get the oldest unclaimed capture (FIFO order), or None.
@@ -0,0 +1,393 @@
+"""Multi-process proxy workers sharing one port with SO_REUSEPORT.
+
+A single proxy process is limited to about one core (TLS, JSON, SSE relay
+all hold the GIL). With proxy_workers: N the daemon forks N proxy
+processes that each bind 127.0.0.1:proxy_port with SO_REUSEPORT, so the
+kernel spreads incoming connections across them. A proxy_socket listener
+is bound once by the parent and accepted on by every worker.
+
+Workers send length-prefixed frames to the parent over a socketpair:
+
+- a ready frame once their listeners are bound (start() waits for these)
+- captures, which the parent feeds into the usual capture ring / event
+  queue, so the daemon doesn't care how many workers there are
+- metric deltas (counters, gauges and histograms changed since the last
+  frame, every METRICS_INTERVAL seconds), merged into the parent's metrics
+  so its /metrics covers every worker
+- rate-limit snapshots, replayed into the parent's ratelimit.TRACKER
+
+One reader thread reads every channel. One supervisor thread forks the
+workers and respawns any that die; it forks while holding the reader's
+lock, so the child never inherits a half-delivered frame.
+
+Per-process state is not shared: the memory cache tier, admission limits
+and coalescing are per worker. A worker that dies loses up to
+METRICS_INTERVAL of metric updates; its gauge contributions are removed.
+"""
+
+import functools
+import logging
+import os
+import selectors
+import signal
+import socket
+import struct
+import threading
+import time
+
+from . import _codec, metrics, ratelimit
+
+logger = logging.getLogger("agentpulse.proxy")
+
+_FRAME = struct.Struct("!IB")  # payload size, kind
+CAPTURE, METRICS, RATELIMIT, READY = 0, 1, 2, 3
+START_TIMEOUT = 10.0  # seconds start() waits for the workers to be listening
+RESPAWN_BACKOFF = 1.0  # seconds between respawns of the same worker
+METRICS_INTERVAL = 1.0  # seconds between metric frames from a worker
+
+# Last-reported provider values: forwarded as rate-limit snapshots, not summed
+_NOT_SUMMED = {metrics.RATELIMIT_REMAINING.name, metrics.RATELIMIT_LIMIT.name, metrics.RATELIMIT_RETRY_AFTER.name}
+
+
+def supported() -> bool:
+    return hasattr(os, "fork") and hasattr(socket, "SO_REUSEPORT")
+
+
+def reuse_port(sock: socket.socket):
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+
+class _ChannelSender:
+    """Worker side of the channel (shared by the capture and metrics threads)."""
+
+    def __init__(self, sock: socket.socket):
+        self._sock = sock
+        self._lock = threading.Lock()
+
+    def send(self, kind: int, obj):
+        payload = _codec.dumps(obj)
+        with self._lock:
+            self._sock.sendall(_FRAME.pack(len(payload), kind) + payload)
+
+
+class _Worker:
+    __slots__ = ("index", "pid", "channel", "buffer", "started_at", "gauges", "listening")
+
+    def __init__(self, index, pid, channel):
+        self.index = index
+        self.pid = pid
+        self.channel = channel
+        self.buffer = bytearray()
+        self.started_at = time.monotonic()
+        self.gauges: dict[tuple, float] = {}  # (metric name, labels) -> this worker's share
+        self.listening = threading.Event()
+
+
+class WorkerSupervisor:
+    """Forks, watches and respawns the proxy worker processes."""
+
+    def __init__(self, proxy, workers: int):
+        self.proxy = proxy
+        self.count = workers
+        self.workers: dict[int, _Worker] = {}  # index -> worker
+        self.restarts = 0
+        self._reservation = None
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()  # held by the reader while delivering, and around fork()
+        self._stopping = threading.Event()
+        self._ready = threading.Event()
+        self._threads = []
+        self._metrics = {metric.name: metric for metric in metrics.REGISTRY}
+
+    def start(self):
+        if self.proxy.tcp:
+            # Hold the port with a bound (not listening) socket so port 0 works
+            # and the port can't be taken by someone else between respawns.
+            self._reservation = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            reuse_port(self._reservation)
+            self._reservation.bind(("127.0.0.1", self.proxy.port))
+            self.proxy.port = self._reservation.getsockname()[1]
+
+        for target, name in ((self._read_loop, "reader"), (self._supervise_loop, "supervisor")):
+            thread = threading.Thread(target=target, daemon=True, name=f"agentpulse-proxy-{name}")
+            thread.start()
+            self._threads.append(thread)
+        self._ready.wait()
+        deadline = time.monotonic() + START_TIMEOUT
+        with self._lock:
+            workers = list(self.workers.values())
+        for worker in workers:
+            if not worker.listening.wait(max(0.0, deadline - time.monotonic())):
+                logger.warning(f"Proxy worker {worker.index} (pid {worker.pid}) not listening yet")
+        logger.info(f"Started {self.count} proxy worker processes")
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        with self._lock:
+            workers = list(self.workers.values())
+        for worker in workers:
+            try:
+                os.kill(worker.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + timeout
+        for worker in workers:
+            while not self._reap(worker.pid):
+                if time.monotonic() > deadline:
+                    os.kill(worker.pid, signal.SIGKILL)
+                    os.waitpid(worker.pid, 0)
+                    break
+                time.sleep(0.02)
+        for thread in self._threads:
+            thread.join(timeout)
+        # Frames sent before the workers exited; the reader has stopped
+        for key in list(self._selector.get_map().values()):
+            self._drain(key.data)
+            self._close(key.data)
+        self._selector.close()
+        if self._reservation is not None:
+            self._reservation.close()
+
+    def pids(self) -> list:
+        with self._lock:
+            return [w.pid for w in self.workers.values()]
+
+    # ── parent side ──
+
+    def _spawn(self, index):
+        parent_sock, child_sock = socket.socketpair()
+        with self._io_lock:
+            pid = os.fork()
+        if pid == 0:  # pragma: no cover - runs in the child
+            parent_sock.close()
+            code = 0
+            try:
+                _worker_main(self.proxy, child_sock, [key.fileobj for key in self._selector.get_map().values()])
+            except BaseException as e:
+                logger.error(f"Proxy worker {index} crashed: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+
+        child_sock.close()
+        worker = _Worker(index, pid, parent_sock)
+        parent_sock.setblocking(False)
+        with self._lock:
+            self.workers[index] = worker
+        self._selector.register(parent_sock, selectors.EVENT_READ, worker)
+        logger.debug(f"Proxy worker {index} started (pid {pid})")
+
+    @staticmethod
+    def _reap(pid) -> bool:
+        try:
+            done, _ = os.waitpid(pid, os.WNOHANG)
+        except ChildProcessError:
+            return True
+        return done == pid
+
+    def _supervise_loop(self):
+        # The only thread that forks, first the initial workers, then replacements
+        for index in range(self.count):
+            self._spawn(index)
+        self._ready.set()
+        while not self._stopping.wait(0.2):
+            with self._lock:
+                workers = list(self.workers.values())
+            for worker in workers:
+                if self._stopping.is_set() or not self._reap(worker.pid):
+                    continue
+                logger.warning(f"Proxy worker {worker.index} (pid {worker.pid}) exited, respawning")
+                # Don't spin if a worker dies right after starting
+                time.sleep(max(0.0, RESPAWN_BACKOFF - (time.monotonic() - worker.started_at)))
+                if self._stopping.is_set():
+                    return
+                self.restarts += 1
+                metrics.PROXY_WORKER_RESTARTS.inc()
+                self._spawn(worker.index)
+
+    def _close(self, worker):
+        """Stop reading a worker whose channel is done, taking its share out of the gauges."""
+        try:
+            self._selector.unregister(worker.channel)
+        except (KeyError, ValueError):
+            pass
+        worker.channel.close()
+        for (name, labels), value in worker.gauges.items():
+            self._metrics[name].labels(*labels).merge(-value)  # its in-flight requests are gone
+        worker.gauges.clear()
+
+    def _read_loop(self):
+        while not self._stopping.is_set():
+            try:
+                ready = self._selector.select(timeout=0.2)
+            except (OSError, ValueError):
+                continue
+            for key, _ in ready:
+                with self._io_lock:
+                    if self._drain(key.data):
+                        self._close(key.data)
+
+    def _drain(self, worker) -> bool:
+        """Read whatever the worker has sent and hand complete frames on. True at end of stream."""
+        sock = worker.channel
+        if sock.fileno() < 0:
+            return False
+        closed = False
+        while True:
+            try:
+                data = sock.recv(65536)
+            except OSError:  # includes BlockingIOError: nothing more for now
+                break
+            if not data:
+                closed = True
+                break
+            worker.buffer += data
+        self._deliver(worker)
+        return closed
+
+    def _deliver(self, worker):
+        buf = worker.buffer
+        while len(buf) >= _FRAME.size:
+            size, kind = _FRAME.unpack_from(buf)
+            if len(buf) < _FRAME.size + size:
+                break
+            payload = bytes(buf[_FRAME.size:_FRAME.size + size])
+            del buf[:_FRAME.size + size]
+            try:
+                obj = _codec.loads(payload)
+            except _codec.DecodeError as e:
+                logger.warning(f"Bad frame from proxy worker {worker.index}: {e}")
+                continue
+            if kind == CAPTURE:
+                self.proxy._on_capture(obj)
+            elif kind == METRICS:
+                self._merge_metrics(worker, obj)
+            elif kind == RATELIMIT:
+                ratelimit.TRACKER.observe(obj["provider"], obj["key"], obj["snapshot"], obj["ts"])
+            elif kind == READY:
+                worker.listening.set()
+
+    def _merge_metrics(self, worker, deltas: dict):
+        for name, samples in deltas.items():
+            metric = self._metrics.get(name)
+            if metric is None:
+                continue
+            for labels, delta in samples:
+                metric.labels(*labels).merge(delta)
+                if metric.kind == "gauge":
+                    key = (name, tuple(labels))
+                    worker.gauges[key] = worker.gauges.get(key, 0) + delta
+
+
+# ── worker side ──
+
+
+class _MetricsForwarder:
+    """Sends the worker's metric changes to the parent every METRICS_INTERVAL."""
+
+    def __init__(self, sender: _ChannelSender):
+        self._sender = sender
+        # Values inherited from the parent at fork time are the parent's own
+        self._sent = self._values()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="agentpulse-proxy-metrics")
+        self._thread.start()
+
+    @staticmethod
+    def _values() -> dict:
+        return {
+            (metric.name, key): child.get()
+            for metric in metrics.REGISTRY if metric.name not in _NOT_SUMMED
+            for key, child in list(metric._children.items())
+        }
+
+    def flush(self):
+        deltas: dict = {}
+        for (name, key), value in self._values().items():
+            previous = self._sent.get((name, key))
+            if isinstance(value, list):
+                delta = [v - p for v, p in zip(value, previous)] if previous else value
+                changed = any(delta)
+            else:
+                delta = value - (previous or 0)
+                changed = delta != 0
+            if changed:
+                deltas.setdefault(name, []).append([list(key), delta])
+                self._sent[(name, key)] = value
+        if deltas:
+            self._sender.send(METRICS, deltas)
+
+    def _run(self):
+        while not self._stop.wait(METRICS_INTERVAL):
+            try:
+                self.flush()
+            except OSError:
+                return
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=METRICS_INTERVAL * 2)
+        self.flush()
+
+
+class _ForwardingTracker(ratelimit.HeadroomTracker):
+    """The worker's rate-limit tracker, also replaying each snapshot to the parent."""
+
+    def __init__(self, sender: _ChannelSender, history: int):
+        super().__init__(history)
+        self._sender = sender
+
+    def observe(self, provider: str, key: str, snapshot: dict, ts: float = None):
+        if not snapshot:
+            return
+        ts = ts if ts is not None else time.time()
+        super().observe(provider, key, snapshot, ts)
+        try:
+            self._sender.send(RATELIMIT, {"provider": provider, "key": key, "snapshot": snapshot, "ts": ts})
+        except OSError:
+            pass
+
+
+def _reinit_after_fork():  # pragma: no cover - runs in the child
+    """Fresh locks for everything the child uses that a parent thread may have held mid-fork."""
+    metrics._fold_lock = threading.Lock()
+    for metric in metrics.REGISTRY:
+        metric._lock = threading.Lock()
+    loggers = [logging.getLogger()] + [
+        logger_ for logger_ in logging.Logger.manager.loggerDict.values() if isinstance(logger_, logging.Logger)
+    ]
+    for logger_ in loggers:
+        for handler in logger_.handlers:
+            handler.createLock()
+
+
+def _worker_main(proxy, channel, inherited):  # pragma: no cover - runs in the child
+    _reinit_after_fork()
+    for sock in inherited:
+        sock.close()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent decides when we stop
+
+    sender = _ChannelSender(channel)
+    proxy._on_capture = functools.partial(sender.send, CAPTURE)
+    ratelimit.TRACKER = _ForwardingTracker(sender, ratelimit.TRACKER.history)
+    forwarder = _MetricsForwarder(sender)
+    # The TCP listener is per worker (SO_REUSEPORT); a Unix socket listener
+    # was bound by the parent and is shared by all workers.
+    servers = proxy._make_servers(reuse_port=True)
+    proxy.capture_pool.start()
+    sender.send(READY, None)
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    while not stopping.wait(0.5):
+        pass
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+    proxy.capture_pool.stop()
+    forwarder.stop()
+    channel.close()
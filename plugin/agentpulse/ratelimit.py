@@ -0,0 +1,206 @@
+"""Rate-limit headroom from provider response headers.
+
+Providers report how much of their rate limit is left on every response:
+
+  OpenAI-style     x-ratelimit-{limit,remaining,reset}-{requests,tokens}
+  Anthropic        anthropic-ratelimit-{requests,tokens,input-tokens,output-tokens}-{limit,remaining,reset}
+  everyone (429s)  retry-after / retry-after-ms
+
+parse_headers() folds these into one flat snapshot:
+
+    {"requests_limit": 500, "requests_remaining": 499, "requests_reset_s": 0.12,
+     "tokens_limit": 30000, "tokens_remaining": 29000, "tokens_reset_s": 2.0,
+     "retry_after_s": None}
+
+HeadroomTracker keeps the latest snapshot and a short time series per
+(provider, key), and mirrors the remaining/limit values into gauges on the
+/metrics endpoint. API keys are never stored — only a short hash.
+"""
+
+import hashlib
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from . import metrics
+
+RESOURCES = ("requests", "tokens", "input_tokens", "output_tokens")
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+_HOST_PROVIDERS = (
+    ("anthropic", "anthropic"),
+    ("openai", "openai"),
+    ("minimax", "minimax"),
+    ("deepseek", "deepseek"),
+    ("groq", "groq"),
+    ("together", "together"),
+    ("fireworks", "fireworks"),
+    ("mistral", "mistral"),
+    ("googleapis", "google"),
+    ("x.ai", "xai"),
+)
+
+
+def _parse_number(value) -> Optional[float]:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return int(number) if number.is_integer() else number
+
+
+def _parse_reset(value: str, now: float) -> Optional[float]:
+    """Seconds until a limit resets: '1s', '6m0s', '20ms', or an RFC 3339 timestamp."""
+    value = value.strip()
+    number = _parse_number(value)
+    if number is not None:
+        return float(number)
+    parts = _DURATION_RE.findall(value)
+    if parts and "".join(n + u for n, u in parts) == value:
+        return sum(float(n) * _DURATION_UNITS[u] for n, u in parts)
+    try:
+        reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if reset_at.tzinfo is None:
+        reset_at = reset_at.replace(tzinfo=timezone.utc)
+    return max(0.0, reset_at.timestamp() - now)
+
+
+def _parse_retry_after(value: str, now: float) -> Optional[float]:
+    number = _parse_number(value)
+    if number is not None:
+        return float(number)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - now)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_headers(headers) -> dict:
+    """Extract a rate-limit snapshot from response headers (mapping or pairs).
+
+    Returns {} if the response carried no rate-limit information.
+    """
+    items = headers.items() if hasattr(headers, "items") else headers
+    now = time.time()
+    snapshot = {}
+    retry_after = None
+    for name, value in items:
+        name = name.lower()
+        if name.startswith("x-ratelimit-"):
+            # x-ratelimit-remaining-requests
+            field, _, resource = name[len("x-ratelimit-"):].partition("-")
+        elif name.startswith("anthropic-ratelimit-"):
+            # anthropic-ratelimit-input-tokens-remaining
+            resource, _, field = name[len("anthropic-ratelimit-"):].rpartition("-")
+        elif name == "retry-after-ms":
+            number = _parse_number(value)
+            if number is not None:
+                retry_after = number / 1000
+            continue
+        elif name == "retry-after" and retry_after is None:
+            retry_after = _parse_retry_after(value, now)
+            continue
+        else:
+            continue
+
+        resource = resource.replace("-", "_")
+        if resource not in RESOURCES:
+            continue
+        if field == "reset":
+            parsed = _parse_reset(value, now)
+            field = "reset_s"
+        elif field in ("limit", "remaining"):
+            parsed = _parse_number(value)
+        else:
+            continue
+        if parsed is not None:
+            snapshot[f"{resource}_{field}"] = parsed
+
+    if retry_after is not None:
+        snapshot["retry_after_s"] = retry_after
+    return snapshot
+
+
+def key_id(credential: Optional[str]) -> str:
+    """Short, non-reversible label for an API key."""
+    if not credential:
+        return "none"
+    return hashlib.sha256(credential.encode("utf-8")).hexdigest()[:12]
+
+
+def provider_from_host(host: str) -> str:
+    host = (host or "").lower()
+    for needle, provider in _HOST_PROVIDERS:
+        if needle in host:
+            return provider
+    return host or "unknown"
+
+
+class HeadroomTracker:
+    """Latest rate-limit snapshot and a bounded history per (provider, key)."""
+
+    def __init__(self, history: int = 360):
+        self.history = history
+        self._latest: dict[tuple, dict] = {}
+        self._series: dict[tuple, deque] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, provider: str, key: str, snapshot: dict, ts: float = None):
+        if not snapshot:
+            return
+        ts = ts if ts is not None else time.time()
+        scope = (provider, key)
+        with self._lock:
+            self._latest[scope] = {**snapshot, "observed_at": ts}
+            series = self._series.get(scope)
+            if series is None:
+                series = self._series[scope] = deque(maxlen=self.history)
+            series.append((ts, snapshot))
+
+        for resource in RESOURCES:
+            remaining = snapshot.get(f"{resource}_remaining")
+            if remaining is not None:
+                metrics.RATELIMIT_REMAINING.labels(provider, key, resource).set(remaining)
+            limit = snapshot.get(f"{resource}_limit")
+            if limit is not None:
+                metrics.RATELIMIT_LIMIT.labels(provider, key, resource).set(limit)
+        if "retry_after_s" in snapshot:
+            metrics.RATELIMIT_RETRY_AFTER.labels(provider, key).set(snapshot["retry_after_s"])
+
+    def latest(self, provider: str = None, key: str = None) -> dict:
+        """Latest snapshots as {"provider/key": snapshot}, optionally filtered."""
+        with self._lock:
+            return {
+                f"{p}/{k}": dict(snap)
+                for (p, k), snap in self._latest.items()
+                if (provider is None or p == provider) and (key is None or k == key)
+            }
+
+    def series(self, provider: str, key: str) -> list:
+        """[(timestamp, snapshot), ...] oldest first."""
+        with self._lock:
+            return list(self._series.get((provider, key), ()))
+
+    def headroom(self, provider: str, key: str) -> Optional[float]:
+        """Smallest remaining/limit ratio across resources, or None if unknown."""
+        with self._lock:
+            snap = self._latest.get((provider, key))
+        if not snap:
+            return None
+        ratios = [
+            snap[f"{r}_remaining"] / snap[f"{r}_limit"]
+            for r in RESOURCES
+            if snap.get(f"{r}_limit") and snap.get(f"{r}_remaining") is not None
+        ]
+        return min(ratios) if ratios else None
+
+
+TRACKER = HeadroomTracker()
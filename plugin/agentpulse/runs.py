@@ -0,0 +1,250 @@
+"""Bounded per-run state for the log-tail daemon.
+
+OpenClaw only tells us a run is over when it logs "embedded run done".
+Aborted or crashed runs never do, so the daemon can't rely on that line
+alone to clean up. RunStateTable keeps runs in an OrderedDict ordered by
+last activity, which gives us:
+
+  - O(1) lookup of the most recently active run (for tool errors, which
+    don't carry a runId)
+  - O(evicted) TTL expiry by walking from the least recently active end
+  - a hard cap on the number of tracked runs
+
+Each run also carries a small span tree built from the log timestamps:
+
+  run (run_start … run_done)
+   └─ prompt segments (… prompt end, durationMs)
+       └─ tool calls (tool start … tool end, keyed by toolCallId)
+
+which lets the daemon split every prompt into LLM, tool and idle time.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+logger = logging.getLogger("agentpulse")
+
+DEFAULT_RUN_TTL = 3600  # seconds without activity before a run is dropped
+DEFAULT_MAX_RUNS = 1000
+MAX_SEGMENTS_PER_RUN = 200  # older segments are folded into the run totals
+
+
+def _new_run() -> dict:
+    return {
+        "tools": set(),
+        "errors": [],
+        "model": None,
+        "provider": None,
+        # Span tracking (timestamps are epoch seconds from the log lines)
+        "started_at": None,
+        "last_segment_end": None,
+        "open_tools": {},   # toolCallId -> (tool, start)
+        "tool_spans": [],   # finished in the current segment: (tool, toolCallId, start, end)
+        "segments": [],
+        "prompt_count": 0,
+        "totals": {"llm_ms": 0, "tool_ms": 0, "idle_ms": 0},
+    }
+
+
+def parse_log_timestamp(value) -> Optional[float]:
+    """Convert an OpenClaw ISO-8601 timestamp to epoch seconds."""
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def start_tool(run: dict, tool: str, tool_call_id: str, ts: Optional[float]):
+    """Open a tool span."""
+    if ts is not None:
+        run["open_tools"][tool_call_id] = (tool, ts)
+
+
+def end_tool(run: dict, tool_call_id: str, ts: Optional[float]) -> Optional[float]:
+    """Close a tool span. Returns its duration in ms, or None if it wasn't open."""
+    opened = run["open_tools"].pop(tool_call_id, None)
+    if opened is None or ts is None:
+        return None
+    tool, start = opened
+    end = max(ts, start)
+    run["tool_spans"].append((tool, tool_call_id, start, end))
+    return (end - start) * 1000
+
+
+def _union_ms(intervals) -> float:
+    """Total length of the union of (start, end) intervals, in ms."""
+    total = 0.0
+    cur_start = cur_end = None
+    for start, end in sorted(intervals):
+        if cur_end is None or start > cur_end:
+            if cur_end is not None:
+                total += cur_end - cur_start
+            cur_start, cur_end = start, end
+        elif end > cur_end:
+            cur_end = end
+    if cur_end is not None:
+        total += cur_end - cur_start
+    return total * 1000
+
+
+def close_segment(run: dict, end_ts: Optional[float], duration_ms: int) -> tuple[list, dict]:
+    """Close the current prompt segment.
+
+    Returns (tool_timings, latency_breakdown) for the segment:
+      tool_timings       [{"tool", "tool_call_id", "duration_ms"}, ...]
+      latency_breakdown  {"llm_ms", "tool_ms", "idle_ms"}
+
+    Tool time is the union of tool spans inside the segment (parallel tool
+    calls aren't double counted); LLM time is the rest of the segment; idle
+    time is the gap since the previous segment (or the run start).
+    """
+    spans = run["tool_spans"]
+    run["tool_spans"] = []
+    tool_timings = [
+        {"tool": tool, "tool_call_id": call_id, "duration_ms": int((end - start) * 1000)}
+        for tool, call_id, start, end in spans
+    ]
+
+    if end_ts is None:
+        tool_ms = min(sum(t["duration_ms"] for t in tool_timings), duration_ms)
+        idle_ms = 0
+        seg_start = None
+    else:
+        seg_start = end_ts - duration_ms / 1000
+        # Tools still running at segment end count up to the end of the segment
+        intervals = [(s, e) for _, _, s, e in spans]
+        intervals += [(s, end_ts) for _, s in run["open_tools"].values()]
+        clipped = [(max(s, seg_start), min(e, end_ts)) for s, e in intervals]
+        tool_ms = min(_union_ms([(s, e) for s, e in clipped if e > s]), duration_ms)
+        prev_end = run["last_segment_end"] or run["started_at"]
+        idle_ms = max(0, (seg_start - prev_end) * 1000) if prev_end else 0
+        run["last_segment_end"] = end_ts
+
+    breakdown = {
+        "llm_ms": int(duration_ms - tool_ms),
+        "tool_ms": int(tool_ms),
+        "idle_ms": int(idle_ms),
+    }
+    totals = run["totals"]
+    for key, value in breakdown.items():
+        totals[key] += value
+    run["prompt_count"] += 1
+
+    run["segments"].append({
+        "start": seg_start,
+        "end": end_ts,
+        "tools": tool_timings,
+        "breakdown": breakdown,
+    })
+    if len(run["segments"]) > MAX_SEGMENTS_PER_RUN:
+        del run["segments"][0]
+
+    return tool_timings, breakdown
+
+
+def run_breakdown(run: dict, wall_ms: int) -> dict:
+    """Split a finished run's wall time into LLM, tool and idle time."""
+    totals = run["totals"]
+    llm_ms = min(totals["llm_ms"], wall_ms)
+    tool_ms = min(totals["tool_ms"], wall_ms - llm_ms)
+    return {
+        "wall_ms": wall_ms,
+        "llm_ms": llm_ms,
+        "tool_ms": tool_ms,
+        "idle_ms": max(0, wall_ms - llm_ms - tool_ms),
+        "prompts": run["prompt_count"],
+    }
+
+
+class RunStateTable:
+    """Per-run tracking state with TTL and size-based eviction."""
+
+    def __init__(self, ttl: float = DEFAULT_RUN_TTL, max_runs: int = DEFAULT_MAX_RUNS, clock=time.monotonic):
+        if max_runs < 1:
+            raise ValueError(f"max_runs must be at least 1, got {max_runs}")
+        self.ttl = ttl
+        self.max_runs = max_runs
+        self._clock = clock
+        self._runs: "OrderedDict[str, dict]" = OrderedDict()
+        self._last_seen: dict[str, float] = {}
+
+        # Metrics
+        self.evicted_ttl = 0
+        self.evicted_size = 0
+        self.orphaned = 0  # evicted runs that still held unreported tools/errors
+        self.completed = 0
+
+    def __len__(self):
+        return len(self._runs)
+
+    def __contains__(self, run_id):
+        return run_id in self._runs
+
+    def get(self, run_id: str) -> dict:
+        """Get or create the state for run_id and mark it as most recent."""
+        run = self._runs.get(run_id)
+        if run is None:
+            run = self._runs[run_id] = _new_run()
+            if len(self._runs) > self.max_runs:
+                self._evict_oldest()
+        else:
+            self._runs.move_to_end(run_id)
+        self._last_seen[run_id] = self._clock()
+        return run
+
+    def most_recent(self) -> Optional[dict]:
+        """Return the most recently active run, or None if there are none."""
+        if not self._runs:
+            return None
+        return self._runs[next(reversed(self._runs))]
+
+    def pop(self, run_id: str) -> Optional[dict]:
+        """Remove a finished run."""
+        self._last_seen.pop(run_id, None)
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            self.completed += 1
+        return run
+
+    def expire(self) -> int:
+        """Drop runs idle for longer than the TTL. Returns how many were dropped."""
+        if not self._runs:
+            return 0
+        cutoff = self._clock() - self.ttl
+        dropped = 0
+        while self._runs:
+            run_id = next(iter(self._runs))
+            if self._last_seen[run_id] > cutoff:
+                break
+            self._drop(run_id)
+            self.evicted_ttl += 1
+            dropped += 1
+        if dropped:
+            logger.info(f"Expired {dropped} idle run(s) (tracking {len(self._runs)})")
+        return dropped
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self._runs),
+            "completed": self.completed,
+            "evicted_ttl": self.evicted_ttl,
+            "evicted_size": self.evicted_size,
+            "orphaned": self.orphaned,
+        }
+
+    def _evict_oldest(self):
+        run_id = next(iter(self._runs))
+        self._drop(run_id)
+        self.evicted_size += 1
+        logger.warning(f"Run table full ({self.max_runs}), evicted oldest run {run_id}")
+
+    def _drop(self, run_id: str):
+        run = self._runs.pop(run_id)
+        del self._last_seen[run_id]
+        if run["tools"] or run["errors"]:
+            self.orphaned += 1
@@ -7,54 +7,273 @@ Usage:
     agentpulse.auto_instrument()
 
     # All OpenAI / Anthropic / MiniMax calls are now tracked automatically.
+
+Processes hosting several agents create one AgentPulse client per agent;
+calls made inside `with client.scope():` are reported under that agent.
+
+This module runs in every process started by `agentpulse run`, so it keeps
+its import cheap: the config file (YAML), the HTTP stack, the JSON codec and
+the metrics registry are imported when first needed, not here.
 """
 
-import json
+import abc
+import contextlib
+import contextvars
+import operator
+import os
+import sys
 import time
 import threading
 import logging
-import urllib.request
-import urllib.error
-from datetime import datetime, timezone
 from typing import Optional
 
-from .config import load_config
-from .parser import estimate_cost, _lookup_pricing
+from . import capture, overhead
+from .pricing import estimate_cost, _lookup_pricing
 
 logger = logging.getLogger("agentpulse.sdk")
 
 # ── Global state ──
-_config: dict = {}
-_buffer: list = []
-_buffer_lock = threading.Lock()
-_flush_thread: Optional[threading.Thread] = None
-_running = False
+_config: dict = {}  # the agent set up by init(), used outside any client scope
 _initialized = False
-_events_sent = 0
 _global_user_id: Optional[str] = None
 _global_task_context: Optional[str] = None
 
+# (user_id, task_context, tags, client) set by agentpulse.context() and
+# AgentPulse.scope() for the current task/thread; the globals above are the
+# defaults underneath it
+_scope: contextvars.ContextVar = contextvars.ContextVar("agentpulse_scope", default=None)
+
+# Byte budgets for prompt / response bodies, set by init()
+_capture_policy = capture.DEFAULT_POLICY
+
+# Event-loop lag / scheduling delay probes, when init(lag_probe_interval=...) turns them on
+_lag_monitor = None
+# When this context's current async call handed its request to httpx (set with the lag monitor on)
+_sent_at: contextvars.ContextVar = contextvars.ContextVar("agentpulse_sent_at", default=None)
+
+# Code of the patched create() functions and sync stream iteration: a thread
+# with one of these on its stack is inside an LLM call (read by the profiler)
+_LLM_CODE: set = set()
+# Async LLM calls (create() awaiting its response, streams being drained) in flight, per thread
+_llm_in_flight: dict = {}
+
+# Rate-limit snapshot from the last provider response seen by httpx in this context
+_last_ratelimit: contextvars.ContextVar = contextvars.ContextVar("agentpulse_last_ratelimit", default=None)
+
+
+def _agent_key(config: dict) -> tuple:
+    return (config.get("endpoint"), config.get("api_key"), config.get("agent_name"), config.get("framework"))
+
+
+class _Exporter:
+    """The flush thread shared by init() and every AgentPulse client.
 
-class _PostRedirectHandler(urllib.request.HTTPRedirectHandler):
-    def redirect_request(self, req, fp, code, msg, headers, newurl):
-        if code in (307, 308):
-            new_headers = {
-                k: v for k, v in req.header_items()
-                if k.lower() not in ("host", "content-length")
+    Events are queued per agent and each agent's batch is POSTed as its own
+    payload, so the API still sees one agent per request. Sends go through
+    the sender's keep-alive connection pool, so a process hosting dozens of
+    agents runs one thread and a few connections, not one of each per agent.
+    """
+
+    def __init__(self, batch_size: int = 50, interval: float = 10.0, max_pending: int = 10000):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_pending = max_pending  # per agent, kept for retry while the API is unreachable
+        self.sent = 0
+        self.dropped = 0
+        self.exports = 0
+        self.export_failures = 0
+        self.export_ns = 0
+        self.buffer_bytes = 0
+        self._batches: dict[tuple, list] = {}
+        self._configs: dict[tuple, dict] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        with self._lock:
+            self._running = True
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="agentpulse-exporter", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wakeup.set()
+
+    def add(self, config: dict, event: dict):
+        """Queue an event for config's agent; a full batch wakes the flush thread."""
+        key = _agent_key(config)
+        size = overhead.approx_size(event)
+        with self._lock:
+            batch = self._batches.get(key)
+            if batch is None:
+                batch = self._batches[key] = []
+            self._configs[key] = config
+            batch.append(event)
+            self.buffer_bytes += size
+            full = len(batch) >= self.batch_size
+            if len(batch) > self.max_pending:
+                self._drop_oldest(batch)
+        if full:
+            self._wakeup.set()
+
+    def extend(self, config: dict, events: list):
+        if not events:
+            return
+        key = _agent_key(config)
+        with self._lock:
+            batch = self._batches.setdefault(key, [])
+            batch[:0] = events  # older than anything queued since
+            self._configs[key] = config
+            self.buffer_bytes += sum(map(overhead.approx_size, events))
+            if len(batch) > self.max_pending:
+                self._drop_oldest(batch)
+
+    def _drop_oldest(self, batch: list):
+        overflow = len(batch) - self.max_pending
+        self.buffer_bytes -= sum(map(overhead.approx_size, batch[:overflow]))
+        del batch[:overflow]
+        self.dropped += overflow
+
+    def pending(self, config: dict = None) -> int:
+        with self._lock:
+            if config is not None:
+                return len(self._batches.get(_agent_key(config), ()))
+            return sum(len(batch) for batch in self._batches.values())
+
+    def flush(self, config: dict = None):
+        """Send queued events, one payload per agent (only config's agent if given)."""
+        with self._lock:
+            keys = [_agent_key(config)] if config is not None else list(self._batches)
+            work = [(self._configs[key], self._batches.pop(key)) for key in keys if self._batches.get(key)]
+            for _, events in work:
+                self.buffer_bytes -= sum(map(overhead.approx_size, events))
+        for agent_config, events in work:
+            if not self._send(agent_config, events):
+                # Re-queue for retry
+                self.extend(agent_config, events)
+
+    def _run(self):
+        while self._running:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "buffer_events": sum(len(batch) for batch in self._batches.values()),
+                "buffer_bytes": self.buffer_bytes,
+                "events_sent": self.sent,
+                "events_dropped": self.dropped,
+                "exports": self.exports,
+                "export_failures": self.export_failures,
+                "export_ms": self.export_ns / 1e6,
             }
-            new_headers["Content-length"] = str(len(req.data)) if req.data else "0"
-            return urllib.request.Request(
-                newurl, data=req.data,
-                headers=new_headers,
-                method=req.get_method(),
+
+    def _send(self, config: dict, events: list) -> bool:
+        if not config.get("api_key"):
+            return True
+        started = _perf_counter_ns()
+        try:
+            return self._post(config, events)
+        finally:
+            self.exports += 1
+            self.export_ns += _perf_counter_ns() - started
+
+    def _post(self, config: dict, events: list) -> bool:
+        payload = {
+            "api_key": config["api_key"],
+            "agent_name": config["agent_name"],
+            "framework": config.get("framework", "python-sdk"),
+            "events": events,
+        }
+        import urllib.error
+        import urllib.request
+        from . import _codec
+        from .sender import _opener, retryable_status
+
+        try:
+            data = _codec.dumps(payload)
+            req = urllib.request.Request(
+                config["endpoint"],
+                data=data,
+                headers={"Content-Type": "application/json"},
+                method="POST",
             )
-        return super().redirect_request(req, fp, code, msg, headers, newurl)
+            with _opener.open(req, timeout=10) as resp:
+                resp.read()
+                if 200 <= resp.status < 300:
+                    self.sent += len(events)
+                    logger.debug(
+                        f"AgentPulse: sent {len(events)} events for {config['agent_name']} (total: {self.sent})"
+                    )
+                else:
+                    self.export_failures += 1
+                    self.dropped += len(events)
+                    logger.warning(f"AgentPulse: API returned {resp.status}")
+            return True
+        except urllib.error.HTTPError as e:
+            self.export_failures += 1
+            if retryable_status(e.code):
+                logger.warning(f"AgentPulse: API returned {e.code}, will retry")
+                return False
+            # Rejected (bad key, bad payload): retrying won't help
+            self.dropped += len(events)
+            logger.warning(f"AgentPulse: API rejected {len(events)} events ({e.code}), dropping them")
+            return True
+        except Exception as e:
+            self.export_failures += 1
+            logger.warning(f"AgentPulse: failed to send events: {e}")
+            return False
+
+
+_exporter = _Exporter()
+_overhead = overhead.OverheadMonitor()
+_perf_counter_ns = time.perf_counter_ns
 
 
-_opener = urllib.request.build_opener(_PostRedirectHandler)
+# Settings handed to child processes by `agentpulse run`, so they never read
+# the YAML config file themselves
+_ENV_SETTINGS = {
+    "api_key": "AGENTPULSE_API_KEY",
+    "agent_name": "AGENTPULSE_AGENT_NAME",
+    "endpoint": "AGENTPULSE_ENDPOINT",
+    "framework": "AGENTPULSE_FRAMEWORK",
+}
+_SETTING_DEFAULTS = {
+    "api_key": "",
+    "agent_name": "default",
+    "endpoint": "https://agentpulses.com/api/events",
+    "framework": "python-sdk",
+}
 
 
-def init(api_key: str = None, agent_name: str = None, endpoint: str = None, user_id: str = None):
+def _load_agent_config(api_key=None, agent_name=None, endpoint=None, framework=None) -> dict:
+    """Agent settings from the arguments, then AGENTPULSE_* env vars, then the config file.
+
+    The config file is only read when the agent's identity (key, name,
+    endpoint) isn't fully given some other way.
+    """
+    config = {"api_key": api_key, "agent_name": agent_name, "endpoint": endpoint, "framework": framework}
+    for key, env_var in _ENV_SETTINGS.items():
+        config[key] = config[key] or os.environ.get(env_var)
+    file_config = {}
+    if not (config["api_key"] and config["agent_name"] and config["endpoint"]):
+        from .config import load_config
+        file_config = load_config(detect_log_path=False)
+    for key, default in _SETTING_DEFAULTS.items():
+        config[key] = config[key] or file_config.get(key, default)
+    return config
+
+
+def init(api_key: str = None, agent_name: str = None, endpoint: str = None, user_id: str = None,
+         overhead_budget: Optional[float] = overhead.DEFAULT_BUDGET,
+         max_message_bytes: int = capture.MAX_MESSAGE_BYTES, max_event_bytes: int = capture.MAX_EVENT_BYTES,
+         lag_probe_interval: Optional[float] = None):
     """Initialize AgentPulse SDK.
 
     Args:
@@ -64,23 +283,28 @@ def init(api_key: str = None, agent_name: str = None, endpoint: str = None, user
         user_id: Identifies who/what is making calls (e.g. "dan", "bot-1").
             Useful when multiple users or bots share the same VM.
             Shows up in the dashboard so you can filter by user.
+        overhead_budget: Share of each call's latency the SDK may spend on
+            it (0.01 = 1%) before it captures less: truncated bodies, then
+            sampled bodies, then token/cost metrics only. None disables.
+        max_message_bytes: Most UTF-8 bytes kept of any one prompt message
+            or response; longer ones keep their head and tail.
+        max_event_bytes: Most bytes of prompt and response kept per event.
+        lag_probe_interval: Seconds between event-loop lag and thread
+            scheduling delay probes (e.g. 0.1). Async calls then report
+            queued_before_send_ms, loop_lag_ms and thread_delay_ms.
+            None (the default) leaves the probes off.
 
     If no arguments are provided, reads from ~/.openclaw/agentpulse.yaml
     (created by `agentpulse init`).
     """
-    global _config, _initialized, _running, _global_user_id
+    global _config, _initialized, _global_user_id, _capture_policy, _lag_monitor
 
     # Load from config file as defaults
-    file_config = load_config()
-
-    _config = {
-        "api_key": api_key or file_config.get("api_key", ""),
-        "agent_name": agent_name or file_config.get("agent_name", "default"),
-        "endpoint": endpoint or file_config.get("endpoint", "https://agentpulses.com/api/events"),
-        "framework": file_config.get("framework", "python-sdk"),
-    }
+    _config = _load_agent_config(api_key, agent_name, endpoint)
 
     _global_user_id = user_id
+    _overhead.budget = overhead_budget
+    _capture_policy = capture.CapturePolicy(max_message_bytes, max_event_bytes)
 
     if not _config["api_key"]:
         logger.warning(
@@ -91,81 +315,155 @@ def init(api_key: str = None, agent_name: str = None, endpoint: str = None, user
         return
 
     _initialized = True
-    _running = True
+
+    if _lag_monitor is not None:
+        _lag_monitor.stop()
+        _lag_monitor = None
+    if lag_probe_interval:
+        from . import lag
+        _lag_monitor = lag.LagMonitor(lag_probe_interval)
 
     # Start background flush thread
-    _start_flush_thread()
+    _exporter.start()
     logger.info(f"AgentPulse SDK initialized (agent: {_config['agent_name']})")
 
 
-def _start_flush_thread():
-    """Start a background thread that flushes events every 10 seconds."""
-    global _flush_thread
+def _timestamp() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
 
-    def _flush_loop():
-        while _running:
-            time.sleep(10)
-            _flush()
 
-    _flush_thread = threading.Thread(target=_flush_loop, daemon=True)
-    _flush_thread.start()
+def _attach_ratelimit(event: dict) -> dict:
+    """Add the rate-limit snapshot of the call that produced this event."""
+    snapshot = _last_ratelimit.get()
+    if snapshot:
+        event["ratelimit"] = snapshot
+    return event
 
 
-def _add_event(event: dict):
-    """Add an event to the buffer (thread-safe)."""
-    with _buffer_lock:
-        _buffer.append(event)
+def _running_loop():
+    """The event loop running in this thread, if any."""
+    asyncio = sys.modules.get("asyncio")
+    if asyncio is None:
+        return None
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
 
-    # Auto-flush if buffer is large
-    if len(_buffer) >= 50:
-        _flush()
 
+def _capture(event: dict, kwargs: dict, extract_prompt):
+    """Attach the prompt at the current capture level and queue the event."""
+    _bound_bodies(event, _overhead.body_limit(), extract_prompt, kwargs)
+    _add_event(_attach_ratelimit(event))
 
-def _flush():
-    """Send buffered events to the AgentPulse API."""
-    global _events_sent
 
-    with _buffer_lock:
-        if not _buffer:
-            return
-        events = _buffer.copy()
-        _buffer.clear()
+def _lag_mark():
+    """The lag monitor's snapshot at the start of an async call, or None with it off."""
+    if _lag_monitor is None:
+        return None
+    _sent_at.set(None)
+    return _lag_monitor.mark()
 
-    if not _config.get("api_key"):
-        return
 
-    payload = {
-        "api_key": _config["api_key"],
-        "agent_name": _config["agent_name"],
-        "framework": _config.get("framework", "python-sdk"),
-        "events": events,
-    }
+def _lag_fields(mark, called_ns: int, sent_ns: int = None) -> dict:
+    """queued_before_send_ms / loop_lag_ms / thread_delay_ms of a call that took mark at called_ns."""
+    if mark is None or _lag_monitor is None:
+        return {}
+    return _lag_monitor.since(mark, called_ns, sent_ns or _sent_at.get())
+
 
+async def _awaiting_llm(awaitable):
+    """Await an async LLM call, counting it as in flight on this thread meanwhile."""
+    thread = threading.get_ident()
+    _llm_in_flight[thread] = _llm_in_flight.get(thread, 0) + 1
     try:
-        data = json.dumps(payload, default=str).encode("utf-8")
-        req = urllib.request.Request(
-            _config["endpoint"],
-            data=data,
-            headers={"Content-Type": "application/json"},
-            method="POST",
-        )
-        with _opener.open(req, timeout=10) as resp:
-            if resp.status == 200:
-                _events_sent += len(events)
-                logger.debug(f"AgentPulse: sent {len(events)} events (total: {_events_sent})")
-            else:
-                logger.warning(f"AgentPulse: API returned {resp.status}")
-    except Exception as e:
-        logger.warning(f"AgentPulse: failed to send events: {e}")
-        # Re-add events to buffer for retry
-        with _buffer_lock:
-            _buffer.extend(events)
+        return await awaitable
+    finally:
+        _llm_in_flight[thread] -= 1
+
+
+def _stream_lag_start(called_ns: int) -> Optional[tuple]:
+    """Lag start of an async stream being returned: loop lag from here on is lag while it is consumed."""
+    monitor = _lag_monitor
+    return (monitor.mark(), called_ns, _sent_at.get()) if monitor is not None else None
+
+
+def _bound_bodies(event: dict, limit: Optional[int], copy_prompt, source):
+    """Cut the response and copy the prompt (copy_prompt(source, policy, budget)) within the byte budgets.
+
+    limit is the capture level's body limit: None for the full policy,
+    0 for no bodies.
+    """
+    if limit != 0:
+        policy = _capture_policy if limit is None else _capture_policy.limited(limit)
+        budget = policy.max_event_bytes
+        text = event.get("response_text")
+        if isinstance(text, str):
+            text = event["response_text"] = policy.text(text)
+            budget -= capture.utf8_len(text)
+        event["prompt_messages"] = copy_prompt(source, policy, max(budget, 0))
+    if limit is not None:
+        _overhead.shape(event, limit)
+
+
+def stats() -> dict:
+    """What the SDK has cost this process so far.
+
+    Time spent on instrumented calls (overhead_ms, overhead_us_per_call and
+    overhead_ratio, the share of the calls' own latency), the current
+    capture level, events and approximate bytes waiting in the buffer,
+    events dropped, and time spent exporting (on the background thread).
+    """
+    result = _overhead.snapshot()
+    result.update(_exporter.stats())
+    aio = sys.modules.get("agentpulse.aio")
+    if aio is not None:
+        loops = aio.stats()
+        result["buffer_events"] += loops["pending"]
+        result["events_sent"] += loops["sent"]
+        result["events_dropped"] += loops["dropped"]
+        result["exports"] += loops["exports"]
+        result["export_failures"] += loops["failures"]
+        result["export_ms"] += loops["export_ms"]
+    if _lag_monitor is not None:
+        result.update(_lag_monitor.snapshot())
+    return result
+
+
+def _current_client() -> Optional["AgentPulse"]:
+    scope = _scope.get()
+    return scope[3] if scope is not None else None
+
+
+def _add_event(event: dict, client: "AgentPulse" = None):
+    """Queue an event for client's agent (default: the active scope's, else init()'s).
+
+    On a running event loop the event goes to that loop's exporter instead,
+    so sending never blocks the loop.
+    """
+    if client is None:
+        client = _current_client()
+    config = client.config if client is not None else _config
+
+    loop = _running_loop()
+    if loop is not None:
+        from . import aio
+        aio.exporter_for(loop).add(config, event)
+        return
+
+    _exporter.add(config, event)
+
+
+def _flush():
+    """Send buffered events for every agent to the AgentPulse API."""
+    _exporter.flush()
 
 
 def set_user(user_id: str):
     """Set the current user/bot identity for all subsequent LLM calls.
 
-    Use this when multiple users or bots share the same process.
+    This is process-wide. When concurrent threads or asyncio tasks serve
+    different users, use agentpulse.context() instead; this stays the default.
     Example:
         agentpulse.set_user("dan")       # Dan's calls
         agentpulse.set_user("trading-bot") # Bot's calls
@@ -185,13 +483,91 @@ def set_context(task_context: str):
     _global_task_context = task_context
 
 
+@contextlib.contextmanager
+def context(user_id: str = None, task_context: str = None, tags: dict = None):
+    """Attribute LLM calls made inside the block to a user, task and tags.
+
+    Unlike set_user()/set_context(), this only affects the current thread or
+    asyncio task (and anything that copies its context, e.g. tasks it
+    creates or contextvars.copy_context().run in an executor). Blocks nest:
+    inner values win and tags are merged.
+
+    Example:
+        async def handle(request):
+            with agentpulse.context(user_id=request.user, tags={"route": "chat"}):
+                await client.chat.completions.create(...)
+    """
+    token = _enter_scope(user_id, task_context, tags)
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def _enter_scope(user_id=None, task_context=None, tags=None, client=None):
+    outer = _scope.get()
+    if outer is not None:
+        user_id = user_id or outer[0]
+        task_context = task_context or outer[1]
+        if outer[2]:
+            tags = {**outer[2], **tags} if tags else outer[2]
+        client = client or outer[3]
+    return _scope.set((user_id, task_context, dict(tags) if tags else None, client))
+
+
+def _attribution(task_context: str = None) -> dict:
+    """user_id / task_context (/ tags) for an event created right now."""
+    scope = _scope.get()
+    if scope is None:
+        return {"task_context": task_context or _global_task_context, "user_id": _global_user_id}
+    client = scope[3]
+    fields = {
+        "task_context": task_context or scope[1] or _global_task_context,
+        "user_id": scope[0] or (client is not None and client.user_id) or _global_user_id,
+    }
+    if scope[2]:
+        fields["tags"] = dict(scope[2])
+    return fields
+
+
 def shutdown():
-    """Flush remaining events and stop background thread."""
-    global _running
-    _running = False
+    """Flush remaining events and stop background threads."""
+    global _lag_monitor
+    _exporter.stop()
+    if _lag_monitor is not None:
+        _lag_monitor.stop()
+        _lag_monitor = None
+    if "agentpulse.aio" in sys.modules:
+        # Events queued on event loops that have since stopped
+        for config, events in sys.modules["agentpulse.aio"].take_stranded():
+            _exporter.extend(config, events)
     _flush()
 
 
+async def aflush():
+    """Send buffered events without blocking the running event loop."""
+    import asyncio
+    from . import aio
+
+    exporter = aio.current_exporter()
+    if exporter is not None:
+        await exporter.flush()
+    if _exporter.pending():
+        await asyncio.get_running_loop().run_in_executor(None, _flush)
+
+
+async def ashutdown():
+    """Async counterpart of shutdown(): stop this loop's exporter and flush everything."""
+    import asyncio
+    from . import aio
+
+    _exporter.stop()
+    exporter = aio.current_exporter()
+    if exporter is not None:
+        await exporter.aclose()
+    await asyncio.get_running_loop().run_in_executor(None, _flush)
+
+
 def track(response, provider: str = None, latency_ms: int = None, task_context: str = None, messages: list = None):
     """Manually track an LLM API response.
 
@@ -209,18 +585,82 @@ def track(response, provider: str = None, latency_ms: int = None, task_context:
         response = client.chat.completions.create(model="gpt-4o", messages=msgs)
         agentpulse.track(response, messages=msgs)
     """
-    if not _initialized:
+    if not _initialized and _current_client() is None:
         logger.warning("AgentPulse: call agentpulse.init() before tracking")
         return
+    _track(response, provider, latency_ms, task_context, messages)
+
 
+def _track(response, provider, latency_ms, task_context, messages, client=None):
     event = _extract_event_from_response(response, provider, latency_ms, task_context)
     if event:
-        if messages:
-            event["prompt_messages"] = [
-                {"role": m.get("role", "user"), "content": m.get("content", "")}
-                for m in messages if isinstance(m, dict)
-            ]
-        _add_event(event)
+        _bound_bodies(event, None, _copy_messages, messages or [])
+        _add_event(event, client)
+
+
+class AgentPulse:
+    """One agent's identity, for processes that host several agents.
+
+    Each client reports under its own api_key / agent_name, but all clients
+    (and init()) share one flush thread and connection pool, so adding
+    agents doesn't add threads or sockets.
+
+    LLM calls are attributed to a client inside its scope(); instrumentation
+    is process-wide, so instrument() only needs calling once.
+
+    Example:
+        support = agentpulse.AgentPulse(api_key="ap_...", agent_name="support")
+        support.instrument()
+        with support.scope():
+            client.chat.completions.create(...)
+        support.track(response)  # or explicitly
+    """
+
+    def __init__(self, api_key: str = None, agent_name: str = None, endpoint: str = None,
+                 user_id: str = None, framework: str = None):
+        self.config = _load_agent_config(api_key, agent_name, endpoint, framework)
+        self.user_id = user_id
+        if not self.config["api_key"]:
+            logger.warning(f"AgentPulse: no API key set for agent {self.config['agent_name']}")
+        _exporter.start()
+
+    @property
+    def agent_name(self) -> str:
+        return self.config["agent_name"]
+
+    def __repr__(self):
+        return f"AgentPulse(agent_name={self.agent_name!r})"
+
+    @contextlib.contextmanager
+    def scope(self, user_id: str = None, task_context: str = None, tags: dict = None):
+        """Report LLM calls made inside the block under this agent.
+
+        Scoped like agentpulse.context() (current thread / asyncio task), and
+        takes the same attribution arguments.
+        """
+        token = _enter_scope(user_id, task_context, tags, self)
+        try:
+            yield self
+        finally:
+            _scope.reset(token)
+
+    def track(self, response, provider: str = None, latency_ms: int = None, task_context: str = None,
+              messages: list = None):
+        """Like agentpulse.track(), reported under this agent."""
+        with self.scope():
+            _track(response, provider, latency_ms, task_context, messages, self)
+
+    def instrument(self):
+        """Patch the LLM SDKs (once per process; calls are routed by scope())."""
+        _instrument()
+
+    def pending(self) -> int:
+        """Events queued for this agent and not yet sent."""
+        return _exporter.pending(self.config)
+
+    def flush(self):
+        """Send this agent's queued events now."""
+        _exporter.flush(self.config)
 
 
 def _extract_event_from_response(response, provider=None, latency_ms=None, task_context=None) -> Optional[dict]:
@@ -334,7 +774,7 @@ def _extract_event_from_response(response, provider=None, latency_ms=None, task_
                 tools_used.append(block["name"])
 
     return {
-        "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+        "timestamp": _timestamp(),
         "provider": provider,
         "model": model,
         "input_tokens": input_tokens,
@@ -343,97 +783,112 @@ def _extract_event_from_response(response, provider=None, latency_ms=None, task_
         "latency_ms": latency_ms,
         "status": "success",
         "error_message": None,
-        "task_context": task_context or _global_task_context,
         "tools_used": tools_used,
         "prompt_messages": prompt_messages,
         "response_text": response_text,
-        "user_id": _global_user_id,
+        **_attribution(task_context),
     }
 
 
 # ── Streaming wrappers ──
+#
+# These sit in the caller's serving thread and see every chunk. The wrapper
+# itself is a thin proxy (its __getattr__ forwarding makes every attribute
+# access on it slow), and the per-chunk work happens on a separate recorder
+# with __slots__. The recorder picks its chunk handler once per stream, from
+# the first chunk: classes that declare the fields we read (the SDKs'
+# pydantic models) get plain attribute access, anything else the tolerant
+# getattr path.
 
-class _OpenAIStreamWrapper:
-    """Wraps an OpenAI streaming response to capture metrics when stream completes."""
+_perf_counter = time.perf_counter
+_GAP_SAMPLE = 256
+_COMPACT_EVERY = 256  # chunks between folding a stream's text into its bounded copy
 
-    def __init__(self, stream, kwargs, provider, start_time):
-        self._stream = stream
+
+def _declares_fields(cls, names) -> bool:
+    fields = getattr(cls, "model_fields", None) or getattr(cls, "__fields__", None)
+    return isinstance(fields, dict) and all(n in fields for n in names)
+
+
+def _percentile(sorted_values, pct):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+class _StreamRecorder(abc.ABC):
+    """Accumulates one streamed response and emits its event at the end.
+
+    Records time to first token, the gaps between tokens and the
+    generation time after the first token. Subclasses parse their
+    provider's chunks in process_chunk().
+    """
+
+    __slots__ = (
+        "_kwargs", "_provider", "_start_time", "_content_parts", "_text", "_tool_names", "_model",
+        "_input_tokens", "_output_tokens", "_ratelimit", "_attribution", "_client", "_start_perf",
+        "_token_times", "_lag_start", "overhead_ns",
+    )
+
+    def __init__(self, kwargs, provider, start_time):
+        created = _perf_counter_ns()
         self._kwargs = kwargs
         self._provider = provider
         self._start_time = start_time
+        # Chunks since the last compact(), and the bounded text before them
         self._content_parts = []
+        self._text = capture.BoundedText(_capture_policy.max_message_bytes)
         self._tool_names = []
         self._model = kwargs.get("model", "unknown")
         self._input_tokens = 0
         self._output_tokens = 0
-
-    def __getattr__(self, name):
-        return getattr(self._stream, name)
-
-    def __iter__(self):
-        try:
-            for chunk in self._stream:
-                self._process_chunk(chunk)
-                yield chunk
-        finally:
-            self._emit_event()
-
-    def __enter__(self):
-        if hasattr(self._stream, "__enter__"):
-            self._stream.__enter__()
-        return self
-
-    def __exit__(self, *args):
-        if hasattr(self._stream, "__exit__"):
-            return self._stream.__exit__(*args)
-
-    def _process_chunk(self, chunk):
-        try:
-            if hasattr(chunk, "model") and chunk.model:
-                self._model = chunk.model
-            if hasattr(chunk, "choices") and chunk.choices:
-                delta = getattr(chunk.choices[0], "delta", None)
-                if delta:
-                    content = getattr(delta, "content", None)
-                    if content:
-                        self._content_parts.append(content)
-                    tool_calls = getattr(delta, "tool_calls", None)
-                    if tool_calls:
-                        for tc in tool_calls:
-                            func = getattr(tc, "function", None)
-                            if func:
-                                name = getattr(func, "name", None)
-                                if name and name not in self._tool_names:
-                                    self._tool_names.append(name)
-            if hasattr(chunk, "usage") and chunk.usage:
-                usage = chunk.usage
-                self._input_tokens = getattr(usage, "prompt_tokens", 0) or 0
-                self._output_tokens = getattr(usage, "completion_tokens", 0) or 0
-                # Include cache tokens if present (Anthropic + OpenAI caching)
-                cache_read = getattr(usage, "cache_read_input_tokens", 0) or 0
-                cache_creation = getattr(usage, "cache_creation_input_tokens", 0) or 0
-                self._input_tokens += cache_read + cache_creation
-        except Exception:
-            pass
-
-    def _emit_event(self):
+        self._ratelimit = _last_ratelimit.get()
+        # Attributed to whoever started the stream, not whoever drains it
+        self._attribution = _attribution()
+        self._client = _current_client()
+        # start_time on the perf_counter clock, and the arrival time of each token
+        self._start_perf = _perf_counter() - (time.time() - start_time)
+        self._token_times = []
+        # (lag mark when the stream was returned, create() called, request sent) for async streams
+        self._lag_start = None
+        # Our own time on this stream; the wrapper adds per-chunk handling
+        self.overhead_ns = _perf_counter_ns() - created
+
+    def handler(self, first_chunk):
+        """The per-chunk handler to use for this stream."""
+        return self.process_chunk
+
+    @abc.abstractmethod
+    def process_chunk(self, chunk):
+        """Record one chunk of the stream."""
+
+    def compact(self):
+        """Fold the chunks received so far into the bounded response text."""
+        parts = self._content_parts
+        if parts:
+            self._text.feed("".join(parts))
+            parts.clear()  # in place: the chunk handlers hold parts.append
+
+    @staticmethod
+    def _prompt_messages(kwargs, policy=None, budget=None) -> list:
+        return _extract_prompt_messages(kwargs, policy, budget)
+
+    def emit_event(self):
+        began = _perf_counter_ns()
         try:
+            end = _perf_counter()
             latency = int((time.time() - self._start_time) * 1000)
-            response_text = "".join(self._content_parts) if self._content_parts else None
+            self.compact()
+            text = self._text
+            response_text = text.render() if text.length else None
 
-            # Estimate tokens from text if usage not available (stream without include_usage)
-            if not self._input_tokens and not self._output_tokens:
-                prompt_text = " ".join(
-                    m.get("content", "") for m in self._kwargs.get("messages", [])
-                    if isinstance(m, dict) and m.get("content")
-                )
-                self._input_tokens = max(1, len(prompt_text) // 4) if prompt_text else 0
-                self._output_tokens = max(1, len(response_text) // 4) if response_text else 0
+            # Count tokens locally if usage not available (stream without include_usage)
+            estimated = not self._input_tokens and not self._output_tokens
+            if estimated:
+                self._estimate_tokens()
 
             cost = estimate_cost(self._model, self._input_tokens, self._output_tokens)
-
-            _add_event({
-                "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+            limit = _overhead.body_limit()
+            event = {
+                "timestamp": _timestamp(),
                 "provider": self._provider,
                 "model": self._model,
                 "input_tokens": self._input_tokens,
@@ -442,78 +897,257 @@ class _OpenAIStreamWrapper:
                 "latency_ms": latency,
                 "status": "success",
                 "error_message": None,
-                "task_context": _global_task_context,
                 "tools_used": self._tool_names,
-                "prompt_messages": _extract_prompt_messages(self._kwargs),
+                "prompt_messages": [],
                 "response_text": response_text,
-                "user_id": _global_user_id,
-            })
+                **self._attribution,
+                "ratelimit": self._ratelimit,
+            }
+            if estimated:
+                event["tokens_estimated"] = True
+            if self._lag_start is not None:
+                event.update(_lag_fields(*self._lag_start))
+            event.update(self._timing(end))
+            _bound_bodies(event, limit, self._prompt_messages, self._kwargs)
+            _add_event(event, self._client)
         except Exception as e:
             logger.debug(f"AgentPulse: error finalizing stream event: {e}")
+        done = _perf_counter_ns()
+        _overhead.record(self.overhead_ns + done - began, int((_perf_counter() - self._start_perf) * 1e9))
+
+    def _estimate_tokens(self):
+        from . import tokens
+
+        kwargs = self._kwargs
+        self._input_tokens = tokens.count_messages(kwargs.get("messages") or [], self._model, kwargs.get("system"))
+        text = self._text
+        if text.length:
+            # Only the head and tail of a long response are kept: scale their count up
+            kept = text.kept()
+            counted = tokens.count_text(kept, self._model)
+            self._output_tokens = max(1, round(counted * text.length / len(kept)) if kept else text.length // 4)
+
+    def _timing(self, end) -> dict:
+        """TTFT, generation time and inter-token latency for the event (and /metrics)."""
+        times = self._token_times
+        if not times:
+            return {"ttft_ms": None, "stream_duration_ms": None, "tokens_per_sec": None, "inter_token_ms": None}
+        provider = self._provider
+        ttft = times[0] - self._start_perf
+        duration = end - times[0]
+        from . import metrics
+        metrics.SDK_TTFT_SECONDS.labels(provider).observe(ttft)
+        metrics.SDK_STREAM_SECONDS.labels(provider).observe(duration)
+        inter_token = None
+        if len(times) > 1:
+            gaps = list(map(operator.sub, times[1:], times[:-1]))
+            longest = max(gaps)
+            # Percentiles from an even sample: sorting every gap of a long
+            # stream would cost more than recording them did
+            if len(gaps) > _GAP_SAMPLE:
+                gaps = gaps[::len(gaps) // _GAP_SAMPLE]
+            gaps.sort()
+            inter_token = {
+                "p50": round(_percentile(gaps, 50) * 1000, 2),
+                "p95": round(_percentile(gaps, 95) * 1000, 2),
+                "max": round(longest * 1000, 2),
+            }
+        return {
+            "ttft_ms": int(ttft * 1000),
+            "stream_duration_ms": int(duration * 1000),
+            "tokens_per_sec": round(self._output_tokens / duration, 1) if duration > 0 and self._output_tokens else None,
+            "inter_token_ms": inter_token,
+        }
+
+
+class _OpenAIRecorder(_StreamRecorder):
+    """Chunk handling for OpenAI-compatible chat completion streams."""
+
+    __slots__ = ()
+
+    def handler(self, first_chunk):
+        if not _declares_fields(type(first_chunk), ("model", "choices", "usage")):
+            return self.process_chunk
+        # ChatCompletionChunk: every field we read is declared. The closure
+        # keeps the bound appends in cells instead of looking them up per chunk.
+        append_text = self._content_parts.append
+        append_time = self._token_times.append
+        clock = _perf_counter
+        if first_chunk.model:
+            self._model = first_chunk.model
+
+        def process_declared(chunk):
+            try:
+                choices = chunk.choices
+                if choices:
+                    delta = choices[0].delta
+                    if delta is not None:
+                        content = delta.content
+                        if content:
+                            append_text(content)
+                            append_time(clock())
+                        if delta.tool_calls:
+                            self._add_tool_calls(delta.tool_calls)
+                usage = chunk.usage
+                if usage:
+                    self._set_usage(usage)
+                    if chunk.model:
+                        self._model = chunk.model
+            except Exception:
+                pass
 
+        return process_declared
 
-class _OpenAIAsyncStreamWrapper:
-    """Wraps an OpenAI async streaming response to capture metrics."""
+    def process_chunk(self, chunk):
+        try:
+            model = getattr(chunk, "model", None)
+            if model:
+                self._model = model
+            choices = getattr(chunk, "choices", None)
+            if choices:
+                delta = getattr(choices[0], "delta", None)
+                if delta:
+                    content = getattr(delta, "content", None)
+                    if content:
+                        self._content_parts.append(content)
+                        self._token_times.append(_perf_counter())
+                    tool_calls = getattr(delta, "tool_calls", None)
+                    if tool_calls:
+                        self._add_tool_calls(tool_calls)
+            usage = getattr(chunk, "usage", None)
+            if usage:
+                self._set_usage(usage)
+        except Exception:
+            pass
 
-    def __init__(self, stream, kwargs, provider, start_time):
-        self._stream = stream
-        self._kwargs = kwargs
-        self._provider = provider
-        self._start_time = start_time
-        self._content_parts = []
-        self._tool_names = []
-        self._model = kwargs.get("model", "unknown")
-        self._input_tokens = 0
-        self._output_tokens = 0
+    def _add_tool_calls(self, tool_calls):
+        if not self._token_times:
+            self._token_times.append(_perf_counter())
+        for tc in tool_calls:
+            func = getattr(tc, "function", None)
+            if func:
+                name = getattr(func, "name", None)
+                if name and name not in self._tool_names:
+                    self._tool_names.append(name)
+
+    def _set_usage(self, usage):
+        # Once per stream, so the tolerant lookups are fine here
+        self._input_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        self._output_tokens = getattr(usage, "completion_tokens", 0) or 0
+        # Include cache tokens if present (Anthropic + OpenAI caching)
+        cache_read = getattr(usage, "cache_read_input_tokens", 0) or 0
+        cache_creation = getattr(usage, "cache_creation_input_tokens", 0) or 0
+        self._input_tokens += cache_read + cache_creation
+
+
+class _AnthropicRecorder(_StreamRecorder):
+    """Event handling for Anthropic message streams."""
+
+    __slots__ = ()
+
+    @staticmethod
+    def _prompt_messages(kwargs, policy=None, budget=None) -> list:
+        return _extract_anthropic_messages(kwargs, policy, budget)
+
+    def handler(self, first_chunk):
+        append_text = self._content_parts.append
+        append_time = self._token_times.append
+        clock = _perf_counter
+
+        def process_event(event):
+            try:
+                event_type = event.type
+                if event_type == "content_block_delta":
+                    # The bulk of a stream: text (or tool input JSON) deltas
+                    text = getattr(event.delta, "text", None)
+                    if text:
+                        append_text(text)
+                    append_time(clock())
+                else:
+                    self._process_other(event, event_type)
+            except AttributeError:
+                self.process_chunk(event)
+            except Exception:
+                pass
 
-    def __getattr__(self, name):
-        return getattr(self._stream, name)
+        return process_event
 
-    async def __aiter__(self):
+    def process_chunk(self, event):
         try:
-            async for chunk in self._stream:
-                self._process_chunk(chunk)
-                yield chunk
-        finally:
-            self._emit_event()
-
-    async def __aenter__(self):
-        if hasattr(self._stream, "__aenter__"):
-            await self._stream.__aenter__()
-        return self
+            event_type = getattr(event, "type", None)
+            if event_type == "content_block_delta":
+                delta = getattr(event, "delta", None)
+                text = getattr(delta, "text", None)
+                if text:
+                    self._content_parts.append(text)
+                self._token_times.append(_perf_counter())
+            else:
+                self._process_other(event, event_type)
+        except Exception:
+            pass
 
-    async def __aexit__(self, *args):
-        if hasattr(self._stream, "__aexit__"):
-            return await self._stream.__aexit__(*args)
+    def _process_other(self, event, event_type):
+        if event_type == "message_start":
+            self._on_message_start(event)
+        elif event_type == "content_block_start":
+            block = getattr(event, "content_block", None)
+            if block and getattr(block, "type", "") == "tool_use":
+                name = getattr(block, "name", None)
+                if name and name not in self._tool_names:
+                    self._tool_names.append(name)
+        elif event_type == "message_delta":
+            usage = getattr(event, "usage", None)
+            if usage:
+                self._output_tokens = getattr(usage, "output_tokens", 0) or 0
+
+    def _on_message_start(self, event):
+        msg = getattr(event, "message", None)
+        if msg:
+            self._model = getattr(msg, "model", self._model)
+            usage = getattr(msg, "usage", None)
+            if usage:
+                base_input = getattr(usage, "input_tokens", 0) or 0
+                cache_read = getattr(usage, "cache_read_input_tokens", 0) or 0
+                cache_creation = getattr(usage, "cache_creation_input_tokens", 0) or 0
+                self._input_tokens = base_input + cache_read + cache_creation
 
-    # Reuse same chunk processing and event emission
-    _process_chunk = _OpenAIStreamWrapper._process_chunk
-    _emit_event = _OpenAIStreamWrapper._emit_event
 
+class _StreamWrapper:
+    """Thin proxy over an SDK stream that feeds each chunk to a recorder."""
 
-class _AnthropicStreamWrapper:
-    """Wraps an Anthropic streaming response to capture metrics."""
+    __slots__ = ("_stream", "_recorder")
 
-    def __init__(self, stream, kwargs, start_time):
+    def __init__(self, stream, recorder):
         self._stream = stream
-        self._kwargs = kwargs
-        self._start_time = start_time
-        self._content_parts = []
-        self._tool_names = []
-        self._model = kwargs.get("model", "unknown")
-        self._input_tokens = 0
-        self._output_tokens = 0
+        self._recorder = recorder
 
     def __getattr__(self, name):
         return getattr(self._stream, name)
 
+
+class _SyncStreamWrapper(_StreamWrapper):
+    __slots__ = ()
+
     def __iter__(self):
+        recorder = self._recorder
+        process = None
+        spent = 0
+        countdown = _COMPACT_EVERY
         try:
-            for event in self._stream:
-                self._process_chunk(event)
-                yield event
+            for chunk in self._stream:
+                began = _perf_counter_ns()
+                if process is None:
+                    process = recorder.handler(chunk)
+                process(chunk)
+                countdown -= 1
+                if not countdown:
+                    countdown = _COMPACT_EVERY
+                    recorder.compact()
+                spent += _perf_counter_ns() - began
+                yield chunk
         finally:
-            self._emit_event()
+            recorder.overhead_ns += spent
+            recorder.emit_event()
 
     def __enter__(self):
         if hasattr(self._stream, "__enter__"):
@@ -524,96 +1158,33 @@ class _AnthropicStreamWrapper:
         if hasattr(self._stream, "__exit__"):
             return self._stream.__exit__(*args)
 
-    def _process_chunk(self, event):
-        try:
-            event_type = getattr(event, "type", "")
-            if event_type == "message_start":
-                msg = getattr(event, "message", None)
-                if msg:
-                    self._model = getattr(msg, "model", self._model)
-                    usage = getattr(msg, "usage", None)
-                    if usage:
-                        base_input = getattr(usage, "input_tokens", 0) or 0
-                        cache_read = getattr(usage, "cache_read_input_tokens", 0) or 0
-                        cache_creation = getattr(usage, "cache_creation_input_tokens", 0) or 0
-                        self._input_tokens = base_input + cache_read + cache_creation
-            elif event_type == "content_block_delta":
-                delta = getattr(event, "delta", None)
-                if delta:
-                    text = getattr(delta, "text", None)
-                    if text:
-                        self._content_parts.append(text)
-            elif event_type == "content_block_start":
-                block = getattr(event, "content_block", None)
-                if block and getattr(block, "type", "") == "tool_use":
-                    name = getattr(block, "name", None)
-                    if name and name not in self._tool_names:
-                        self._tool_names.append(name)
-            elif event_type == "message_delta":
-                usage = getattr(event, "usage", None)
-                if usage:
-                    self._output_tokens = getattr(usage, "output_tokens", 0) or 0
-        except Exception:
-            pass
-
-    def _emit_event(self):
-        try:
-            latency = int((time.time() - self._start_time) * 1000)
-            response_text = "".join(self._content_parts) if self._content_parts else None
-
-            if not self._input_tokens and not self._output_tokens:
-                prompt_text = " ".join(
-                    m.get("content", "") for m in self._kwargs.get("messages", [])
-                    if isinstance(m, dict) and m.get("content")
-                )
-                self._input_tokens = max(1, len(prompt_text) // 4) if prompt_text else 0
-                self._output_tokens = max(1, len(response_text) // 4) if response_text else 0
-
-            cost = estimate_cost(self._model, self._input_tokens, self._output_tokens)
-
-            _add_event({
-                "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
-                "provider": "anthropic",
-                "model": self._model,
-                "input_tokens": self._input_tokens,
-                "output_tokens": self._output_tokens,
-                "cost_usd": round(cost, 6),
-                "latency_ms": latency,
-                "status": "success",
-                "error_message": None,
-                "task_context": _global_task_context,
-                "tools_used": self._tool_names,
-                "prompt_messages": _extract_anthropic_messages(self._kwargs),
-                "response_text": response_text,
-                "user_id": _global_user_id,
-            })
-        except Exception as e:
-            logger.debug(f"AgentPulse: error finalizing stream event: {e}")
-
-
-class _AnthropicAsyncStreamWrapper:
-    """Wraps an Anthropic async streaming response to capture metrics."""
-
-    def __init__(self, stream, kwargs, start_time):
-        self._stream = stream
-        self._kwargs = kwargs
-        self._start_time = start_time
-        self._content_parts = []
-        self._tool_names = []
-        self._model = kwargs.get("model", "unknown")
-        self._input_tokens = 0
-        self._output_tokens = 0
 
-    def __getattr__(self, name):
-        return getattr(self._stream, name)
+class _AsyncStreamWrapper(_StreamWrapper):
+    __slots__ = ()
 
     async def __aiter__(self):
+        recorder = self._recorder
+        process = None
+        spent = 0
+        countdown = _COMPACT_EVERY
+        thread = threading.get_ident()
+        _llm_in_flight[thread] = _llm_in_flight.get(thread, 0) + 1
         try:
-            async for event in self._stream:
-                self._process_chunk(event)
-                yield event
+            async for chunk in self._stream:
+                began = _perf_counter_ns()
+                if process is None:
+                    process = recorder.handler(chunk)
+                process(chunk)
+                countdown -= 1
+                if not countdown:
+                    countdown = _COMPACT_EVERY
+                    recorder.compact()
+                spent += _perf_counter_ns() - began
+                yield chunk
         finally:
-            self._emit_event()
+            _llm_in_flight[thread] -= 1
+            recorder.overhead_ns += spent
+            recorder.emit_event()
 
     async def __aenter__(self):
         if hasattr(self._stream, "__aenter__"):
@@ -624,8 +1195,44 @@ class _AnthropicAsyncStreamWrapper:
         if hasattr(self._stream, "__aexit__"):
             return await self._stream.__aexit__(*args)
 
-    _process_chunk = _AnthropicStreamWrapper._process_chunk
-    _emit_event = _AnthropicStreamWrapper._emit_event
+
+_LLM_CODE.add(_SyncStreamWrapper.__iter__.__code__)
+
+
+class _OpenAIStreamWrapper(_SyncStreamWrapper):
+    """Wraps an OpenAI streaming response to capture metrics when stream completes."""
+
+    __slots__ = ()
+
+    def __init__(self, stream, kwargs, provider, start_time):
+        super().__init__(stream, _OpenAIRecorder(kwargs, provider, start_time))
+
+
+class _OpenAIAsyncStreamWrapper(_AsyncStreamWrapper):
+    """Wraps an OpenAI async streaming response to capture metrics."""
+
+    __slots__ = ()
+
+    def __init__(self, stream, kwargs, provider, start_time):
+        super().__init__(stream, _OpenAIRecorder(kwargs, provider, start_time))
+
+
+class _AnthropicStreamWrapper(_SyncStreamWrapper):
+    """Wraps an Anthropic streaming response to capture metrics."""
+
+    __slots__ = ()
+
+    def __init__(self, stream, kwargs, start_time):
+        super().__init__(stream, _AnthropicRecorder(kwargs, "anthropic", start_time))
+
+
+class _AnthropicAsyncStreamWrapper(_AsyncStreamWrapper):
+    """Wraps an Anthropic async streaming response to capture metrics."""
+
+    __slots__ = ()
+
+    def __init__(self, stream, kwargs, start_time):
+        super().__init__(stream, _AnthropicRecorder(kwargs, "anthropic", start_time))
 
 
 # ── Auto-instrumentation ──
@@ -639,16 +1246,77 @@ def auto_instrument():
     Patches:
     - OpenAI SDK (v1.x) — covers OpenAI, MiniMax, Together, Groq, Fireworks, etc.
     - Anthropic SDK
+
+    SDKs that aren't imported yet are patched right after their first import,
+    so processes that never use them don't pay for importing them.
     """
     if not _initialized:
         logger.warning("AgentPulse: call agentpulse.init() before auto_instrument()")
         return
-
-    _patch_openai()
-    _patch_anthropic()
+    _instrument()
+
+
+def _instrument():
+    patchers = {"openai": _patch_openai, "anthropic": _patch_anthropic, "httpx": _patch_httpx}
+    for name, patch in patchers.items():
+        if name in sys.modules:
+            patch()
+        elif name not in _patched:
+            _import_hook.pending[name] = patch
+    if _import_hook.pending and _import_hook not in sys.meta_path:
+        sys.meta_path.insert(0, _import_hook)
     logger.info("AgentPulse: auto-instrumentation active")
 
 
+class _PatchOnImport:
+    """sys.meta_path hook that patches an SDK right after it's first imported."""
+
+    def __init__(self):
+        self.pending: dict = {}  # top-level module name -> patch function
+
+    def find_spec(self, name, path=None, target=None):
+        if name not in self.pending:
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _PatchingLoader(spec.loader, self, name)
+        return spec
+
+
+class _PatchingLoader:
+    def __init__(self, loader, hook, name):
+        self._loader = loader
+        self._hook = hook
+        self._name = name
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        # Put the real loader back before the module (or anyone else) looks at it
+        module.__spec__.loader = module.__loader__ = self._loader
+        self._loader.exec_module(module)
+        patch = self._hook.pending.pop(self._name, None)
+        if patch is not None:
+            try:
+                patch()
+            except Exception as e:
+                logger.debug(f"AgentPulse: could not instrument {self._name}: {e}")
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+_import_hook = _PatchOnImport()
+
+
 def _patch_openai():
     """Patch the OpenAI SDK to capture all chat completion calls."""
     if "openai" in _patched:
@@ -664,6 +1332,8 @@ def _patch_openai():
 
     def patched_create(self, *args, **kwargs):
         start = time.time()
+        called = _perf_counter_ns()
+        _last_ratelimit.set(None)
         error_msg = None
         status = "success"
         try:
@@ -671,8 +1341,9 @@ def _patch_openai():
         except Exception as e:
             error_msg = str(e)
             status = "rate_limit" if "rate" in str(e).lower() and "limit" in str(e).lower() else "error"
-            _add_event({
-                "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+            returned = _perf_counter_ns()
+            _capture({
+                "timestamp": _timestamp(),
                 "provider": _detect_provider_from_client(self, kwargs),
                 "model": kwargs.get("model", "unknown"),
                 "input_tokens": 0,
@@ -681,14 +1352,14 @@ def _patch_openai():
                 "latency_ms": int((time.time() - start) * 1000),
                 "status": status,
                 "error_message": error_msg,
-                "task_context": _global_task_context,
                 "tools_used": [],
-                "prompt_messages": _extract_prompt_messages(kwargs),
                 "response_text": None,
-                "user_id": _global_user_id,
-            })
+                **_attribution(),
+            }, kwargs, _extract_prompt_messages)
+            _overhead.record(_perf_counter_ns() - returned, returned - called)
             raise
 
+        returned = _perf_counter_ns()
         latency = int((time.time() - start) * 1000)
         provider = _detect_provider_from_client(self, kwargs)
 
@@ -702,12 +1373,13 @@ def _patch_openai():
             latency_ms=latency,
         )
         if event:
-            event["prompt_messages"] = _extract_prompt_messages(kwargs)
-            _add_event(event)
+            _capture(event, kwargs, _extract_prompt_messages)
+        _overhead.record(_perf_counter_ns() - returned, returned - called)
 
         return response
 
     chat_mod.Completions.create = patched_create
+    _LLM_CODE.add(patched_create.__code__)
     _patched.add("openai")
     logger.debug("AgentPulse: patched OpenAI SDK")
 
@@ -717,13 +1389,17 @@ def _patch_openai():
 
         async def patched_async_create(self, *args, **kwargs):
             start = time.time()
+            called = _perf_counter_ns()
+            _last_ratelimit.set(None)
+            lag_mark = _lag_mark()
             try:
-                response = await original_async(self, *args, **kwargs)
+                response = await _awaiting_llm(original_async(self, *args, **kwargs))
             except Exception as e:
                 error_msg = str(e)
                 status = "rate_limit" if "rate" in str(e).lower() and "limit" in str(e).lower() else "error"
-                _add_event({
-                    "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                returned = _perf_counter_ns()
+                _capture({
+                    "timestamp": _timestamp(),
                     "provider": _detect_provider_from_client(self, kwargs),
                     "model": kwargs.get("model", "unknown"),
                     "input_tokens": 0,
@@ -732,18 +1408,23 @@ def _patch_openai():
                     "latency_ms": int((time.time() - start) * 1000),
                     "status": status,
                     "error_message": error_msg,
-                    "task_context": None,
                     "tools_used": [],
-                    "prompt_messages": _extract_prompt_messages(kwargs),
                     "response_text": None,
-                })
+                    **_attribution(),
+                    **_lag_fields(lag_mark, called),
+                }, kwargs, _extract_prompt_messages)
+                _overhead.record(_perf_counter_ns() - returned, returned - called)
                 raise
 
+            returned = _perf_counter_ns()
             latency = int((time.time() - start) * 1000)
             provider = _detect_provider_from_client(self, kwargs)
 
             if kwargs.get("stream"):
-                return _OpenAIAsyncStreamWrapper(response, kwargs, provider, start)
+                wrapper = _OpenAIAsyncStreamWrapper(response, kwargs, provider, start)
+                if lag_mark is not None:
+                    wrapper._recorder._lag_start = _stream_lag_start(called)
+                return wrapper
 
             event = _extract_event_from_response(
                 response,
@@ -751,12 +1432,14 @@ def _patch_openai():
                 latency_ms=latency,
             )
             if event:
-                event["prompt_messages"] = _extract_prompt_messages(kwargs)
-                _add_event(event)
+                event.update(_lag_fields(lag_mark, called))
+                _capture(event, kwargs, _extract_prompt_messages)
+            _overhead.record(_perf_counter_ns() - returned, returned - called)
 
             return response
 
         chat_mod.AsyncCompletions.create = patched_async_create
+        _LLM_CODE.add(patched_async_create.__code__)
         logger.debug("AgentPulse: patched OpenAI async SDK")
     except (AttributeError, ImportError):
         pass
@@ -777,13 +1460,16 @@ def _patch_anthropic():
 
     def patched_create(self, *args, **kwargs):
         start = time.time()
+        called = _perf_counter_ns()
+        _last_ratelimit.set(None)
         try:
             response = original_create(self, *args, **kwargs)
         except Exception as e:
             error_msg = str(e)
             status = "rate_limit" if "rate" in str(e).lower() and "limit" in str(e).lower() else "error"
-            _add_event({
-                "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+            returned = _perf_counter_ns()
+            _capture({
+                "timestamp": _timestamp(),
                 "provider": "anthropic",
                 "model": kwargs.get("model", "unknown"),
                 "input_tokens": 0,
@@ -792,14 +1478,14 @@ def _patch_anthropic():
                 "latency_ms": int((time.time() - start) * 1000),
                 "status": status,
                 "error_message": error_msg,
-                "task_context": _global_task_context,
                 "tools_used": [],
-                "prompt_messages": _extract_anthropic_messages(kwargs),
                 "response_text": None,
-                "user_id": _global_user_id,
-            })
+                **_attribution(),
+            }, kwargs, _extract_anthropic_messages)
+            _overhead.record(_perf_counter_ns() - returned, returned - called)
             raise
 
+        returned = _perf_counter_ns()
         latency = int((time.time() - start) * 1000)
 
         if kwargs.get("stream"):
@@ -807,12 +1493,13 @@ def _patch_anthropic():
 
         event = _extract_event_from_response(response, provider="anthropic", latency_ms=latency)
         if event:
-            event["prompt_messages"] = _extract_anthropic_messages(kwargs)
-            _add_event(event)
+            _capture(event, kwargs, _extract_anthropic_messages)
+        _overhead.record(_perf_counter_ns() - returned, returned - called)
 
         return response
 
     messages_mod.Messages.create = patched_create
+    _LLM_CODE.add(patched_create.__code__)
     _patched.add("anthropic")
     logger.debug("AgentPulse: patched Anthropic SDK")
 
@@ -822,13 +1509,17 @@ def _patch_anthropic():
 
         async def patched_async_create(self, *args, **kwargs):
             start = time.time()
+            called = _perf_counter_ns()
+            _last_ratelimit.set(None)
+            lag_mark = _lag_mark()
             try:
-                response = await original_async(self, *args, **kwargs)
+                response = await _awaiting_llm(original_async(self, *args, **kwargs))
             except Exception as e:
                 error_msg = str(e)
                 status = "rate_limit" if "rate" in str(e).lower() and "limit" in str(e).lower() else "error"
-                _add_event({
-                    "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                returned = _perf_counter_ns()
+                _capture({
+                    "timestamp": _timestamp(),
                     "provider": "anthropic",
                     "model": kwargs.get("model", "unknown"),
                     "input_tokens": 0,
@@ -837,31 +1528,93 @@ def _patch_anthropic():
                     "latency_ms": int((time.time() - start) * 1000),
                     "status": status,
                     "error_message": error_msg,
-                    "task_context": None,
                     "tools_used": [],
-                    "prompt_messages": _extract_anthropic_messages(kwargs),
                     "response_text": None,
-                })
+                    **_attribution(),
+                    **_lag_fields(lag_mark, called),
+                }, kwargs, _extract_anthropic_messages)
+                _overhead.record(_perf_counter_ns() - returned, returned - called)
                 raise
 
+            returned = _perf_counter_ns()
             latency = int((time.time() - start) * 1000)
 
             if kwargs.get("stream"):
-                return _AnthropicAsyncStreamWrapper(response, kwargs, start)
+                wrapper = _AnthropicAsyncStreamWrapper(response, kwargs, start)
+                if lag_mark is not None:
+                    wrapper._recorder._lag_start = _stream_lag_start(called)
+                return wrapper
 
             event = _extract_event_from_response(response, provider="anthropic", latency_ms=latency)
             if event:
-                event["prompt_messages"] = _extract_anthropic_messages(kwargs)
-                _add_event(event)
+                event.update(_lag_fields(lag_mark, called))
+                _capture(event, kwargs, _extract_anthropic_messages)
+            _overhead.record(_perf_counter_ns() - returned, returned - called)
 
             return response
 
         messages_mod.AsyncMessages.create = patched_async_create
+        _LLM_CODE.add(patched_async_create.__code__)
         logger.debug("AgentPulse: patched Anthropic async SDK")
     except (AttributeError, ImportError):
         pass
 
 
+def _patch_httpx():
+    """Patch httpx (used by both SDKs) to read rate-limit headers off every response.
+
+    With the lag monitor on, async sends also note when the request left create().
+    """
+    if "httpx" in _patched:
+        return
+
+    try:
+        import httpx
+    except ImportError:
+        logger.debug("AgentPulse: httpx not installed, skipping rate-limit capture")
+        return
+
+    original_send = httpx.Client.send
+    original_async_send = httpx.AsyncClient.send
+
+    def patched_send(self, request, *args, **kwargs):
+        response = original_send(self, request, *args, **kwargs)
+        _record_ratelimit(request, response)
+        return response
+
+    async def patched_async_send(self, request, *args, **kwargs):
+        if _lag_monitor is not None and _sent_at.get() is None:
+            _sent_at.set(_perf_counter_ns())  # first attempt only, not the SDK's retries
+        response = await original_async_send(self, request, *args, **kwargs)
+        _record_ratelimit(request, response)
+        return response
+
+    httpx.Client.send = patched_send
+    httpx.AsyncClient.send = patched_async_send
+    _patched.add("httpx")
+    logger.debug("AgentPulse: patched httpx for rate-limit headers")
+
+
+def _record_ratelimit(request, response):
+    from . import ratelimit
+    try:
+        snapshot = ratelimit.parse_headers(response.headers)
+        if not snapshot:
+            return
+        credential = request.headers.get("authorization") or request.headers.get("x-api-key")
+        provider = ratelimit.provider_from_host(request.url.host)
+        ratelimit.TRACKER.observe(provider, ratelimit.key_id(credential), snapshot)
+        _last_ratelimit.set(snapshot)
+    except Exception as e:
+        logger.debug(f"AgentPulse: could not read rate-limit headers: {e}")
+
+
+def ratelimit_headroom(provider: str = None) -> dict:
+    """Latest rate-limit snapshot per provider/key seen by this process."""
+    from . import ratelimit
+    return ratelimit.TRACKER.latest(provider)
+
+
 # ── Helpers ──
 
 def _detect_provider_from_client(completions_self, kwargs) -> str:
@@ -901,41 +1654,18 @@ def _detect_provider_from_client(completions_self, kwargs) -> str:
     return "openai"
 
 
-def _extract_prompt_messages(kwargs) -> list:
+def _copy_messages(messages, policy=None, budget=None, system=None) -> list:
+    """Text of role/content message dicts, cut to the capture policy as it is copied."""
+    pairs = [("system", system)] if system else []
+    pairs.extend((msg.get("role", "user"), msg.get("content", "")) for msg in messages if isinstance(msg, dict))
+    return (policy or _capture_policy).messages(pairs, budget)
+
+
+def _extract_prompt_messages(kwargs, policy=None, budget=None) -> list:
     """Extract prompt messages from OpenAI-style kwargs."""
-    messages = kwargs.get("messages", [])
-    result = []
-    for msg in messages:
-        if isinstance(msg, dict):
-            result.append({
-                "role": msg.get("role", "user"),
-                "content": msg.get("content", ""),
-            })
-    return result
+    return _copy_messages(kwargs.get("messages", []), policy, budget)
 
 
-def _extract_anthropic_messages(kwargs) -> list:
-    """Extract prompt messages from Anthropic-style kwargs."""
-    messages = kwargs.get("messages", [])
-    result = []
-
-    # System prompt
-    system = kwargs.get("system")
-    if system:
-        result.append({"role": "system", "content": system})
-
-    for msg in messages:
-        if isinstance(msg, dict):
-            content = msg.get("content", "")
-            if isinstance(content, list):
-                # Anthropic content blocks
-                text_parts = []
-                for block in content:
-                    if isinstance(block, dict) and block.get("type") == "text":
-                        text_parts.append(block.get("text", ""))
-                content = "\n".join(text_parts)
-            result.append({
-                "role": msg.get("role", "user"),
-                "content": content,
-            })
-    return result
+def _extract_anthropic_messages(kwargs, policy=None, budget=None) -> list:
+    """Extract prompt messages (system prompt first) from Anthropic-style kwargs."""
+    return _copy_messages(kwargs.get("messages", []), policy, budget, kwargs.get("system"))
@@ -1,13 +1,21 @@
-import json
 import time
 import logging
+import threading
+import http.client
 import urllib.request
 import urllib.error
 from typing import List
 
+from . import _codec, metrics
+
 logger = logging.getLogger("agentpulse")
 
 
+def retryable_status(status: int) -> bool:
+    """Whether a failed export is worth retrying: server errors and rate limits, not rejections."""
+    return status >= 500 or status in (408, 429)
+
+
 class _PostRedirectHandler(urllib.request.HTTPRedirectHandler):
     """Follow 307/308 redirects while preserving POST method and body."""
     def redirect_request(self, req, fp, code, msg, headers, newurl):
@@ -27,7 +35,119 @@ class _PostRedirectHandler(urllib.request.HTTPRedirectHandler):
         return super().redirect_request(req, fp, code, msg, headers, newurl)
 
 
-_opener = urllib.request.build_opener(_PostRedirectHandler)
+class _PooledResponse(http.client.HTTPResponse):
+    """HTTPResponse that hands its connection back to the pool on close()."""
+    _release = None
+
+    def close(self):
+        drained = self.fp is None
+        super().close()
+        release, self._release = self._release, None
+        if release:
+            release(drained)
+
+
+class _ConnectionPool:
+    """Keep-alive HTTP(S) connections shared by every EventSender in the process.
+
+    urllib opens (and closes) a fresh connection for every request. A daemon
+    flushing batches for several agents to the same endpoint would otherwise
+    pay a TCP + TLS handshake per flush per agent.
+    """
+
+    def __init__(self, max_idle_per_host: int = 4):
+        self.max_idle_per_host = max_idle_per_host
+        self.connections_opened = 0
+        self._idle: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def open(self, req, secure: bool, context=None):
+        host = req.host
+        if not host:
+            raise urllib.error.URLError("no host given")
+        key = (secure, host)
+
+        def connect():
+            self.connections_opened += 1
+            if secure:
+                return http.client.HTTPSConnection(host, timeout=req.timeout, context=context)
+            return http.client.HTTPConnection(host, timeout=req.timeout)
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update({k: v for k, v in req.headers.items() if k not in headers})
+        headers = {name.title(): val for name, val in headers.items()}
+
+        conn = self._checkout(key)
+        reused = conn is not None
+        if conn is None:
+            conn = connect()
+        try:
+            resp = self._send(conn, req, headers)
+        except (http.client.HTTPException, OSError) as e:
+            conn.close()
+            if not reused:
+                raise urllib.error.URLError(e)
+            # Idle keep-alive connection was closed by the server — retry once fresh
+            conn = connect()
+            try:
+                resp = self._send(conn, req, headers)
+            except (http.client.HTTPException, OSError) as e2:
+                conn.close()
+                raise urllib.error.URLError(e2)
+
+        resp.url = req.get_full_url()
+        resp.msg = resp.reason
+        resp._release = lambda drained: self._checkin(key, conn, drained)
+        return resp
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    @staticmethod
+    def _send(conn, req, headers):
+        conn.timeout = req.timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(req.timeout)
+        conn.response_class = _PooledResponse
+        conn.request(req.get_method(), req.selector, req.data, headers)
+        return conn.getresponse()
+
+    def _checkout(self, key):
+        with self._lock:
+            conns = self._idle.get(key)
+            return conns.pop() if conns else None
+
+    def _checkin(self, key, conn, drained):
+        if drained:
+            with self._lock:
+                conns = self._idle.setdefault(key, [])
+                if len(conns) < self.max_idle_per_host:
+                    conns.append(conn)
+                    return
+        # Unread body left on the socket, or the pool is full
+        conn.close()
+
+
+_pool = _ConnectionPool()
+
+
+class _PooledHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return _pool.open(req, secure=False)
+
+
+class _PooledHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        if req._tunnel_host:
+            return super().https_open(req)  # CONNECT through an HTTP proxy
+        return _pool.open(req, secure=True, context=self._context)
+
+
+_opener = urllib.request.build_opener(_PostRedirectHandler, _PooledHTTPHandler, _PooledHTTPSHandler)
 
 
 class EventSender:
@@ -40,6 +160,9 @@ class EventSender:
         self.last_send = time.time()
         self.events_sent = 0
         self.errors = 0
+        self._m_sent = metrics.EVENTS_SENT.labels(agent_name)
+        self._m_flush = metrics.FLUSH_SECONDS.labels(agent_name)
+        self._m_failures = metrics.FLUSH_FAILURES.labels(agent_name)
 
     def add_event(self, event: dict):
         self.buffer.append(event)
@@ -68,8 +191,9 @@ class EventSender:
             "events": clean_events,
         }
 
+        started = time.perf_counter()
         try:
-            data = json.dumps(payload).encode("utf-8")
+            data = _codec.dumps(payload)
             req = urllib.request.Request(
                 self.endpoint,
                 data=data,
@@ -78,7 +202,9 @@ class EventSender:
             )
             with _opener.open(req, timeout=10) as resp:
                 if resp.status == 200:
-                    result = json.loads(resp.read().decode())
+                    resp.read()
+                    self._m_flush.observe(time.perf_counter() - started)
+                    self._m_sent.inc(len(self.buffer))
                     self.events_sent += len(self.buffer)
                     logger.info(f"Sent {len(self.buffer)} events (total: {self.events_sent})")
                     self.buffer = []
@@ -86,13 +212,16 @@ class EventSender:
                     return True
                 else:
                     self.errors += 1
+                    self._m_failures.inc()
                     logger.error(f"API returned status {resp.status}")
                     return False
         except urllib.error.HTTPError as e:
             self.errors += 1
+            self._m_failures.inc()
             logger.error(f"HTTP error: {e.code} - {e.reason}")
             return False
         except Exception as e:
             self.errors += 1
+            self._m_failures.inc()
             logger.error(f"Send failed: {e}")
             return False
@@ -0,0 +1,115 @@
+"""In-flight request coalescing for the LLM proxy.
+
+When several identical requests arrive while the first one is still
+waiting on the provider, only the first (the leader) goes upstream. The
+others (followers) attach to its Flight and receive the same status,
+headers and body — for SSE responses they are fed each chunk as the leader
+receives it, so streaming clients still see tokens as they arrive.
+
+A flight lives only while the leader's upstream call is running. Requests
+that arrive after it finished start a new flight (or hit the response
+cache, if enabled). If the leader fails before publishing a response,
+followers forward the request themselves. A non-streaming response is only
+published once its whole body has been read, so followers never relay
+headers for a body that didn't arrive.
+"""
+
+import logging
+import threading
+
+from .cache import is_deterministic
+
+logger = logging.getLogger("agentpulse.singleflight")
+
+
+class Flight:
+    """One upstream call shared by a leader and any number of followers."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._chunks: list[bytes] = []
+        self.status = None
+        self.headers = None
+        self.done = False
+        self.followers = 0
+
+    # ── leader side ──
+
+    def start(self, status: int, headers: list):
+        with self._cond:
+            self.status = status
+            self.headers = headers
+            self._cond.notify_all()
+
+    def write(self, chunk: bytes):
+        with self._cond:
+            self._chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self):
+        with self._cond:
+            self.done = True
+            self._cond.notify_all()
+
+    def fail(self):
+        """End the flight after an upstream error; followers not yet answered retry on their own."""
+        self.finish()
+
+    # ── follower side ──
+
+    def wait_start(self, timeout: float = None) -> bool:
+        """Wait for response headers. False if the leader failed before getting any."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.status is not None or self.done, timeout)
+            return self.status is not None
+
+    def chunks(self):
+        """Yield body chunks as the leader receives them, until the flight ends."""
+        sent = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: sent < len(self._chunks) or self.done)
+                batch = self._chunks[sent:]
+                if not batch and self.done:
+                    return
+            sent += len(batch)
+            yield from batch
+
+
+class SingleFlight:
+    """Groups concurrent requests by canonical request key."""
+
+    def __init__(self, deterministic_only: bool = True):
+        # Sampled requests (temperature > 0) are usually sent in parallel on
+        # purpose, to get different answers; only coalesce them if asked to.
+        self.deterministic_only = deterministic_only
+        self._flights: dict[str, Flight] = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def should_coalesce(self, request_json: dict) -> bool:
+        return not self.deterministic_only or is_deterministic(request_json)
+
+    def join(self, key: str) -> tuple[Flight, bool]:
+        """Attach to the flight for key, or start one. Returns (flight, is_leader)."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.followers += 1
+                self.coalesced += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            return flight, True
+
+    def land(self, key: str, flight: Flight):
+        """End a flight. Safe to call more than once."""
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        if not flight.done:
+            flight.finish()
+            if flight.followers:
+                logger.debug(f"Flight {key[:12]} served {flight.followers} coalesced request(s)")
+
+    def in_flight(self) -> int:
+        return len(self._flights)
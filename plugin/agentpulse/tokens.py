@@ -0,0 +1,222 @@
+"""Local token counts for calls whose usage wasn't reported.
+
+Streams without usage (OpenAI's default) and proxied calls without a usage
+block used to be estimated at len(text) // 4, which is badly off for code
+and non-English text. Counts now come from the first available backend:
+
+  tiktoken  the offline BPE (the model's own encoding, cl100k_base for
+            non-OpenAI models), when installed and its files are cached.
+            tiktoken downloads missing files on first use, so only
+            encodings already in its cache directory are loaded; models
+            whose encoding isn't cached use the ratio estimate
+  ratio     characters per token of prose for the model's family, plus
+            per-character weights for ASCII symbols, CJK and other
+            non-ASCII text
+
+Set AGENTPULSE_TOKENIZER=tiktoken|ratio to force one, or pass a
+count(text, model) -> int callable to set_backend().
+
+count_messages() memoizes the count of each prompt prefix under a chain of
+content hashes, so a conversation that grows a turn at a time is only
+tokenized for its new messages.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+
+from .capture import content_text
+
+BACKEND = None  # chosen on first use
+
+# Characters per token of English prose, by model prefix (first match wins)
+_CHARS_PER_TOKEN = (
+    ("gpt-4o", 4.2), ("gpt-4.1", 4.2), ("gpt-5", 4.2), ("o1", 4.2), ("o3", 4.2), ("o4", 4.2),
+    ("gpt-", 4.0),
+    ("claude", 3.6),
+    ("gemini", 4.0),
+    ("llama", 4.0),
+    ("mistral", 3.6),
+    ("deepseek", 3.8), ("qwen", 3.8), ("minimax", 3.8),
+)
+_DEFAULT_CHARS_PER_TOKEN = 3.8
+_SYMBOL_TOKENS = 0.6  # per ASCII symbol: code and JSON punctuation rarely merges with letters
+_WIDE_TOKENS = 1.0  # per CJK character
+_OTHER_NON_ASCII_TOKENS = 0.45  # per accented Latin / Cyrillic / Greek ... character
+
+_SYMBOL_RE = re.compile(r"[!-/:-@\[-`{-~]")
+_NON_ASCII_RE = re.compile(r"[^\x00-\x7f]")
+_WIDE_RE = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\U00020000-\U0002ffff]")
+
+MESSAGE_TOKENS = 3  # role and separators around each chat message
+PREFIX_CACHE_SIZE = 4096
+
+# Where tiktoken fetches its encoding files from, and caches them under sha1(url)
+_TIKTOKEN_BLOB_URL = "https://openaipublic.blob.core.windows.net/encodings/{}.tiktoken"
+_TIKTOKEN_FALLBACK = "cl100k_base"
+
+_count = None
+_ratios: dict = {}
+_prefix_counts: dict = {}  # chain hash of a prompt prefix -> its token count
+_lock = threading.Lock()
+
+
+def _chars_per_token(model: str) -> float:
+    ratio = _ratios.get(model)
+    if ratio is None:
+        name = (model or "").lower().rsplit("/", 1)[-1]
+        ratio = next((r for prefix, r in _CHARS_PER_TOKEN if name.startswith(prefix)), _DEFAULT_CHARS_PER_TOKEN)
+        _ratios[model] = ratio
+    return ratio
+
+
+def _ratio_count(text: str, model: str = None) -> int:
+    if not text:
+        return 0
+    symbols = len(_SYMBOL_RE.findall(text))
+    plain = len(text) - symbols
+    estimate = symbols * _SYMBOL_TOKENS
+    if not text.isascii():
+        non_ascii = len(_NON_ASCII_RE.findall(text))
+        wide = len(_WIDE_RE.findall(text))
+        plain -= non_ascii
+        estimate += wide * _WIDE_TOKENS + (non_ascii - wide) * _OTHER_NON_ASCII_TOKENS
+    return max(1, round(estimate + plain / _chars_per_token(model)))
+
+
+def _tiktoken_cache_dir() -> str:
+    # Same lookup as tiktoken.load.read_file_cached
+    if "TIKTOKEN_CACHE_DIR" in os.environ:
+        return os.environ["TIKTOKEN_CACHE_DIR"]
+    if "DATA_GYM_CACHE_DIR" in os.environ:
+        return os.environ["DATA_GYM_CACHE_DIR"]
+    return os.path.join(tempfile.gettempdir(), "data-gym-cache")
+
+
+def _tiktoken_cached(name: str) -> bool:
+    """Whether tiktoken can load encoding `name` without going to the network."""
+    cache_dir = _tiktoken_cache_dir()
+    if not cache_dir:  # caching disabled: every load is a download
+        return False
+    key = hashlib.sha1(_TIKTOKEN_BLOB_URL.format(name).encode()).hexdigest()
+    return os.path.isfile(os.path.join(cache_dir, key))
+
+
+def _load_tiktoken():
+    import tiktoken
+    import tiktoken.model
+
+    if not _tiktoken_cached(_TIKTOKEN_FALLBACK):
+        raise ImportError("tiktoken encoding files are not cached")
+
+    encodings = {}
+
+    def encoding_for(model):
+        try:
+            name = tiktoken.model.encoding_name_for_model(model)
+        except KeyError:
+            name = _TIKTOKEN_FALLBACK
+        if not _tiktoken_cached(name):
+            return None  # would be downloaded: stay offline
+        return tiktoken.get_encoding(name)
+
+    def count(text, model=None):
+        encoding = encodings.get(model, False)
+        if encoding is False:
+            try:
+                encoding = encoding_for(model or "")
+            except Exception:
+                encoding = None
+            encodings[model] = encoding
+        if encoding is None:
+            return _ratio_count(text, model)
+        return len(encoding.encode(text, disallowed_special=()))
+
+    return count
+
+
+_BACKENDS = {
+    "tiktoken": _load_tiktoken,
+    "ratio": lambda: _ratio_count,
+}
+
+
+def set_backend(backend=None) -> str:
+    """Select a backend by name, the first installed one if None, or a count(text, model) callable.
+
+    Returns the name of the backend in use. Unknown or uninstalled
+    backends fall back to the ratio estimate.
+    """
+    global _count, BACKEND
+    with _lock:
+        _prefix_counts.clear()
+    if callable(backend):
+        _count, BACKEND = backend, "custom"
+        return BACKEND
+    for candidate in [backend] if backend else list(_BACKENDS):
+        factory = _BACKENDS.get(candidate)
+        if not factory:
+            continue
+        try:
+            _count = factory()
+        except ImportError:
+            continue
+        BACKEND = candidate
+        return BACKEND
+    _count, BACKEND = _ratio_count, "ratio"
+    return BACKEND
+
+
+def _counter():
+    if _count is None:
+        set_backend(os.environ.get("AGENTPULSE_TOKENIZER") or None)
+    return _count
+
+
+def count_text(text: str, model: str = None) -> int:
+    """Tokens in text for model."""
+    if not text:
+        return 0
+    return _counter()(text, model)
+
+
+def count_messages(messages, model: str = None, system=None) -> int:
+    """Prompt tokens of chat messages (role/content dicts), plus an optional system prompt.
+
+    Keys are chained message by message, hash((previous key, role,
+    hash(content))); str caches its own hash, so re-sending the same
+    history costs a dict lookup per message.
+    """
+    count = _counter()
+    pairs = [("system", system)] if system else []
+    pairs.extend((msg.get("role", "user"), msg.get("content", "")) for msg in messages if isinstance(msg, dict))
+    keys = []
+    texts = []
+    key = hash((BACKEND, model))
+    for role, content in pairs:
+        if not isinstance(content, str):
+            content = content_text(content)
+        key = hash((key, role, hash(content), len(content)))
+        keys.append(key)
+        texts.append(content)
+
+    # Longest prefix counted before
+    start, total = 0, 0
+    for i in range(len(keys) - 1, -1, -1):
+        cached = _prefix_counts.get(keys[i])
+        if cached is not None:
+            start, total = i + 1, cached
+            break
+
+    counted = []
+    for i in range(start, len(pairs)):
+        total += (count(texts[i], model) if texts[i] else 0) + MESSAGE_TOKENS
+        counted.append((keys[i], total))
+    if counted:
+        with _lock:
+            _prefix_counts.update(counted)
+            while len(_prefix_counts) > PREFIX_CACHE_SIZE:
+                del _prefix_counts[next(iter(_prefix_counts))]
+    return total
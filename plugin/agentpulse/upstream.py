@@ -0,0 +1,242 @@
+"""Upstream connections for the proxy: failover and hedged requests.
+
+A provider can map to several base URLs (regional endpoints, an
+OpenAI-compatible mirror, ...). open_with_failover() tries them in order and
+moves on when a connection fails or the upstream answers with a 5xx; the
+last URL's answer is returned as-is. Nothing has been sent to the client at
+that point, so failing over is invisible to it.
+
+HedgePolicy adds hedging for non-streaming requests: if the first attempt
+hasn't finished after a delay (by default the p95 of recent latencies for
+that provider), a second attempt is sent — to the next base URL if there is
+one — and whichever finishes first wins. The loser's connection is closed.
+"""
+
+import http.client
+import logging
+import queue
+import socket
+import ssl
+import threading
+import time
+import urllib.parse
+from collections import deque
+from typing import Optional
+
+from . import metrics
+from .cache import is_deterministic
+
+logger = logging.getLogger("agentpulse.upstream")
+
+FAILOVER_ERRORS = (OSError, http.client.HTTPException)
+
+_ssl_ctx = ssl.create_default_context()
+
+
+def connect(base_url: str, timeout: float = 300):
+    """Open a connection to base_url. Returns (conn, path_prefix)."""
+    parsed = urllib.parse.urlparse(base_url)
+    if parsed.scheme == "https":
+        conn = http.client.HTTPSConnection(parsed.hostname, parsed.port or 443, context=_ssl_ctx, timeout=timeout)
+    else:
+        conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=timeout)
+    return conn, parsed.path.rstrip("/")
+
+
+def open_with_failover(provider, targets, method, path, body, headers, timeout=300, on_connect=None,
+                       cancelled=None):
+    """Send a request to the first base URL that answers without a 5xx.
+
+    Returns (conn, response) with the response body still unread.
+    on_connect(conn) is called for every connection opened, so callers can
+    close them from another thread; set the cancelled event first so the
+    resulting error doesn't trigger a failover.
+    """
+    last_error = None
+    for i, base_url in enumerate(targets):
+        if cancelled is not None and cancelled.is_set():
+            break
+        last = i == len(targets) - 1
+        conn, prefix = connect(base_url, timeout)
+        if on_connect is not None:
+            on_connect(conn)
+        try:
+            conn.request(method, prefix + path, body=body, headers=headers)
+            resp = conn.getresponse()
+        except FAILOVER_ERRORS as e:
+            conn.close()
+            last_error = e
+            if not last:
+                logger.warning(f"Upstream {base_url} failed ({e}), failing over")
+                metrics.PROXY_FAILOVERS.labels(provider).inc()
+            continue
+        if resp.status >= 500 and not last:
+            logger.warning(f"Upstream {base_url} returned {resp.status}, failing over")
+            metrics.PROXY_FAILOVERS.labels(provider).inc()
+            conn.close()
+            continue
+        return conn, resp
+    raise last_error or ConnectionAbortedError("request cancelled")
+
+
+def _cancel(conn):
+    """Abort a connection another thread may be blocked reading from."""
+    sock = conn.sock
+    if sock is not None:
+        try:
+            # close() alone doesn't wake a blocked recv(); shutdown() does
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    conn.close()
+
+
+class BufferedResponse:
+    """A fully read upstream response, shaped like http.client.HTTPResponse."""
+
+    __slots__ = ("status", "_headers", "_body", "headers_at")
+
+    def __init__(self, status: int, headers: list, body: bytes, headers_at: float = None):
+        self.status = status
+        self._headers = headers
+        self._body = body
+        self.headers_at = headers_at  # perf_counter() when the headers arrived
+
+    def getheaders(self) -> list:
+        return self._headers
+
+    def read(self) -> bytes:
+        return self._body
+
+
+class HedgePolicy:
+    """When and how to send a second copy of a slow request."""
+
+    def __init__(
+        self,
+        delay_ms: Optional[float] = None,
+        percentile: float = 95,
+        min_delay_ms: float = 250,
+        initial_delay_ms: float = 2000,
+        min_samples: int = 20,
+        window: int = 200,
+        hedge_all: bool = False,
+    ):
+        self.delay_ms = delay_ms
+        self.percentile = percentile
+        self.min_delay_ms = min_delay_ms
+        self.initial_delay_ms = initial_delay_ms
+        self.min_samples = min_samples
+        self.window = window
+        # Hedging a sampled request can bill two different answers; only
+        # deterministic ones are hedged unless asked otherwise.
+        self.hedge_all = hedge_all
+        self._latencies: dict[str, deque] = {}
+
+    def eligible(self, method: str, request_json: dict, is_streaming: bool) -> bool:
+        if is_streaming:
+            return False
+        if method in ("GET", "HEAD"):
+            return True
+        return method == "POST" and (self.hedge_all or is_deterministic(request_json))
+
+    def record(self, provider: str, seconds: float):
+        samples = self._latencies.get(provider)
+        if samples is None:
+            samples = self._latencies.setdefault(provider, deque(maxlen=self.window))
+        samples.append(seconds)
+
+    def delay(self, provider: str) -> float:
+        """Seconds to wait before hedging a request to provider."""
+        if self.delay_ms:
+            return self.delay_ms / 1000
+        samples = sorted(self._latencies.get(provider, ()))
+        if len(samples) < self.min_samples:
+            return self.initial_delay_ms / 1000
+        index = min(len(samples) - 1, int(len(samples) * self.percentile / 100))
+        return max(samples[index], self.min_delay_ms / 1000)
+
+    def run(self, provider, targets, method, path, body, headers, timeout=300) -> BufferedResponse:
+        """Send the request, hedging it if it's slow. Returns the first good response."""
+        results = queue.Queue()
+        attempts = []
+        lock = threading.Lock()  # an attempt's connections vs. its cancellation
+
+        def launch(offset):
+            conns = []
+            attempts.append((conns, threading.Event()))
+            rotated = targets[offset % len(targets):] + targets[:offset % len(targets)]
+            thread = threading.Thread(
+                target=self._attempt,
+                args=(provider, rotated, method, path, body, headers, timeout, attempts[-1], lock, results),
+                daemon=True,
+            )
+            thread.start()
+
+        launch(0)
+        pending = 1
+        hedged = False
+        winner = None
+        fallback = None
+        wait = self.delay(provider)
+        while pending:
+            try:
+                conns, response, error = results.get(timeout=wait)
+            except queue.Empty:
+                if hedged:
+                    break
+                # Primary is slow: send the hedge and wait for either
+                launch(1)
+                pending += 1
+                hedged = True
+                wait = timeout
+                continue
+            pending -= 1
+            if response is not None and response.status < 500:
+                winner = conns
+                fallback = response
+                break
+            fallback = response or fallback or error
+
+        for conns, cancelled in attempts:
+            if conns is not winner:
+                with lock:
+                    cancelled.set()
+                    opened = list(conns)
+                for conn in opened:
+                    _cancel(conn)
+        if hedged:
+            won = "hedge" if winner is not None and winner is attempts[-1][0] else "primary"
+            metrics.PROXY_HEDGES.labels(provider, won if winner is not None else "none").inc()
+
+        if isinstance(fallback, BufferedResponse):
+            return fallback
+        raise fallback or TimeoutError("upstream timed out")
+
+    @staticmethod
+    def _attempt(provider, targets, method, path, body, headers, timeout, attempt, lock, results):
+        conns, cancelled = attempt
+
+        def on_connect(conn):
+            # Checked under the lock run() cancels with, so a connection opened
+            # just after the losers were closed never sends its request
+            with lock:
+                if not cancelled.is_set():
+                    conns.append(conn)
+                    return
+            conn.close()
+            raise ConnectionAbortedError("request cancelled")
+
+        try:
+            conn, resp = open_with_failover(
+                provider, targets, method, path, body, headers, timeout,
+                on_connect=on_connect, cancelled=cancelled,
+            )
+            headers_at = time.perf_counter()
+            try:
+                response = BufferedResponse(resp.status, resp.getheaders(), resp.read(), headers_at)
+            finally:
+                conn.close()
+            results.put((conns, response, None))
+        except Exception as e:
+            results.put((conns, None, e))
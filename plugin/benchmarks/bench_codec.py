@@ -0,0 +1,92 @@
+"""Benchmark the JSON codec backends on agentpulse's hot paths.
+
+Usage:
+    python benchmarks/bench_codec.py [iterations]
+
+Compares every installed backend against the stdlib on:
+  - parsing OpenClaw log lines (daemon tail loop)
+  - parsing a chat completion response body (proxy capture)
+  - encoding a 50-event batch payload (SDK / sender flush)
+"""
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from agentpulse import _codec  # noqa: E402
+
+LOG_LINE = json.dumps({
+    "0": json.dumps({"subsystem": "agent/embedded"}),
+    "1": "embedded run prompt end: runId=abc123 sessionId=s-42 durationMs=121466",
+    "_meta": {"date": "2026-02-01T12:00:00.000Z", "logLevelName": "DEBUG"},
+    "time": "2026-02-01T12:00:00.000Z",
+})
+
+RESPONSE_BODY = json.dumps({
+    "id": "chatcmpl-1",
+    "model": "gpt-4o",
+    "choices": [{"message": {"role": "assistant", "content": "word " * 400}}],
+    "usage": {"prompt_tokens": 1200, "completion_tokens": 400, "total_tokens": 1600},
+}).encode()
+
+PAYLOAD = {
+    "api_key": "ap_bench",
+    "agent_name": "bench",
+    "framework": "python-sdk",
+    "events": [
+        {
+            "timestamp": datetime.now(timezone.utc),  # exercises the str() fallback
+            "provider": "openai",
+            "model": "gpt-4o",
+            "input_tokens": 1200,
+            "output_tokens": 400,
+            "cost_usd": 0.007,
+            "latency_ms": 950,
+            "status": "success",
+            "error_message": None,
+            "task_context": "bench",
+            "tools_used": ["search", "exec"],
+            "prompt_messages": [
+                {"role": "system", "content": "You are helpful. " * 20},
+                {"role": "user", "content": "Summarize this. " * 50},
+            ],
+            "response_text": "word " * 400,
+        }
+        for _ in range(50)
+    ],
+}
+
+
+def _bench(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def run(iterations):
+    backends = ["stdlib"] + [b for b in _codec._BACKENDS]
+    results = {}
+    for name in backends:
+        if _codec.set_backend(name) != name:
+            print(f"{name:8s} not installed, skipping")
+            continue
+        results[name] = (
+            _bench(lambda: _codec.loads(LOG_LINE), iterations),
+            _bench(lambda: _codec.loads(RESPONSE_BODY), iterations),
+            _bench(lambda: _codec.dumps(PAYLOAD), max(1, iterations // 50)),
+        )
+    _codec.set_backend()
+
+    base = results["stdlib"]
+    print(f"\n{'backend':8s} {'log line':>16s} {'response':>16s} {'batch dumps':>16s}")
+    for name, timings in results.items():
+        cols = [f"{t:8.2f}us x{b / t:4.1f}" for t, b in zip(timings, base)]
+        print(f"{name:8s} {cols[0]:>16s} {cols[1]:>16s} {cols[2]:>16s}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,46 @@
+"""Per-operation cost of the self-metrics on the hot paths.
+
+Usage:
+    python benchmarks/bench_metrics.py [iterations]
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from agentpulse import metrics  # noqa: E402
+
+
+def _bench(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e9
+
+
+def run(iterations):
+    counter = metrics.Counter("bench_total", "bench", register=False)
+    child = metrics.Counter("bench_labelled_total", "bench", ["agent"], register=False).labels("a")
+    hist = metrics.Histogram("bench_seconds", "bench", register=False)
+    lock = threading.Lock()
+    state = [0]
+
+    def locked_inc():
+        with lock:
+            state[0] += 1
+
+    rows = [
+        ("baseline (empty call)", lambda: None),
+        ("locked int += 1", locked_inc),
+        ("Counter.inc()", counter.inc),
+        ("cached child .inc()", child.inc),
+        ("Histogram.observe()", lambda: hist.observe(0.042)),
+    ]
+    for name, fn in rows:
+        print(f"{name:24s} {_bench(fn, iterations):8.1f} ns/op")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,86 @@
+"""Per-request overhead of the proxy over loopback TCP vs a Unix socket.
+
+Runs the proxy in-process against a local upstream that answers instantly,
+so the numbers are mostly connection setup and the proxy's own work.
+
+Usage:
+    python benchmarks/bench_proxy_transport.py [requests]
+"""
+import http.client
+import http.server
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from agentpulse.proxy import LLMProxyServer  # noqa: E402
+
+BODY = json.dumps({"model": "gpt-4o", "messages": [{"role": "user", "content": "Hi"}]}).encode()
+RESPONSE = json.dumps({
+    "model": "gpt-4o",
+    "choices": [{"message": {"role": "assistant", "content": "Hello!"}}],
+    "usage": {"prompt_tokens": 12, "completion_tokens": 3},
+}).encode()
+
+
+class _Upstream(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__("localhost")
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.unix_path)
+
+
+def _bench(connect, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        conn = connect()
+        conn.request("POST", "/openai/v1/chat/completions", body=BODY, headers={"Content-Type": "application/json"})
+        conn.getresponse().read()
+        conn.close()
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def run(requests):
+    upstream = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Upstream)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    path = os.path.join(tempfile.mkdtemp(), "proxy.sock")
+    proxy = LLMProxyServer(
+        port=0, providers={"openai": f"http://127.0.0.1:{upstream.server_address[1]}"}, socket_path=path
+    )
+    proxy.start()
+    try:
+        rows = [
+            ("loopback TCP", lambda: http.client.HTTPConnection("127.0.0.1", proxy.port)),
+            ("Unix socket", lambda: _UnixHTTPConnection(path)),
+        ]
+        for name, connect in rows:
+            _bench(connect, min(requests, 50))  # warm up
+            print(f"{name:16s} {_bench(connect, requests):8.1f} us/request")
+    finally:
+        proxy.stop()
+        upstream.shutdown()
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
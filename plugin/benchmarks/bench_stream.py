@@ -0,0 +1,66 @@
+"""Per-chunk overhead of the SDK streaming wrappers.
+
+Compares iterating a stream of chunks directly with iterating it through
+the OpenAI and Anthropic wrappers, for chunk classes that declare their
+fields (the SDKs' pydantic models) and for plain objects.
+
+Usage:
+    python benchmarks/bench_stream.py [chunks]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from agentpulse import sdk  # noqa: E402
+
+
+class _Obj:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class _Declared(_Obj):
+    model_fields = {"model": None, "choices": None, "usage": None, "type": None}
+
+
+def _openai_chunks(cls, n):
+    return [
+        cls(model="gpt-4o", choices=[_Obj(delta=_Obj(content="tok", tool_calls=None))], usage=None)
+        for _ in range(n)
+    ]
+
+
+def _anthropic_chunks(cls, n):
+    return [cls(type="content_block_delta", delta=_Obj(type="text_delta", text="tok")) for _ in range(n)]
+
+
+def _bench(make_iter, chunks, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in make_iter():
+            pass
+        best = min(best, time.perf_counter() - start)
+    return best / chunks * 1e9
+
+
+def run(chunks):
+    sdk._add_event = lambda event: None
+    kwargs = {"model": "gpt-4o", "messages": [{"role": "user", "content": "Hi"}]}
+    rows = []
+    for label, cls in (("declared fields", _Declared), ("plain objects", _Obj)):
+        openai = _openai_chunks(cls, chunks)
+        anthropic = _anthropic_chunks(cls, chunks)
+        rows += [
+            (f"raw iteration ({label})", lambda c=openai: iter(c)),
+            (f"OpenAI wrapper ({label})", lambda c=openai: sdk._OpenAIStreamWrapper(iter(c), kwargs, "openai", time.time())),
+            (f"Anthropic wrapper ({label})", lambda c=anthropic: sdk._AnthropicStreamWrapper(iter(c), kwargs, time.time())),
+        ]
+    for name, make_iter in rows:
+        print(f"{name:36s} {_bench(make_iter, chunks):8.1f} ns/chunk")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
@@ -0,0 +1,128 @@
+"""Tests for agentpulse.admission — proxy concurrency, rate limits and priority queueing."""
+
+import threading
+import time
+
+import pytest
+from agentpulse.admission import (
+    AdmissionController,
+    AdmissionRejected,
+    estimate_request_tokens,
+    parse_priority,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _wait_queued(controller, provider, n):
+    deadline = time.monotonic() + 5
+    while controller.stats()[provider]["queued"] < n:
+        assert time.monotonic() < deadline, "waiters never queued"
+        time.sleep(0.01)
+
+
+class TestHelpers:
+    def test_parse_priority(self):
+        assert parse_priority(None) == 0
+        assert parse_priority("high") > parse_priority("normal") > parse_priority("low")
+        assert parse_priority("5") == 5
+        assert parse_priority("urgent!") == 0
+
+    def test_estimate_includes_max_tokens(self):
+        assert estimate_request_tokens({"max_tokens": 100}, 400) == 200
+        assert estimate_request_tokens({}, 400) == 100
+
+
+class TestAdmissionController:
+    def test_unlimited_provider_is_not_tracked(self):
+        controller = AdmissionController({"anthropic": {"concurrency": 1}})
+        assert controller.acquire("openai", "gpt-4o") is None
+
+    def test_concurrency_limit_queues_until_release(self):
+        controller = AdmissionController({"openai": {"concurrency": 1}})
+        first = controller.acquire("openai", "gpt-4o")
+        admitted = []
+        thread = threading.Thread(target=lambda: admitted.append(controller.acquire("openai", "gpt-4o")))
+        thread.start()
+        _wait_queued(controller, "openai", 1)
+        assert not admitted
+
+        time.sleep(0.02)
+        controller.release(first)
+        thread.join(5)
+        assert admitted and admitted[0].granted
+        assert controller.queue_ms(admitted[0]) >= 20
+
+    def test_higher_priority_goes_first(self):
+        controller = AdmissionController({"openai": {"concurrency": 1}})
+        held = controller.acquire("openai", "gpt-4o")
+        order = []
+
+        def wait(name, priority):
+            ticket = controller.acquire("openai", "gpt-4o", priority=priority)
+            order.append(name)
+            controller.release(ticket)
+
+        low = threading.Thread(target=wait, args=("low", -10))
+        low.start()
+        _wait_queued(controller, "openai", 1)
+        high = threading.Thread(target=wait, args=("high", 10))
+        high.start()
+        _wait_queued(controller, "openai", 2)
+
+        controller.release(held)
+        low.join(5)
+        high.join(5)
+        assert order == ["high", "low"]
+
+    def test_model_limit_does_not_block_other_models(self):
+        controller = AdmissionController({"anthropic": {"models": {"claude-opus-4": {"concurrency": 1}}}})
+        controller.acquire("anthropic", "claude-opus-4")
+        blocked = threading.Thread(target=controller.acquire, args=("anthropic", "claude-opus-4"))
+        blocked.daemon = True
+        blocked.start()
+        _wait_queued(controller, "anthropic", 1)
+        assert controller.acquire("anthropic", "claude-haiku-4").granted
+
+    def test_rpm_window(self):
+        clock = FakeClock()
+        controller = AdmissionController({"openai": {"rpm": 2}}, queue_timeout=0, clock=clock)
+        controller.acquire("openai", "gpt-4o")
+        controller.acquire("openai", "gpt-4o")
+        with pytest.raises(AdmissionRejected):
+            controller.acquire("openai", "gpt-4o")
+        clock.now += 61
+        assert controller.acquire("openai", "gpt-4o").granted
+
+    def test_tpm_charged_with_actual_usage(self):
+        clock = FakeClock()
+        controller = AdmissionController({"openai": {"tpm": 1000}}, queue_timeout=0, clock=clock)
+        ticket = controller.acquire("openai", "gpt-4o", tokens=900)
+        with pytest.raises(AdmissionRejected):
+            controller.acquire("openai", "gpt-4o", tokens=200)
+        controller.release(ticket, tokens_used=300)
+        assert controller.acquire("openai", "gpt-4o", tokens=200).granted
+        assert controller.stats()["openai"]["tokens_last_minute"] == 500
+
+    def test_queue_timeout_and_full_queue(self):
+        controller = AdmissionController({"openai": {"concurrency": 1}}, queue_timeout=0.05, max_queue=1)
+        controller.acquire("openai", "gpt-4o")
+        with pytest.raises(AdmissionRejected) as exc:
+            controller.acquire("openai", "gpt-4o")
+        assert exc.value.reason == "queue timeout"
+        assert controller.stats()["openai"]["queued"] == 0
+
+        controller.queue_timeout = 5
+        waiter = threading.Thread(target=lambda: pytest.raises(AdmissionRejected, controller.acquire, "openai", "x"))
+        waiter.daemon = True
+        waiter.start()
+        _wait_queued(controller, "openai", 1)
+        with pytest.raises(AdmissionRejected) as exc:
+            controller.acquire("openai", "gpt-4o")
+        assert exc.value.reason == "queue full"
@@ -0,0 +1,94 @@
+"""Tests for agentpulse.cache — request keys and the two-tier response cache."""
+
+import os
+
+from agentpulse.cache import CachedResponse, ResponseCache, is_deterministic, request_key
+
+
+CHAT = {"model": "gpt-4o", "temperature": 0, "messages": [{"role": "user", "content": "Hi"}]}
+
+
+def _entry(body=b'{"ok":true}', created=None):
+    return CachedResponse(200, [("Content-Type", "application/json"), ("Date", "x")], body, "gpt-4o", created)
+
+
+class TestRequestKey:
+    def test_key_order_does_not_matter(self):
+        reordered = {"messages": CHAT["messages"], "temperature": 0, "model": "gpt-4o"}
+        assert request_key("openai", "/v1/chat", CHAT) == request_key("openai", "/v1/chat", reordered)
+
+    def test_user_field_is_ignored(self):
+        assert request_key("openai", "/v1/chat", CHAT) == request_key("openai", "/v1/chat", {**CHAT, "user": "u1"})
+
+    def test_inputs_change_the_key(self):
+        base = request_key("openai", "/v1/chat", CHAT)
+        assert base != request_key("anthropic", "/v1/chat", CHAT)
+        assert base != request_key("openai", "/v1/chat", {**CHAT, "model": "gpt-4o-mini"})
+        assert base != request_key("openai", "/v1/chat", CHAT, accept_encoding="gzip")
+        assert base != request_key("openai", "/v1/chat", CHAT, scope="other-key")
+
+    def test_deterministic(self):
+        assert is_deterministic(CHAT)
+        assert not is_deterministic({**CHAT, "temperature": 0.7})
+        assert not is_deterministic({"model": "gpt-4o"})
+        assert not is_deterministic({**CHAT, "n": 3})
+
+
+class TestResponseCache:
+    def test_put_get_and_hop_by_hop_headers_dropped(self):
+        cache = ResponseCache()
+        cache.put("k", _entry())
+        entry = cache.get("k")
+        assert entry.body == b'{"ok":true}'
+        assert entry.headers == [("Content-Type", "application/json")]
+
+    def test_ttl_expiry(self):
+        cache = ResponseCache(ttl=10)
+        cache.put("k", _entry(created=0))
+        assert cache.get("k") is None
+
+    def test_lru_bounded_by_entries_and_bytes(self):
+        cache = ResponseCache(max_entries=2, max_bytes=100)
+        cache.put("a", _entry())
+        cache.put("b", _entry())
+        cache.get("a")
+        cache.put("c", _entry())
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+
+        cache.put("big", _entry(b"x" * 90))
+        assert cache.stats()["memory_bytes"] <= 100
+
+    def test_disk_tier_survives_restart(self, tmp_path):
+        ResponseCache(disk_dir=str(tmp_path)).put("abcd", _entry())
+        fresh = ResponseCache(disk_dir=str(tmp_path))
+        assert fresh.stats()["disk_bytes"] > 0
+        assert fresh.get("abcd").body == b'{"ok":true}'
+
+    def test_disk_tier_pruned_to_cap(self, tmp_path):
+        cache = ResponseCache(disk_dir=str(tmp_path), disk_max_bytes=500)
+        for i in range(20):
+            cache.put(f"{i:04d}", _entry(b"x" * 50))
+        on_disk = sum(len(files) for _, _, files in os.walk(tmp_path))
+        assert on_disk < 20
+        assert cache.stats()["disk_bytes"] <= 500
+
+    def test_overwrite_keeps_disk_bytes(self, tmp_path):
+        cache = ResponseCache(disk_dir=str(tmp_path))
+        cache.put("abcd", _entry())
+        size = cache.stats()["disk_bytes"]
+        cache.put("abcd", _entry())
+        assert cache.stats()["disk_bytes"] == size
+
+    def test_corrupt_disk_entry_is_dropped(self, tmp_path):
+        cache = ResponseCache(disk_dir=str(tmp_path))
+        os.makedirs(tmp_path / "ab")
+        (tmp_path / "ab" / "abcd").write_bytes(b"not json\n")
+        assert cache.get("abcd") is None
+        assert not (tmp_path / "ab" / "abcd").exists()
+
+    def test_hit_ratio_per_model(self):
+        cache = ResponseCache()
+        cache.record("gpt-4o", True)
+        cache.record("gpt-4o", False)
+        assert cache.stats()["models"]["gpt-4o"] == {"hits": 1, "misses": 1, "hit_ratio": 0.5}
@@ -0,0 +1,106 @@
+"""Tests for capture budgets on prompt and response bodies."""
+
+import hashlib
+import json
+
+from agentpulse import capture
+from agentpulse.capture import BoundedText, CapturePolicy, content_text, truncate, utf8_len
+
+
+class TestTruncate:
+    def test_fits_unchanged(self):
+        text = "a" * 100
+        assert truncate(text, 100) is text
+
+    def test_head_tail_and_hash(self):
+        text = "h" * 50 + "m" * 900 + "t" * 50
+        cut = truncate(text, 100 + capture.MARKER_BYTES)
+        assert utf8_len(cut) <= 100 + capture.MARKER_BYTES
+        digest = hashlib.sha256(b"m" * 900).hexdigest()[:12]
+        assert cut == "h" * 50 + f"…[900 bytes removed, sha256:{digest}]…" + "t" * 50
+
+    def test_multibyte_never_split(self):
+        text = "é" * 100  # 200 bytes
+        cut = truncate(text, 51 + capture.MARKER_BYTES)
+        head, _, rest = cut.partition("…[")
+        tail = rest.rpartition("]…")[2]
+        assert head == "é" * 12 and tail == "é" * 12
+        assert "[152 bytes removed" in cut
+        assert utf8_len(text) == 200
+
+    def test_same_middle_same_hash(self):
+        middle = "context " * 1000
+        first = truncate("A" * 40 + middle + "B" * 40, 80 + capture.MARKER_BYTES)
+        second = truncate("A" * 40 + middle + "C" * 40, 80 + capture.MARKER_BYTES)
+        assert first.split("sha256:")[1][:12] == second.split("sha256:")[1][:12]
+
+
+class TestBoundedText:
+    def _fed(self, text, budget, step):
+        bounded = BoundedText(budget)
+        for i in range(0, len(text), step):
+            bounded.feed(text[i:i + step])
+        return bounded
+
+    def test_matches_truncate(self):
+        text = "".join(f"token{i} ünïcode " for i in range(3000))
+        for budget in (10, 101, 4096, 10 ** 6):
+            for step in (1, 7, 500):
+                bounded = self._fed(text, budget, step)
+                assert bounded.render() == truncate(text, budget), (budget, step)
+                assert bounded.length == len(text)
+
+    def test_memory_stays_bounded(self):
+        bounded = BoundedText(1000)
+        for _ in range(10000):
+            bounded.feed("x" * 100)
+        assert len(bounded._head) + len(bounded._tail) <= 1000
+        assert "[999064 bytes removed" in bounded.render()
+
+
+class TestContentText:
+    def test_skips_non_text_parts(self):
+        content = [
+            {"type": "text", "text": "look at this"},
+            {"type": "image_url", "image_url": {"url": "data:image/png;base64," + "A" * 10000}},
+            {"type": "tool_result", "tool_use_id": "t1", "content": "..."},
+            {"type": "text", "text": "and this"},
+        ]
+        assert content_text(content) == "look at this\nand this"
+
+    def test_plain_values(self):
+        assert content_text("hi") == "hi"
+        assert content_text(None) == ""
+
+
+class TestCapturePolicy:
+    def test_newest_messages_get_the_budget(self):
+        policy = CapturePolicy(max_message_bytes=1000, max_event_bytes=1000)
+        pairs = [("system", "s" * 1000), ("user", "u" * 1000), ("assistant", "a" * 200)]
+        system, user, assistant = policy.messages(pairs)
+        assert assistant == {"role": "assistant", "content": "a" * 200}
+        assert user["content"].startswith("u" * 276) and "[448 bytes removed" in user["content"]
+        assert utf8_len(user["content"]) <= 800
+        assert system["role"] == "system" and "[972 bytes removed" in system["content"]
+
+    def test_older_messages_collapse_into_one(self):
+        policy = CapturePolicy()
+        pairs = [("user" if i % 2 else "assistant", f"message {i} " + "x" * 500) for i in range(1000)]
+        captured = policy.messages(pairs)
+        assert len(json.dumps(captured, ensure_ascii=False).encode()) <= policy.max_event_bytes
+        assert captured[-1]["content"] == pairs[-1][1]
+        omitted = captured[0]["content"]
+        assert omitted.startswith(f"…[{1000 - len(captured) + 1} messages, ") and "sha256" not in omitted
+        assert sum("messages, " in message["content"] for message in captured) == 1
+
+    def test_empty_messages_kept_without_marker(self):
+        pairs = [("user", ""), ("assistant", "ok")]
+        assert CapturePolicy().messages(pairs) == [
+            {"role": "user", "content": ""},
+            {"role": "assistant", "content": "ok"},
+        ]
+
+    def test_defaults(self):
+        assert capture.DEFAULT_POLICY.max_message_bytes == capture.MAX_MESSAGE_BYTES
+        short = [("user", "hi")]
+        assert capture.DEFAULT_POLICY.messages(short) == [{"role": "user", "content": "hi"}]
@@ -0,0 +1,55 @@
+"""Tests for agentpulse._codec — pluggable JSON backend."""
+
+import json
+from datetime import datetime, timezone
+
+import pytest
+from agentpulse import _codec
+
+
+@pytest.fixture(params=["stdlib", "orjson", "msgspec"])
+def backend(request):
+    if _codec.set_backend(request.param) != request.param:
+        _codec.set_backend()
+        pytest.skip(f"{request.param} not installed")
+    yield request.param
+    _codec.set_backend()
+
+
+class TestCodec:
+    def test_roundtrip(self, backend):
+        obj = {"model": "gpt-4o", "tokens": [1, 2, 3], "nested": {"ok": True, "none": None}}
+        data = _codec.dumps(obj)
+        assert isinstance(data, bytes)
+        assert _codec.loads(data) == obj
+        assert _codec.loads(data.decode()) == obj
+
+    def test_loads_accepts_bytearray_and_memoryview(self, backend):
+        assert _codec.loads(bytearray(b'{"a": 1}')) == {"a": 1}
+        assert _codec.loads(memoryview(b'[1, 2]')) == [1, 2]
+
+    def test_non_serializable_values_become_strings(self, backend):
+        ts = datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+        out = json.loads(_codec.dumps({"ts": ts, "obj": object(), "big": 2 ** 70}))
+        assert out["ts"].startswith("2026-01-02")
+        assert out["obj"].startswith("<object object")
+        assert out["big"] == 2 ** 70
+
+    def test_unicode_is_preserved(self, backend):
+        assert _codec.loads(_codec.dumps({"text": "héllo 世界"}))["text"] == "héllo 世界"
+
+    def test_sort_keys(self, backend):
+        assert _codec.dumps({"b": 1, "a": 2}, sort_keys=True) == b'{"a":2,"b":1}'
+
+    def test_decode_error(self, backend):
+        with pytest.raises(_codec.DecodeError):
+            _codec.loads("{not json")
+        with pytest.raises(_codec.DecodeError):
+            _codec.loads(None)
+
+    def test_unknown_backend_falls_back_to_stdlib(self):
+        try:
+            assert _codec.set_backend("nope") == "stdlib"
+            assert _codec.loads(b'{"a": 1}') == {"a": 1}
+        finally:
+            _codec.set_backend()
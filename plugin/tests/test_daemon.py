@@ -0,0 +1,239 @@
+"""Tests for agentpulse.daemon — log tailing and event emission."""
+
+import json
+import os
+
+import pytest
+import yaml
+from agentpulse.daemon import AgentPulseDaemon
+
+
+def _log_line(message, date="2026-02-01T12:00:00.000Z", level="DEBUG"):
+    return json.dumps({
+        "0": json.dumps({"subsystem": "agent/embedded"}),
+        "1": message,
+        "_meta": {"date": date, "logLevelName": level},
+    }) + "\n"
+
+
+def _make_daemon(tmp_path, **config):
+    path = tmp_path / "agentpulse.yaml"
+    defaults = {
+        "api_key": "ap_test",
+        "agent_name": "bot",
+        "log_path": str(tmp_path / "logs"),
+        "proxy_enabled": False,
+    }
+    path.write_text(yaml.dump({**defaults, **config}))
+    return AgentPulseDaemon(str(path))
+
+
+def _append(log_dir, *lines):
+    log_dir.mkdir(parents=True, exist_ok=True)
+    with open(log_dir / "openclaw-2026-02-01.log", "a") as f:
+        f.writelines(lines)
+
+
+class TestProcessLines:
+    def test_prompt_end_emits_event_with_run_model(self, tmp_path):
+        daemon = _make_daemon(tmp_path)
+        daemon.process_lines([
+            _log_line("embedded run start: runId=r1 sessionId=s1 provider=anthropic model=claude-haiku-4-5"),
+            _log_line("embedded run tool start: runId=r1 tool=exec toolCallId=t1"),
+            _log_line("embedded run prompt end: runId=r1 sessionId=s1 durationMs=2000"),
+        ])
+        assert len(daemon.sender.buffer) == 1
+        event = daemon.sender.buffer[0]
+        assert event["model"] == "claude-haiku-4-5"
+        assert event["provider"] == "anthropic"
+        assert event["tools_used"] == ["exec"]
+        assert event["task_context"] == "session:s1"
+
+    def test_coalesced_capture_is_tagged(self, tmp_path):
+        daemon = _make_daemon(tmp_path)
+        capture = {
+            "input_tokens": 10, "output_tokens": 5, "prompt_messages": [], "response_text": "hi",
+            "model": "gpt-4o", "coalesced": True,
+        }
+        daemon._try_get_proxy_capture = lambda: capture
+        daemon.process_lines([_log_line("embedded run prompt end: runId=r1 sessionId=s1 durationMs=900")])
+        event = daemon.sender.buffer[0]
+        assert event["coalesced"] is True
+        assert event["cache_hit"] is False
+        assert event["cost_usd"] == 0
+
+    def test_prompt_end_carries_latency_breakdown(self, tmp_path):
+        daemon = _make_daemon(tmp_path)
+        daemon.process_lines([
+            _log_line("embedded run start: runId=r1 sessionId=s1 provider=openai model=gpt-4o",
+                      date="2026-02-01T12:00:00.000Z"),
+            _log_line("embedded run tool start: runId=r1 tool=exec toolCallId=t1",
+                      date="2026-02-01T12:00:02.000Z"),
+            _log_line("embedded run tool end: runId=r1 tool=exec toolCallId=t1",
+                      date="2026-02-01T12:00:05.000Z"),
+            _log_line("embedded run prompt end: runId=r1 sessionId=s1 durationMs=9000",
+                      date="2026-02-01T12:00:10.000Z"),
+        ])
+        event = daemon.sender.buffer[0]
+        assert event["tool_timings"] == [{"tool": "exec", "tool_call_id": "t1", "duration_ms": 3000}]
+        assert event["latency_breakdown"] == {"llm_ms": 6000, "tool_ms": 3000, "idle_ms": 1000}
+
+    def test_tool_error_attaches_to_latest_run(self, tmp_path):
+        daemon = _make_daemon(tmp_path)
+        daemon.process_lines([
+            _log_line("embedded run start: runId=r1 sessionId=s1 provider=openai model=gpt-4o"),
+            _log_line("[tools] exec failed: boom", level="WARN"),
+            _log_line("embedded run prompt end: runId=r1 sessionId=s1 durationMs=100"),
+        ])
+        event = daemon.sender.buffer[0]
+        assert event["status"] == "error"
+        assert event["error_message"] == "exec: boom"
+
+    def test_run_done_clears_state(self, tmp_path):
+        daemon = _make_daemon(tmp_path)
+        daemon.process_lines([
+            _log_line("embedded run start: runId=r1 sessionId=s1 provider=openai model=gpt-4o"),
+            _log_line("embedded run done: runId=r1 sessionId=s1 durationMs=100 aborted=false"),
+        ])
+        assert len(daemon.watches[0].runs) == 0
+
+
+class TestMultipleWatches:
+    def test_single_watch_without_watches_list(self, tmp_path):
+        daemon = _make_daemon(tmp_path)
+        assert len(daemon.watches) == 1
+        assert daemon.watches[0].agent_name == "bot"
+
+    def test_watches_inherit_top_level_settings(self, tmp_path):
+        daemon = _make_daemon(tmp_path, watches=[
+            {"agent_name": "alpha", "log_path": str(tmp_path / "a")},
+            {"agent_name": "beta", "log_path": str(tmp_path / "b"), "api_key": "ap_beta", "model": "gpt-4o"},
+        ])
+        alpha, beta = daemon.watches
+        assert alpha.sender.api_key == "ap_test"
+        assert alpha.default_model == "MiniMax-M2.5"
+        assert beta.sender.api_key == "ap_beta"
+        assert beta.sender.agent_name == "beta"
+        assert beta.default_model == "gpt-4o"
+
+    def test_poll_once_routes_lines_per_agent(self, tmp_path):
+        daemon = _make_daemon(tmp_path, watches=[
+            {"agent_name": "alpha", "log_path": str(tmp_path / "a")},
+            {"agent_name": "beta", "log_path": str(tmp_path / "b")},
+        ])
+        _append(tmp_path / "a", _log_line("startup"))
+        _append(tmp_path / "b", _log_line("startup"))
+        daemon.poll_once(batch_interval=3600)  # registers both files at EOF
+
+        _append(tmp_path / "a", _log_line("embedded run prompt end: runId=r1 sessionId=s1 durationMs=100"))
+        _append(tmp_path / "b", *[
+            _log_line(f"embedded run prompt end: runId=r{i} sessionId=s2 durationMs=100")
+            for i in range(2)
+        ])
+        daemon.poll_once(batch_interval=3600)
+
+        alpha, beta = daemon.watches
+        assert len(alpha.sender.buffer) == 1
+        assert len(beta.sender.buffer) == 2
+        assert alpha.runs is not beta.runs
+
+
+class _StubProxy:
+    def __init__(self, events):
+        self.events = events
+
+    def drain_events(self):
+        events, self.events = self.events, []
+        return events
+
+
+def _proxy_event(**fields):
+    return {
+        "provider": "openai", "model": "gpt-4o", "latency_ms": 900,
+        "input_tokens": 10, "output_tokens": 5, "cost_usd": 0.0001,
+        "status": "success", "error_message": None, "task_context": None, "tools_used": [],
+        "timestamp": "2026-02-01T12:00:00+00:00",
+        **fields,
+    }
+
+
+class TestProxyEvents:
+    def test_proxy_events_are_enriched_by_log_lines(self, tmp_path):
+        daemon = _make_daemon(tmp_path, proxy_events=True)
+        event = _proxy_event()
+        daemon._proxy = _StubProxy([event])
+        daemon.poll_once(batch_interval=3600)
+        assert daemon.sender.buffer == []  # held for enrichment
+
+        daemon.process_lines([
+            _log_line("embedded run tool start: runId=r1 tool=exec toolCallId=t1"),
+            _log_line("embedded run prompt end: runId=r1 sessionId=s1 durationMs=900"),
+        ])
+        assert daemon.sender.buffer == [event]  # no extra estimated event
+        assert event["task_context"] == "session:s1"
+        assert event["tools_used"] == ["exec"]
+        assert "latency_breakdown" in event
+
+    def test_events_wait_for_enrichment_before_sending(self, tmp_path):
+        daemon = _make_daemon(tmp_path, proxy_events=True)
+        earlier = _proxy_event(timestamp="2026-02-01T11:58:00+00:00")  # ended before this prompt began
+        daemon._proxy = _StubProxy([earlier, _proxy_event()])
+        daemon.poll_once(batch_interval=3600)
+        assert daemon.sender.buffer == []
+
+        daemon.process_lines([_log_line("embedded run prompt end: runId=r1 sessionId=s1 durationMs=900")])
+        assert [e["task_context"] for e in daemon.sender.buffer] == ["session:s1"]
+        daemon._release_pending(daemon.watches[0], max_age=0)  # the enrich window ran out
+        assert [e["task_context"] for e in daemon.sender.buffer] == ["session:s1", None]
+
+    def test_events_routed_to_attributed_watch(self, tmp_path):
+        daemon = _make_daemon(tmp_path, proxy_events=True, watches=[
+            {"agent_name": "alpha", "log_path": str(tmp_path / "a")},
+            {"agent_name": "beta", "log_path": str(tmp_path / "b"), "api_key": "ap_beta"},
+        ])
+        daemon._proxy = _StubProxy([_proxy_event(agent="beta"), _proxy_event(agent=None)])
+        daemon.poll_once(batch_interval=3600)
+        alpha, beta = daemon.watches
+
+        daemon.process_lines([_log_line("embedded run prompt end: runId=r1 sessionId=s1 durationMs=900")], beta)
+        assert [e["task_context"] for e in beta.sender.buffer] == ["session:s1"]
+        assert "agent" not in beta.sender.buffer[0]
+        assert alpha.sender.buffer == []
+        assert len(alpha.pending_enrich) == 1
+
+    def test_interleaved_runs_matched_by_run_hint(self, tmp_path):
+        daemon = _make_daemon(tmp_path, proxy_events=True)
+        daemon._proxy = _StubProxy([
+            _proxy_event(model="for-r2", run_hint={"run_id": "r2"}),
+            _proxy_event(model="for-r1", run_hint={"run_id": "r1"}),
+        ])
+        daemon.poll_once(batch_interval=3600)
+
+        daemon.process_lines([
+            _log_line("embedded run tool start: runId=r2 tool=search toolCallId=t2"),
+            _log_line("embedded run tool start: runId=r1 tool=exec toolCallId=t1"),
+            _log_line("embedded run prompt end: runId=r1 sessionId=s1 durationMs=900"),
+            _log_line("embedded run prompt end: runId=r2 sessionId=s2 durationMs=900"),
+        ])
+        by_model = {e["model"]: e for e in daemon.sender.buffer}
+        assert (by_model["for-r1"]["task_context"], by_model["for-r1"]["tools_used"]) == ("session:s1", ["exec"])
+        assert (by_model["for-r2"]["task_context"], by_model["for-r2"]["tools_used"]) == ("session:s2", ["search"])
+        assert "run_hint" not in by_model["for-r1"]
+
+    def test_ambiguous_untagged_events_left_unenriched(self, tmp_path):
+        daemon = _make_daemon(tmp_path, proxy_events=True)
+        daemon._proxy = _StubProxy([_proxy_event(), _proxy_event()])
+        daemon.poll_once(batch_interval=3600)
+
+        daemon.process_lines([
+            _log_line("embedded run tool start: runId=r1 tool=exec toolCallId=t1"),
+            _log_line("embedded run prompt end: runId=r1 sessionId=s1 durationMs=900"),
+        ])
+        assert daemon.sender.buffer == []
+        daemon._release_pending(daemon.watches[0], max_age=0)
+        assert [(e["task_context"], e["tools_used"]) for e in daemon.sender.buffer] == [(None, []), (None, [])]
+
+    def test_prompt_end_without_proxy_event_emits_nothing(self, tmp_path):
+        daemon = _make_daemon(tmp_path, proxy_events=True)
+        daemon.process_lines([_log_line("embedded run prompt end: runId=r1 sessionId=s1 durationMs=900")])
+        assert daemon.sender.buffer == []
@@ -0,0 +1,105 @@
+"""Tests for agentpulse.encoding — decoding compressed responses for capture."""
+
+import gzip
+import zlib
+
+import pytest
+from agentpulse import encoding
+from agentpulse.encoding import DecodeError, decode_body, filter_accept_encoding, header_value
+
+BODY = b'{"usage": {"prompt_tokens": 12, "completion_tokens": 3}}' * 50
+
+
+class TestDecodeBody:
+    def test_gzip(self):
+        assert decode_body(gzip.compress(BODY), "gzip") == BODY
+
+    def test_deflate_zlib_and_raw(self):
+        assert decode_body(zlib.compress(BODY), "deflate") == BODY
+        raw = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        assert decode_body(raw.compress(BODY) + raw.flush(), "deflate") == BODY
+
+    def test_stacked_codings(self):
+        assert decode_body(gzip.compress(zlib.compress(BODY)), "deflate, gzip") == BODY
+
+    def test_identity_and_empty(self):
+        assert decode_body(BODY, "identity") == BODY
+        assert decode_body(BODY, "") == BODY
+        assert decode_body(b"", "gzip") == b""
+
+    def test_output_is_capped(self):
+        bomb = gzip.compress(b"\0" * (1024 * 1024))
+        with pytest.raises(DecodeError):
+            decode_body(bomb, "gzip", max_size=1000)
+
+    def test_corrupt_or_unknown(self):
+        with pytest.raises(DecodeError):
+            decode_body(b"not gzip", "gzip")
+        with pytest.raises(DecodeError):
+            decode_body(BODY, "zstd")
+
+    def test_brotli(self):
+        brotli = pytest.importorskip("brotli")
+        assert decode_body(brotli.compress(BODY), "br") == BODY
+
+    def test_brotli_output_is_capped_per_step(self, monkeypatch):
+        monkeypatch.setattr(encoding, "_brotli", _FakeBrotli(bounded=True))
+        bomb = zlib.compress(b"\0" * (4 * 1024 * 1024))
+        assert decode_body(zlib.compress(BODY), "br") == BODY
+        encoding._brotli.largest_step = 0
+        with pytest.raises(DecodeError):
+            decode_body(bomb, "br", max_size=1000)
+        assert encoding._brotli.largest_step <= 1001
+
+    def test_unbounded_brotli_not_used(self, monkeypatch):
+        monkeypatch.setattr(encoding, "_brotli", _FakeBrotli(bounded=False))
+        assert "br" not in encoding.supported_encodings()
+        assert filter_accept_encoding("gzip, br") == "gzip"
+        with pytest.raises(DecodeError):
+            decode_body(zlib.compress(BODY), "br")
+
+
+class _FakeBrotli:
+    """Stands in for the brotli module, with zlib data as the "br" stream."""
+
+    class error(Exception):
+        pass
+
+    def __init__(self, bounded):
+        self.bounded = bounded
+        self.largest_step = 0
+
+    def Decompressor(self):
+        module = self
+
+        class Decompressor:
+            def __init__(self):
+                self._obj = zlib.decompressobj()
+                self._tail = b""
+
+            def process(self, data, **kwargs):
+                if not module.bounded and kwargs:
+                    raise TypeError("unexpected keyword argument")
+                limit = kwargs.get("output_buffer_limit", 0)
+                out = self._obj.decompress(bytes(data) or self._tail, limit)
+                self._tail = self._obj.unconsumed_tail
+                module.largest_step = max(module.largest_step, len(out))
+                return out
+
+            def can_accept_more_data(self):
+                return not self._tail
+
+        return Decompressor()
+
+
+class TestAcceptEncoding:
+    def test_unsupported_codings_removed(self, monkeypatch):
+        monkeypatch.setattr(encoding, "_brotli", None)
+        assert filter_accept_encoding("gzip, deflate, br, zstd") == "gzip, deflate"
+        assert filter_accept_encoding("br") == "identity"
+        assert filter_accept_encoding("gzip;q=1.0, br;q=0.8") == "gzip;q=1.0"
+        assert filter_accept_encoding("") == ""
+
+    def test_header_value(self):
+        assert header_value([("content-encoding", "gzip")], "Content-Encoding") == "gzip"
+        assert header_value([], "Content-Encoding") == ""
@@ -0,0 +1,110 @@
+"""Tests for event-loop lag and scheduling delay attribution."""
+
+import asyncio
+import sys
+import time
+import types
+
+import pytest
+
+from agentpulse import lag, sdk
+
+
+@pytest.fixture
+def monitor():
+    monitor = lag.LagMonitor(interval=0.01)
+    yield monitor
+    monitor.stop()
+
+
+class TestLagMonitor:
+    def test_loop_lag_while_in_flight(self, monitor):
+        async def main():
+            mark = monitor.mark()
+            await asyncio.sleep(0.03)
+            time.sleep(0.1)  # a callback hogging the loop
+            await asyncio.sleep(0.03)
+            return monitor.since(mark)
+
+        fields = asyncio.run(main())
+        assert 50 <= fields["loop_lag_ms"] <= 200
+        assert fields["queued_before_send_ms"] is None
+        assert monitor.snapshot()["max_loop_lag_ms"] >= 50
+
+    def test_idle_loop_has_no_lag(self, monitor):
+        async def main():
+            mark = monitor.mark()
+            await asyncio.sleep(0.1)
+            return monitor.since(mark)
+
+        assert asyncio.run(main())["loop_lag_ms"] < 20
+
+    def test_thread_delay_under_gil_contention(self, monitor):
+        switch = sys.getswitchinterval()
+        sys.setswitchinterval(0.1)  # the busy thread keeps the GIL for up to 100ms at a time
+        try:
+            mark = monitor.mark()
+            deadline = time.perf_counter() + 0.5
+            while time.perf_counter() < deadline:
+                pass
+            fields = monitor.since(mark)
+        finally:
+            sys.setswitchinterval(switch)
+        assert fields["loop_lag_ms"] is None  # not on a loop
+        assert fields["thread_delay_ms"] >= 50
+
+    def test_queued_before_send(self, monitor):
+        fields = monitor.since(monitor.mark(), called_ns=1_000_000, sent_ns=13_500_000)
+        assert fields["queued_before_send_ms"] == 12.5
+
+
+class TestAsyncCalls:
+    @pytest.fixture
+    def fake_openai(self, monkeypatch):
+        """An openai package whose AsyncCompletions.create takes 20ms to send and 30ms to answer."""
+
+        class AsyncCompletions:
+            async def create(self, **kwargs):
+                await asyncio.sleep(0.02)
+                sdk._sent_at.set(sdk._perf_counter_ns())  # what the patched httpx send records
+                await asyncio.sleep(0.03)
+                return {"model": "gpt-4o", "usage": {"prompt_tokens": 5, "completion_tokens": 2},
+                        "choices": [{"message": {"content": "hi"}}]}
+
+        completions = types.SimpleNamespace(Completions=type("Completions", (), {"create": lambda self: None}),
+                                            AsyncCompletions=AsyncCompletions)
+        modules = {
+            "openai": types.ModuleType("openai"),
+            "openai.resources": types.ModuleType("openai.resources"),
+            "openai.resources.chat": types.ModuleType("openai.resources.chat"),
+        }
+        modules["openai.resources.chat"].completions = completions
+        for name, module in modules.items():
+            monkeypatch.setitem(sys.modules, name, module)
+        monkeypatch.setattr(sdk, "_patched", set())
+        sdk._patch_openai()
+        return AsyncCompletions()
+
+    def test_event_carries_lag_components(self, fake_openai, monitor, monkeypatch):
+        events = []
+        monkeypatch.setattr(sdk, "_add_event", lambda event, client=None: events.append(event))
+        monkeypatch.setattr(sdk, "_lag_monitor", monitor)
+
+        async def hog():
+            await asyncio.sleep(0.03)
+            time.sleep(0.08)
+
+        async def main():
+            await asyncio.gather(fake_openai.create(model="gpt-4o", messages=[]), hog())
+
+        asyncio.run(main())
+        [event] = events
+        assert 15 <= event["queued_before_send_ms"] < 100
+        assert event["loop_lag_ms"] >= 40
+        assert "thread_delay_ms" in event
+
+    def test_off_by_default(self, fake_openai, monkeypatch):
+        events = []
+        monkeypatch.setattr(sdk, "_add_event", lambda event, client=None: events.append(event))
+        asyncio.run(fake_openai.create(model="gpt-4o", messages=[]))
+        assert "loop_lag_ms" not in events[0]
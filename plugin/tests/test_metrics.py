@@ -0,0 +1,120 @@
+"""Tests for agentpulse.metrics — lock-free counters and /metrics rendering."""
+
+import threading
+import urllib.request
+
+import pytest
+from agentpulse import metrics
+
+
+class TestMetrics:
+    def test_counter_sums_across_threads(self):
+        counter = metrics.Counter("test_counter_total", "test", register=False)
+
+        def work():
+            for _ in range(10_000):
+                counter.inc()
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert counter.render()[-1] == "test_counter_total 80000"
+
+    def test_exited_threads_are_folded_at_scrape(self):
+        counter = metrics.Counter("test_short_lived_total", "test", register=False)
+        hist = metrics.Histogram("test_short_lived_seconds", "test", buckets=(1,), register=False)
+
+        def request():
+            counter.inc()
+            hist.observe(0.5)
+
+        for _ in range(50):
+            thread = threading.Thread(target=request)
+            thread.start()
+            thread.join()
+        assert counter.render()[-1] == "test_short_lived_total 50"
+        assert "test_short_lived_seconds_count 50" in hist.render()
+        assert len(counter._children[()]._cells) == 0
+        assert len(hist._children[()]._cells) == 0
+        counter.inc()
+        assert counter.render()[-1] == "test_short_lived_total 51"
+
+    def test_scrapes_while_threads_come_and_go_lose_nothing(self):
+        counter = metrics.Counter("test_churn_total", "test", register=False)
+        stop = threading.Event()
+
+        def scrape():
+            while not stop.is_set():
+                counter.render()
+
+        def request():
+            for _ in range(200):
+                counter.inc()
+
+        scraper = threading.Thread(target=scrape)
+        scraper.start()
+        for _ in range(200):
+            thread = threading.Thread(target=request)
+            thread.start()
+            thread.join()
+        stop.set()
+        scraper.join()
+        assert counter.render()[-1] == "test_churn_total 40000"
+
+    def test_labelled_children_are_cached(self):
+        counter = metrics.Counter("test_labelled_total", "test", ["provider"], register=False)
+        assert counter.labels("openai") is counter.labels("openai")
+        counter.labels("openai").inc(2)
+        counter.labels('we"ird').inc()
+        lines = counter.render()
+        assert 'test_labelled_total{provider="openai"} 2' in lines
+        assert 'test_labelled_total{provider="we\\"ird"} 1' in lines
+        with pytest.raises(ValueError):
+            counter.labels("a", "b")
+
+    def test_gauge_inc_dec_and_set(self):
+        gauge = metrics.Gauge("test_gauge", "test", register=False)
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+        assert gauge.render()[-1] == "test_gauge 1"
+        gauge.set(42)
+        assert gauge.render()[-1] == "test_gauge 42"
+
+    def test_histogram_buckets_are_cumulative(self):
+        hist = metrics.Histogram("test_seconds", "test", buckets=(0.1, 1), register=False)
+        for value in (0.05, 0.5, 0.7, 5):
+            hist.observe(value)
+        lines = hist.render()
+        assert 'test_seconds_bucket{le="0.1"} 1' in lines
+        assert 'test_seconds_bucket{le="1"} 3' in lines
+        assert 'test_seconds_bucket{le="+Inf"} 4' in lines
+        assert "test_seconds_count 4" in lines
+        assert "test_seconds_sum 6.25" in lines
+
+    def test_collect_hooks_run_before_render(self):
+        calls = []
+        hook = lambda: calls.append(1)
+        metrics.add_collect_hook(hook)
+        try:
+            metrics.render()
+        finally:
+            metrics.remove_collect_hook(hook)
+        assert calls == [1]
+
+    def test_server_serves_metrics(self):
+        server = metrics.MetricsServer(port=0)
+        server.start()
+        try:
+            metrics.PARSE_ERRORS.inc()
+            url = f"http://127.0.0.1:{server.port}/metrics"
+            with urllib.request.urlopen(url, timeout=5) as resp:
+                body = resp.read().decode()
+            assert resp.headers["Content-Type"].startswith("text/plain")
+            assert "# TYPE agentpulse_parse_errors_total counter" in body
+            with pytest.raises(urllib.error.HTTPError):
+                urllib.request.urlopen(f"http://127.0.0.1:{server.port}/other", timeout=5)
+        finally:
+            server.stop()
@@ -0,0 +1,86 @@
+"""Tests for agentpulse.overhead — self-overhead accounting and capture degradation."""
+
+from agentpulse import overhead
+from agentpulse.overhead import OverheadMonitor, LEVELS
+
+
+def _window(monitor, overhead_ns, call_ns=1_000_000):
+    for _ in range(monitor.window):
+        monitor.record(overhead_ns, call_ns)
+
+
+class TestOverheadMonitor:
+    def test_totals(self):
+        monitor = OverheadMonitor(budget=0.01, window=100)
+        monitor.record(2_000, 1_000_000)
+        monitor.record(4_000, 1_000_000)
+        snap = monitor.snapshot()
+        assert snap["calls"] == 2
+        assert snap["overhead_us_per_call"] == 3.0
+        assert snap["max_overhead_us"] == 4.0
+        assert snap["overhead_ratio"] == 0.003
+        assert snap["capture_level"] == "full"
+
+    def test_steps_down_one_level_per_window_over_budget(self):
+        monitor = OverheadMonitor(budget=0.01, window=5)
+        _window(monitor, 5_000)  # 0.5%: fine
+        assert monitor.level == 0
+        for expected in LEVELS[1:]:
+            _window(monitor, 50_000)  # 5%
+            assert LEVELS[monitor.level] == expected
+        _window(monitor, 50_000)
+        assert LEVELS[monitor.level] == "metrics_only"
+
+    def test_recovers_after_calm_windows(self):
+        monitor = OverheadMonitor(budget=0.01, window=5)
+        _window(monitor, 50_000)
+        assert monitor.level == 1
+        for _ in range(overhead.RECOVER_WINDOWS - 1):
+            _window(monitor, 100)
+        assert monitor.level == 1
+        _window(monitor, 100)
+        assert monitor.level == 0
+        assert monitor.level_changes == 2
+
+    def test_no_budget_never_degrades(self):
+        monitor = OverheadMonitor(budget=None, window=5)
+        _window(monitor, 900_000)
+        assert monitor.level == 0
+
+
+class TestBodies:
+    def test_limits_per_level(self):
+        monitor = OverheadMonitor()
+        assert monitor.body_limit() is None
+        monitor.level = 1
+        assert monitor.body_limit() == overhead.TRUNCATE_BYTES
+        monitor.level = 2
+        limits = [monitor.body_limit() for _ in range(overhead.SAMPLE_EVERY * 3)]
+        assert limits.count(overhead.TRUNCATE_BYTES) == 3
+        assert limits.count(0) == len(limits) - 3
+        monitor.level = 3
+        assert monitor.body_limit() == 0
+
+    def test_shape_tags_truncated_bodies(self):
+        monitor = OverheadMonitor()
+        monitor.level = 1
+        event = {"response_text": "x" * 50, "prompt_messages": [{"role": "user", "content": "y" * 50}]}
+        monitor.shape(event, 10)  # bodies were cut while copied; shape only tags
+        assert event == {
+            "response_text": "x" * 50,
+            "prompt_messages": [{"role": "user", "content": "y" * 50}],
+            "capture_level": "truncate",
+        }
+
+    def test_shape_drops_bodies(self):
+        monitor = OverheadMonitor()
+        monitor.level = 3
+        event = {"response_text": "hi", "prompt_messages": [{"role": "user", "content": "hello"}], "input_tokens": 5}
+        monitor.shape(event, 0)
+        assert event == {"response_text": None, "prompt_messages": [], "input_tokens": 5,
+                         "capture_level": "metrics_only"}
+
+    def test_approx_size_counts_bodies(self):
+        small = overhead.approx_size({"response_text": None, "prompt_messages": []})
+        large = overhead.approx_size({"response_text": "a" * 1000, "prompt_messages": [{"content": "b" * 500}]})
+        assert large - small == 1500
@@ -0,0 +1,112 @@
+"""Tests for the `agentpulse run --profile` sampler."""
+
+import asyncio
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from agentpulse import cli, profiler, sdk
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+pytestmark = pytest.mark.skipif(not hasattr(__import__("signal"), "setitimer"), reason="needs setitimer")
+
+
+def fake_create():
+    time.sleep(0.3)  # waiting on the model
+
+
+def build_prompt():
+    deadline = time.perf_counter() + 0.2
+    while time.perf_counter() < deadline:
+        pass
+
+
+@pytest.fixture
+def sampler(tmp_path, monkeypatch):
+    monkeypatch.setattr(sdk, "_LLM_CODE", {fake_create.__code__})
+    sampler = profiler.Profiler(str(tmp_path), hz=200)
+    assert sampler.start()
+    yield sampler
+    sampler.stop()
+
+
+def _share(sampler, category):
+    total = sum(sampler.counts.values())
+    return sum(n for stack, n in sampler.counts.items() if stack[0] == category) / total
+
+
+class TestProfiler:
+    def test_split_inside_and_outside_llm_calls(self, sampler):
+        build_prompt()
+        fake_create()
+        sampler.stop()
+        assert 0.45 < _share(sampler, "llm") < 0.75
+        llm_stacks = [stack for stack in sampler.counts if stack[0] == "llm"]
+        assert all(f"{__name__}.fake_create" in stack for stack in llm_stacks)
+        assert f"{__name__}.build_prompt" in sampler.summary()
+
+    def test_idle_loop_awaiting_llm(self, sampler):
+        async def main():
+            await sdk._awaiting_llm(asyncio.sleep(0.3))
+            await asyncio.sleep(0.2)  # idle, but not on the model
+
+        asyncio.run(main())
+        sampler.stop()
+        assert 0.45 < _share(sampler, "llm") < 0.75
+
+    def test_idle_workers_skipped(self, sampler):
+        stop = threading.Event()
+        worker = threading.Thread(target=stop.wait)
+        worker.start()
+        build_prompt()
+        stop.set()
+        worker.join()
+        sampler.stop()
+        assert sum(sampler.counts.values()) <= 0.2 * 200 * 1.5
+
+    def test_handler_takes_no_thread_locks(self, sampler, monkeypatch):
+        sampler.stop()
+
+        def locked():
+            raise AssertionError("threading.enumerate() called from the signal handler")
+
+        monkeypatch.setattr(threading, "enumerate", locked)
+        sampler._sample(signal.SIGALRM, sys._getframe())
+        assert sum(sampler.counts.values()) >= 1
+
+    def test_write_folded_and_summary(self, sampler, tmp_path):
+        build_prompt()
+        sampler.stop()
+        base = sampler.write()
+        with open(base + ".folded") as f:
+            lines = f.read().splitlines()
+        stack, count = lines[0].rsplit(" ", 1)
+        assert stack.split(";")[0] in ("app", "llm") and int(count) > 0
+        with open(base + ".txt") as f:
+            assert "inside LLM calls" in f.read()
+
+
+class TestRunProfile:
+    def test_child_writes_profile(self, tmp_path):
+        bootstrap_dir = tmp_path / "bootstrap"
+        bootstrap_dir.mkdir()
+        shutil.copy(os.path.join(PLUGIN_DIR, "agentpulse", "_bootstrap_sitecustomize.py"),
+                    bootstrap_dir / "sitecustomize.py")
+        config = {"api_key": "ap_test", "agent_name": "bot", "endpoint": "http://127.0.0.1:9/api/events"}
+        env = {k: v for k, v in os.environ.items() if k != "PYTHONPATH"}
+        env.update(cli._sdk_env(config), PYTHONPATH=str(bootstrap_dir), _AGENTPULSE_PKG_PATH=PLUGIN_DIR,
+                   AGENTPULSE_PROFILE=str(tmp_path / "profiles"), AGENTPULSE_PROFILE_HZ="200")
+        code = "import time\nend = time.time() + 0.3\nwhile time.time() < end:\n    pass\n"
+        result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, timeout=60)
+        assert result.returncode == 0, result.stderr
+        files = sorted(os.listdir(tmp_path / "profiles"))
+        assert [f.rsplit(".", 1)[1] for f in files] == ["folded", "txt"]
+        with open(tmp_path / "profiles" / files[0]) as f:
+            assert "app;" in f.read()
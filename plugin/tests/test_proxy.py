@@ -0,0 +1,741 @@
+"""Tests for agentpulse.proxy — forwarding and capture against a fake upstream."""
+
+import http.client
+import http.server
+import gzip
+import json
+import os
+import queue
+import signal
+import socket
+import stat
+import threading
+import time
+import urllib.request
+
+import pytest
+from agentpulse.upstream import HedgePolicy
+from agentpulse import metrics, proxy_workers, ratelimit
+from agentpulse import upstream as upstream_module
+from agentpulse.admission import AdmissionController
+from agentpulse.cache import ResponseCache
+from agentpulse.proxy import CaptureWorkerPool, LLMProxyServer, capture_to_event, parse_socket_mode
+from agentpulse.singleflight import SingleFlight
+
+
+OPENAI_RESPONSE = {
+    "id": "chatcmpl-1",
+    "model": "gpt-4o",
+    "choices": [{"message": {"role": "assistant", "content": "Hello!"}}],
+    "usage": {"prompt_tokens": 12, "completion_tokens": 3},
+}
+
+OPENAI_SSE = (
+    b'data: {"choices":[{"delta":{"content":"Hel"}}]}\n\n'
+    b'data: {"choices":[{"delta":{"content":"lo"}}]}\n\n'
+    b'data: {"choices":[],"usage":{"prompt_tokens":12,"completion_tokens":2}}\n\n'
+    b"data: [DONE]\n\n"
+)
+
+
+class FakeUpstream:
+    """Minimal OpenAI-compatible upstream with a configurable responder."""
+
+    def __init__(self):
+        self.requests = []
+        upstream = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                upstream.requests.append((self.path, dict(self.headers), body))
+                status, headers, payload = upstream.respond(self, json.loads(body or b"{}"))
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST
+
+            def log_message(self, *args):
+                pass
+
+        self.respond = self.default_respond
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @staticmethod
+    def default_respond(handler, request):
+        if request.get("stream"):
+            return 200, {"Content-Type": "text/event-stream"}, OPENAI_SSE
+        return 200, {"Content-Type": "application/json"}, json.dumps(OPENAI_RESPONSE).encode()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def upstream():
+    fake = FakeUpstream()
+    yield fake
+    fake.close()
+
+
+def start_proxy(upstream, **kwargs):
+    proxy = LLMProxyServer(port=0, providers={"openai": upstream.url}, **kwargs)
+    proxy.start()
+    return proxy
+
+
+def post(proxy, path, body, headers=None):
+    conn = http.client.HTTPConnection("127.0.0.1", proxy.port, timeout=10)
+    data = json.dumps(body).encode()
+    conn.request("POST", path, body=data, headers={"Content-Type": "application/json", **(headers or {})})
+    resp = conn.getresponse()
+    payload = resp.read()
+    conn.close()
+    return resp, payload
+
+
+def wait_for(fn, timeout=5.0):
+    """Poll fn() until it returns something truthy (captures finish after the reply)."""
+    deadline = time.monotonic() + timeout
+    while True:
+        result = fn()
+        if result or time.monotonic() > deadline:
+            return result
+        time.sleep(0.01)
+
+
+CHAT = {"model": "gpt-4o", "messages": [{"role": "user", "content": "Hi"}]}
+
+
+class TestForwarding:
+    def test_unknown_provider_is_404(self, upstream):
+        proxy = start_proxy(upstream)
+        try:
+            resp, _ = post(proxy, "/nope/v1/chat/completions", CHAT)
+            assert resp.status == 404
+        finally:
+            proxy.stop()
+
+    def test_forwards_and_captures(self, upstream):
+        proxy = start_proxy(upstream)
+        try:
+            resp, payload = post(proxy, "/openai/v1/chat/completions", CHAT, {"Authorization": "Bearer sk-test"})
+            assert resp.status == 200
+            assert json.loads(payload) == OPENAI_RESPONSE
+            path, headers, _ = upstream.requests[0]
+            assert path == "/v1/chat/completions"
+            assert headers["Authorization"] == "Bearer sk-test"
+
+            capture = wait_for(proxy.get_latest_capture)
+            assert capture["input_tokens"] == 12
+            assert capture["output_tokens"] == 3
+            assert capture["response_text"] == "Hello!"
+            assert capture["prompt_messages"] == [{"role": "user", "content": "Hi"}]
+            assert capture["latency_ms"] is not None
+        finally:
+            proxy.stop()
+
+    def test_streaming_capture(self, upstream):
+        proxy = start_proxy(upstream)
+        try:
+            resp, payload = post(proxy, "/openai/v1/chat/completions", {**CHAT, "stream": True})
+            assert payload == OPENAI_SSE
+            capture = wait_for(proxy.get_latest_capture)
+            assert capture["response_text"] == "Hello"
+            assert capture["output_tokens"] == 2
+            assert capture["ttft_ms"] is not None
+        finally:
+            proxy.stop()
+
+
+class TestProxyEvents:
+    def test_capture_becomes_event(self, upstream):
+        proxy = start_proxy(upstream, emit_events=True)
+        try:
+            post(proxy, "/openai/v1/chat/completions", CHAT)
+            events = wait_for(proxy.drain_events)
+            assert len(events) == 1
+            event = events[0]
+            assert event["status"] == "success"
+            assert event["model"] == "gpt-4o"
+            assert event["input_tokens"] == 12
+            assert event["cost_usd"] > 0
+            assert proxy.get_latest_capture() is None  # ring is bypassed
+        finally:
+            proxy.stop()
+
+    def test_agent_path_prefix_attributes_event(self, upstream):
+        proxy = start_proxy(upstream, emit_events=True)
+        try:
+            resp, _ = post(proxy, "/agent/research-bot/openai/v1/chat/completions", CHAT)
+            assert resp.status == 200
+            assert upstream.requests[0][0] == "/v1/chat/completions"
+            assert wait_for(proxy.drain_events)[0]["agent"] == "research-bot"
+        finally:
+            proxy.stop()
+
+    def test_run_headers_become_run_hint(self, upstream):
+        proxy = start_proxy(upstream, emit_events=True)
+        try:
+            post(proxy, "/openai/v1/chat/completions", CHAT, {"X-AgentPulse-Run": "r7"})
+            assert "x-agentpulse-run" not in {k.lower() for k in upstream.requests[0][1]}
+            assert wait_for(proxy.drain_events)[0]["run_hint"] == {"run_id": "r7", "session_id": None}
+        finally:
+            proxy.stop()
+
+    def test_error_responses_become_error_events(self, upstream):
+        upstream.respond = lambda h, r: (429, {}, b'{"error": {"message": "slow down"}}')
+        proxy = start_proxy(upstream, emit_events=True)
+        try:
+            resp, _ = post(proxy, "/openai/v1/chat/completions", CHAT)
+            assert resp.status == 429
+            event = wait_for(proxy.drain_events)[0]
+            assert event["status"] == "rate_limit"
+            assert "slow down" in event["error_message"]
+            assert event["cost_usd"] == 0
+        finally:
+            proxy.stop()
+
+    def test_full_queue_drops_and_counts(self, upstream):
+        proxy = start_proxy(upstream, emit_events=True, event_queue_size=1)
+        try:
+            post(proxy, "/openai/v1/chat/completions", CHAT)
+            post(proxy, "/openai/v1/chat/completions", CHAT)
+            wait_for(lambda: proxy.events_dropped)
+            assert len(proxy.drain_events()) == 1
+            assert proxy.events_dropped == 1
+        finally:
+            proxy.stop()
+
+    def test_capture_to_event_status_mapping(self):
+        base = {
+            "timestamp": "t", "provider": "openai", "model": "gpt-4o",
+            "input_tokens": 0, "output_tokens": 0, "prompt_messages": [], "response_text": "",
+        }
+        assert capture_to_event({**base, "status_code": 500, "error_body": "boom"})["status"] == "error"
+        assert capture_to_event({**base, "status_code": 200})["error_message"] is None
+
+
+class TestResponseCache:
+    DETERMINISTIC = {**CHAT, "temperature": 0}
+
+    def test_identical_request_served_from_cache(self, upstream):
+        proxy = start_proxy(upstream, emit_events=True, cache=ResponseCache())
+        try:
+            first, _ = post(proxy, "/openai/v1/chat/completions", self.DETERMINISTIC)
+            second, payload = post(proxy, "/openai/v1/chat/completions", self.DETERMINISTIC)
+            assert first.getheader("X-AgentPulse-Cache") == "MISS"
+            assert second.getheader("X-AgentPulse-Cache") == "HIT"
+            assert json.loads(payload) == OPENAI_RESPONSE
+            assert len(upstream.requests) == 1
+
+            events = wait_for(lambda: proxy.events.qsize() >= 2 and proxy.drain_events())
+            assert [e["cache_hit"] for e in events] == [False, True]
+            assert events[1]["cost_usd"] == 0
+            assert events[1]["input_tokens"] == 12
+        finally:
+            proxy.stop()
+
+    def test_streaming_replay(self, upstream):
+        proxy = start_proxy(upstream, cache=ResponseCache())
+        try:
+            body = {**self.DETERMINISTIC, "stream": True}
+            post(proxy, "/openai/v1/chat/completions", body)
+            resp, payload = post(proxy, "/openai/v1/chat/completions", body)
+            assert resp.getheader("X-AgentPulse-Cache") == "HIT"
+            assert payload == OPENAI_SSE
+            assert len(upstream.requests) == 1
+        finally:
+            proxy.stop()
+
+    def test_sampled_and_other_credentials_bypass_cache(self, upstream):
+        proxy = start_proxy(upstream, cache=ResponseCache())
+        try:
+            post(proxy, "/openai/v1/chat/completions", CHAT)
+            post(proxy, "/openai/v1/chat/completions", CHAT)
+            post(proxy, "/openai/v1/chat/completions", self.DETERMINISTIC, {"Authorization": "Bearer a"})
+            post(proxy, "/openai/v1/chat/completions", self.DETERMINISTIC, {"Authorization": "Bearer b"})
+            assert len(upstream.requests) == 4
+        finally:
+            proxy.stop()
+
+    def test_errors_are_not_cached(self, upstream):
+        upstream.respond = lambda h, r: (500, {}, b'{"error": "boom"}')
+        proxy = start_proxy(upstream, cache=ResponseCache())
+        try:
+            post(proxy, "/openai/v1/chat/completions", self.DETERMINISTIC)
+            post(proxy, "/openai/v1/chat/completions", self.DETERMINISTIC)
+            assert len(upstream.requests) == 2
+        finally:
+            proxy.stop()
+
+
+class TestCoalescing:
+    DETERMINISTIC = {**CHAT, "temperature": 0}
+
+    def _burst(self, upstream, proxy, body, n=4):
+        """Send n identical requests while the upstream holds the first one."""
+        release = threading.Event()
+        respond = upstream.respond
+
+        def held(handler, request):
+            release.wait(5)
+            return respond(handler, request)
+
+        upstream.respond = held
+        results = [None] * n
+
+        def send(i):
+            try:
+                results[i] = post(proxy, "/openai/v1/chat/completions", body)
+            except (http.client.HTTPException, OSError):
+                pass  # left as None
+
+        threads = [threading.Thread(target=send, args=(i,)) for i in range(n)]
+        for thread in threads:
+            thread.start()
+        assert wait_for(lambda: proxy.flights.coalesced == n - 1)
+        release.set()
+        for thread in threads:
+            thread.join(10)
+        return results
+
+    def test_concurrent_identical_requests_share_one_call(self, upstream):
+        proxy = start_proxy(upstream, emit_events=True, flights=SingleFlight())
+        try:
+            results = self._burst(upstream, proxy, self.DETERMINISTIC)
+            assert len(upstream.requests) == 1
+            assert all(json.loads(payload) == OPENAI_RESPONSE for _, payload in results)
+            assert sum(resp.getheader("X-AgentPulse-Coalesced") == "1" for resp, _ in results) == 3
+
+            events = wait_for(lambda: proxy.events.qsize() >= 4 and proxy.drain_events())
+            assert sorted(e["coalesced"] for e in events) == [False, True, True, True]
+            assert sum(e["cost_usd"] > 0 for e in events) == 1
+        finally:
+            proxy.stop()
+
+    def test_followers_retry_when_leader_body_fails(self, upstream):
+        calls = []
+
+        def truncated_once(handler, request):
+            calls.append(request)
+            if len(calls) > 1:
+                return FakeUpstream.default_respond(handler, request)
+            handler.send_response(200)
+            handler.send_header("Content-Length", "1000")
+            handler.end_headers()
+            handler.wfile.write(b'{"partial')
+            handler.wfile.flush()
+            handler.connection.shutdown(socket.SHUT_RDWR)
+            raise ConnectionAbortedError("upstream died mid-body")
+
+        upstream.respond = truncated_once
+        proxy = start_proxy(upstream, flights=SingleFlight())
+        try:
+            results = self._burst(upstream, proxy, self.DETERMINISTIC)
+            answered = [json.loads(result[1]) for result in results if result is not None]
+            assert answered == [OPENAI_RESPONSE] * 3  # every follower, none with the leader's partial body
+            assert len(upstream.requests) >= 2
+        finally:
+            proxy.stop()
+
+    def test_streaming_followers_get_the_stream(self, upstream):
+        proxy = start_proxy(upstream, flights=SingleFlight())
+        try:
+            results = self._burst(upstream, proxy, {**self.DETERMINISTIC, "stream": True}, n=3)
+            assert len(upstream.requests) == 1
+            assert all(payload == OPENAI_SSE for _, payload in results)
+        finally:
+            proxy.stop()
+
+    def test_sequential_requests_are_not_coalesced(self, upstream):
+        proxy = start_proxy(upstream, flights=SingleFlight())
+        try:
+            post(proxy, "/openai/v1/chat/completions", self.DETERMINISTIC)
+            post(proxy, "/openai/v1/chat/completions", self.DETERMINISTIC)
+            assert len(upstream.requests) == 2
+            assert proxy.flights.in_flight() == 0
+        finally:
+            proxy.stop()
+
+
+class TestAdmission:
+    def test_queue_time_reported_separately(self, upstream):
+        release = threading.Event()
+        upstream.respond = lambda h, r: (release.wait(5), FakeUpstream.default_respond(h, r))[1]
+        admission = AdmissionController({"openai": {"concurrency": 1}})
+        proxy = start_proxy(upstream, emit_events=True, admission=admission)
+        try:
+            results = []
+            threads = [
+                threading.Thread(target=lambda: results.append(post(proxy, "/openai/v1/chat/completions", CHAT)))
+                for _ in range(2)
+            ]
+            for thread in threads:
+                thread.start()
+            assert wait_for(lambda: admission.stats()["openai"]["queued"] == 1)
+            assert wait_for(lambda: len(upstream.requests) == 1)
+            time.sleep(0.05)
+            release.set()
+            for thread in threads:
+                thread.join(10)
+
+            assert all(resp.status == 200 for resp, _ in results)
+            events = wait_for(lambda: proxy.events.qsize() >= 2 and proxy.drain_events())
+            queued = max(events, key=lambda e: e["queue_ms"])
+            assert queued["queue_ms"] >= 40
+            assert queued["latency_ms"] < queued["queue_ms"] + 1000
+        finally:
+            proxy.stop()
+
+    def test_rejected_with_503_and_priority_header_not_forwarded(self, upstream):
+        admission = AdmissionController({"openai": {"rpm": 1}}, queue_timeout=0)
+        proxy = start_proxy(upstream, admission=admission)
+        try:
+            first, _ = post(proxy, "/openai/v1/chat/completions", CHAT, {"X-AgentPulse-Priority": "high"})
+            second, payload = post(proxy, "/openai/v1/chat/completions", CHAT)
+            assert first.status == 200
+            assert "X-AgentPulse-Priority" not in upstream.requests[0][1]
+            assert second.status == 503
+            assert second.getheader("Retry-After") == "1"
+            assert "queue timeout" in json.loads(payload)["error"]["message"]
+            assert len(upstream.requests) == 1
+        finally:
+            proxy.stop()
+
+
+class TestRateLimitHeaders:
+    def test_headers_become_headroom_and_event_field(self, upstream):
+        headers = {
+            "Content-Type": "application/json",
+            "x-ratelimit-limit-requests": "100",
+            "x-ratelimit-remaining-requests": "7",
+        }
+        upstream.respond = lambda h, r: (200, headers, json.dumps(OPENAI_RESPONSE).encode())
+        proxy = start_proxy(upstream, emit_events=True)
+        try:
+            resp, _ = post(proxy, "/openai/v1/chat/completions", CHAT, {"Authorization": "Bearer sk-rl"})
+            assert resp.getheader("x-ratelimit-remaining-requests") == "7"
+            event = wait_for(proxy.drain_events)[0]
+            assert event["ratelimit"] == {"requests_limit": 100, "requests_remaining": 7}
+            assert ratelimit.TRACKER.latest("openai")[f"openai/{ratelimit.key_id('Bearer sk-rl')}"]
+        finally:
+            proxy.stop()
+
+
+def _dead_url():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return f"http://127.0.0.1:{port}"
+
+
+class TestFailover:
+    def test_connection_error_fails_over(self, upstream):
+        proxy = LLMProxyServer(port=0, providers={"openai": [_dead_url(), upstream.url]})
+        proxy.start()
+        try:
+            resp, payload = post(proxy, "/openai/v1/chat/completions", CHAT)
+            assert resp.status == 200
+            assert json.loads(payload) == OPENAI_RESPONSE
+        finally:
+            proxy.stop()
+
+    def test_5xx_fails_over_but_last_answer_is_returned(self, upstream):
+        broken = FakeUpstream()
+        broken.respond = lambda h, r: (503, {}, b"overloaded")
+        try:
+            proxy = LLMProxyServer(port=0, providers={"openai": [broken.url, upstream.url]})
+            proxy.start()
+            try:
+                resp, _ = post(proxy, "/openai/v1/chat/completions", CHAT)
+                assert resp.status == 200
+                assert len(broken.requests) == 1 and len(upstream.requests) == 1
+            finally:
+                proxy.stop()
+
+            proxy = LLMProxyServer(port=0, providers={"openai": [upstream.url, broken.url]})
+            upstream.respond = lambda h, r: (500, {}, b"boom")
+            proxy.start()
+            try:
+                resp, payload = post(proxy, "/openai/v1/chat/completions", CHAT)
+                assert resp.status == 503
+                assert payload == b"overloaded"
+            finally:
+                proxy.stop()
+        finally:
+            broken.close()
+
+    def test_base_url_path_prefix(self, upstream):
+        proxy = LLMProxyServer(port=0, providers={"openai": [upstream.url + "/mirror/"]})
+        proxy.start()
+        try:
+            post(proxy, "/openai/v1/chat/completions", CHAT)
+            assert upstream.requests[0][0] == "/mirror/v1/chat/completions"
+        finally:
+            proxy.stop()
+
+
+class TestHedging:
+    DETERMINISTIC = {**CHAT, "temperature": 0}
+
+    def test_slow_primary_is_hedged_to_alternate(self, upstream):
+        slow = FakeUpstream()
+        slow.respond = lambda h, r: (time.sleep(2), FakeUpstream.default_respond(h, r))[1]
+        try:
+            proxy = LLMProxyServer(
+                port=0, providers={"openai": [slow.url, upstream.url]}, hedge=HedgePolicy(delay_ms=50),
+            )
+            proxy.start()
+            try:
+                started = time.monotonic()
+                resp, payload = post(proxy, "/openai/v1/chat/completions", self.DETERMINISTIC)
+                assert time.monotonic() - started < 1.5
+                assert resp.status == 200
+                assert json.loads(payload) == OPENAI_RESPONSE
+                assert len(slow.requests) == 1 and len(upstream.requests) == 1
+            finally:
+                proxy.stop()
+        finally:
+            slow.close()
+
+    def test_fast_primary_is_not_hedged(self, upstream):
+        proxy = start_proxy(upstream, hedge=HedgePolicy(delay_ms=1000))
+        try:
+            post(proxy, "/openai/v1/chat/completions", self.DETERMINISTIC)
+            assert len(upstream.requests) == 1
+        finally:
+            proxy.stop()
+
+    def test_streaming_and_sampled_requests_not_hedged(self):
+        policy = HedgePolicy()
+        assert not policy.eligible("POST", {**self.DETERMINISTIC, "stream": True}, True)
+        assert not policy.eligible("POST", CHAT, False)
+        assert policy.eligible("POST", self.DETERMINISTIC, False)
+        assert HedgePolicy(hedge_all=True).eligible("POST", CHAT, False)
+
+    def test_attempt_connecting_after_cancel_never_sends(self, upstream, monkeypatch):
+        cancelled = threading.Event()
+        connect = upstream_module.connect
+
+        def connect_then_lose(base_url, timeout):
+            cancelled.set()  # run() cancels the losers right after the attempt's check
+            return connect(base_url, timeout)
+
+        monkeypatch.setattr(upstream_module, "connect", connect_then_lose)
+        conns, results = [], queue.Queue()
+        HedgePolicy._attempt(
+            "openai", [upstream.url], "POST", "/v1/chat/completions", b"{}", {},
+            5, (conns, cancelled), threading.Lock(), results,
+        )
+        _, response, error = results.get_nowait()
+        assert response is None and isinstance(error, ConnectionAbortedError)
+        assert conns == [] and upstream.requests == []
+
+    def test_delay_tracks_percentile(self):
+        policy = HedgePolicy(min_samples=10, min_delay_ms=0)
+        assert policy.delay("openai") == 2.0  # not enough samples yet
+        for i in range(100):
+            policy.record("openai", i / 100)
+        assert policy.delay("openai") == pytest.approx(0.95)
+
+
+class TestCaptureWorkers:
+    def test_slow_capture_does_not_delay_response(self, upstream):
+        proxy = start_proxy(upstream)
+        process = proxy.capture_pool._handle
+        proxy.capture_pool._handle = lambda job: (time.sleep(1), process(job))[1]
+        try:
+            started = time.monotonic()
+            resp, _ = post(proxy, "/openai/v1/chat/completions", CHAT)
+            assert resp.status == 200
+            assert time.monotonic() - started < 0.8
+            assert wait_for(proxy.get_latest_capture)["response_text"] == "Hello!"
+        finally:
+            proxy.stop()
+
+    def test_full_queue_drops_and_counts(self):
+        release = threading.Event()
+        handled = []
+        pool = CaptureWorkerPool(lambda job: (release.wait(5), handled.append(job))[1], workers=1, max_queue=1)
+        pool.start()
+        try:
+            assert pool.submit({"n": 1})
+            assert wait_for(lambda: pool.pending() == 0)  # picked up by the worker
+            assert pool.submit({"n": 2})
+            assert not pool.submit({"n": 3})
+            assert pool.dropped == 1
+        finally:
+            release.set()
+            pool.stop()
+        assert handled == [{"n": 1}, {"n": 2}]
+
+
+class TestCompressedResponses:
+    def test_gzip_relayed_compressed_and_captured_decoded(self, upstream):
+        compressed = gzip.compress(json.dumps(OPENAI_RESPONSE).encode())
+        headers = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+        upstream.respond = lambda h, r: (200, headers, compressed)
+        proxy = start_proxy(upstream)
+        try:
+            resp, payload = post(proxy, "/openai/v1/chat/completions", CHAT, {"Accept-Encoding": "gzip, br, zstd"})
+            assert resp.getheader("Content-Encoding") == "gzip"
+            assert payload == compressed
+            assert "zstd" not in upstream.requests[0][1]["Accept-Encoding"]
+
+            capture = wait_for(proxy.get_latest_capture)
+            assert capture["input_tokens"] == 12
+            assert capture["response_text"] == "Hello!"
+        finally:
+            proxy.stop()
+
+    def test_gzip_sse_stream(self, upstream):
+        compressed = gzip.compress(OPENAI_SSE)
+        headers = {"Content-Type": "text/event-stream", "Content-Encoding": "gzip"}
+        upstream.respond = lambda h, r: (200, headers, compressed)
+        proxy = start_proxy(upstream)
+        try:
+            body = {**CHAT, "stream": True}
+            _, payload = post(proxy, "/openai/v1/chat/completions", body, {"Accept-Encoding": "gzip"})
+            assert payload == compressed
+            capture = wait_for(proxy.get_latest_capture)
+            assert capture["response_text"] == "Hello"
+            assert capture["output_tokens"] == 2
+        finally:
+            proxy.stop()
+
+
+@pytest.mark.skipif(not proxy_workers.supported(), reason="needs fork() and SO_REUSEPORT")
+class TestWorkerProcesses:
+    def test_workers_share_port_and_forward_captures(self, upstream):
+        proxy = start_proxy(upstream, workers=2, emit_events=True)
+        try:
+            assert len(proxy.supervisor.pids()) == 2
+            for _ in range(6):
+                resp, _ = post(proxy, "/openai/v1/chat/completions", CHAT)
+                assert resp.status == 200
+            events = []
+            assert wait_for(lambda: events.extend(proxy.drain_events()) or len(events) >= 6)
+            assert {e["response_text"] for e in events} == {"Hello!"}
+        finally:
+            proxy.stop()
+
+    def test_parent_metrics_cover_all_workers(self, upstream):
+        headers = {
+            "Content-Type": "application/json",
+            "x-ratelimit-limit-requests": "100",
+            "x-ratelimit-remaining-requests": "42",
+        }
+        upstream.respond = lambda h, r: (200, headers, json.dumps(OPENAI_RESPONSE).encode())
+        requests = metrics.PROXY_REQUESTS.labels("openai", 200)
+        before = requests.get()
+        server = metrics.MetricsServer(port=0)
+        server.start()
+        proxy = start_proxy(upstream, workers=2)
+        try:
+            for _ in range(6):
+                resp, _ = post(proxy, "/openai/v1/chat/completions", CHAT, {"Authorization": "Bearer sk-workers"})
+                assert resp.status == 200
+            assert wait_for(lambda: requests.get() - before == 6, timeout=5)
+
+            with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics", timeout=5) as scrape:
+                body = scrape.read().decode()
+            key = ratelimit.key_id("Bearer sk-workers")
+            assert f'agentpulse_proxy_requests_total{{provider="openai",status="200"}} {before + 6}' in body
+            assert "agentpulse_proxy_in_flight_requests 0" in body
+            assert (
+                f'agentpulse_ratelimit_remaining{{provider="openai",key="{key}",resource="requests"}} 42'
+                in body
+            )
+            assert ratelimit.TRACKER.latest("openai")[f"openai/{key}"]["requests_remaining"] == 42
+        finally:
+            proxy.stop()
+            server.stop()
+
+    def test_dead_worker_is_respawned(self, upstream):
+        proxy = start_proxy(upstream, workers=2)
+        try:
+            victim = proxy.supervisor.pids()[0]
+            os.kill(victim, signal.SIGKILL)
+            assert wait_for(lambda: proxy.supervisor.restarts == 1, timeout=10)
+            pids = proxy.supervisor.pids()
+            assert victim not in pids and len(pids) == 2
+            resp, _ = post(proxy, "/openai/v1/chat/completions", CHAT)
+            assert resp.status == 200
+            assert wait_for(proxy.get_latest_capture)["response_text"] == "Hello!"
+        finally:
+            proxy.stop()
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__("localhost", timeout=10)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+def post_unix(path, api_path, body):
+    conn = _UnixHTTPConnection(path)
+    conn.request("POST", api_path, body=json.dumps(body).encode(), headers={"Content-Type": "application/json"})
+    resp = conn.getresponse()
+    payload = resp.read()
+    conn.close()
+    return resp, payload
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix domain sockets")
+class TestUnixSocket:
+    def test_socket_only_listener(self, upstream, tmp_path):
+        path = str(tmp_path / "proxy.sock")
+        proxy = start_proxy(upstream, socket_path=path, tcp=False)
+        try:
+            assert proxy.server is None
+            assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+            resp, payload = post_unix(path, "/openai/v1/chat/completions", CHAT)
+            assert resp.status == 200
+            assert json.loads(payload) == OPENAI_RESPONSE
+            assert wait_for(proxy.get_latest_capture)["response_text"] == "Hello!"
+        finally:
+            proxy.stop()
+        assert not os.path.exists(path)
+
+    def test_alongside_tcp_replacing_stale_socket(self, upstream, tmp_path):
+        path = str(tmp_path / "proxy.sock")
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(path)
+        stale.close()
+        proxy = start_proxy(upstream, socket_path=path, socket_mode=0o660)
+        try:
+            assert stat.S_IMODE(os.stat(path).st_mode) == 0o660
+            assert post_unix(path, "/openai/v1/chat/completions", CHAT)[0].status == 200
+            assert post(proxy, "/openai/v1/chat/completions", CHAT)[0].status == 200
+        finally:
+            proxy.stop()
+
+    @pytest.mark.skipif(not proxy_workers.supported(), reason="needs fork() and SO_REUSEPORT")
+    def test_shared_by_worker_processes(self, upstream, tmp_path):
+        path = str(tmp_path / "proxy.sock")
+        proxy = start_proxy(upstream, socket_path=path, tcp=False, workers=2)
+        try:
+            for _ in range(4):
+                assert post_unix(path, "/openai/v1/chat/completions", CHAT)[0].status == 200
+            assert wait_for(lambda: len(proxy.captures) == 4)
+        finally:
+            proxy.stop()
+        assert not os.path.exists(path)
+
+    def test_socket_mode_parsing(self):
+        assert parse_socket_mode("660") == 0o660
+        assert parse_socket_mode(0o600) == 0o600
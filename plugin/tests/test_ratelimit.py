@@ -0,0 +1,65 @@
+"""Tests for agentpulse.ratelimit — parsing provider rate-limit headers."""
+
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+from agentpulse import metrics
+from agentpulse.ratelimit import HeadroomTracker, key_id, parse_headers, provider_from_host
+
+
+class TestParseHeaders:
+    def test_openai_headers(self):
+        snapshot = parse_headers([
+            ("x-ratelimit-limit-requests", "500"),
+            ("x-ratelimit-remaining-requests", "499"),
+            ("x-ratelimit-reset-requests", "120ms"),
+            ("x-ratelimit-limit-tokens", "30000"),
+            ("x-ratelimit-remaining-tokens", "29000"),
+            ("x-ratelimit-reset-tokens", "6m0s"),
+            ("Content-Type", "application/json"),
+        ])
+        assert snapshot == {
+            "requests_limit": 500, "requests_remaining": 499, "requests_reset_s": pytest.approx(0.12),
+            "tokens_limit": 30000, "tokens_remaining": 29000, "tokens_reset_s": 360.0,
+        }
+
+    def test_anthropic_headers(self):
+        reset = (datetime.now(timezone.utc) + timedelta(seconds=30)).isoformat().replace("+00:00", "Z")
+        snapshot = parse_headers({
+            "anthropic-ratelimit-requests-limit": "50",
+            "anthropic-ratelimit-requests-remaining": "10",
+            "anthropic-ratelimit-requests-reset": reset,
+            "anthropic-ratelimit-input-tokens-remaining": "1000",
+        })
+        assert snapshot["requests_remaining"] == 10
+        assert snapshot["input_tokens_remaining"] == 1000
+        assert 25 < snapshot["requests_reset_s"] <= 30
+
+    def test_retry_after_forms(self):
+        assert parse_headers({"retry-after": "7"}) == {"retry_after_s": 7.0}
+        assert parse_headers({"retry-after-ms": "1500", "retry-after": "2"}) == {"retry_after_s": 1.5}
+        later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True)
+        assert 55 < parse_headers({"Retry-After": later})["retry_after_s"] <= 60
+
+    def test_no_rate_limit_headers(self):
+        assert parse_headers({"content-type": "application/json", "x-ratelimit-remaining-requests": "?"}) == {}
+
+
+class TestHeadroomTracker:
+    def test_latest_series_and_headroom(self):
+        tracker = HeadroomTracker(history=2)
+        key = key_id("Bearer sk-test")
+        assert "sk-test" not in key
+        for remaining in (90, 50, 20):
+            tracker.observe("openai", key, {"requests_limit": 100, "requests_remaining": remaining})
+
+        assert [snap["requests_remaining"] for _, snap in tracker.series("openai", key)] == [50, 20]
+        assert tracker.latest("openai")[f"openai/{key}"]["requests_remaining"] == 20
+        assert tracker.headroom("openai", key) == 0.2
+        assert metrics.RATELIMIT_REMAINING.labels("openai", key, "requests").get() == 20
+
+    def test_provider_from_host(self):
+        assert provider_from_host("api.anthropic.com") == "anthropic"
+        assert provider_from_host("api.openai.com") == "openai"
+        assert provider_from_host("llm.internal") == "llm.internal"
@@ -0,0 +1,120 @@
+"""Tests for agentpulse.runs — bounded run-state table."""
+
+import pytest
+from agentpulse.runs import (
+    RunStateTable, parse_log_timestamp, start_tool, end_tool, close_segment, run_breakdown,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRunStateTable:
+    def setup_method(self):
+        self.clock = FakeClock()
+        self.table = RunStateTable(ttl=60, max_runs=3, clock=self.clock)
+
+    def test_get_creates_and_reuses(self):
+        run = self.table.get("r1")
+        run["model"] = "gpt-4o"
+        assert self.table.get("r1")["model"] == "gpt-4o"
+        assert len(self.table) == 1
+
+    def test_most_recent_tracks_activity(self):
+        assert self.table.most_recent() is None
+        r1 = self.table.get("r1")
+        r2 = self.table.get("r2")
+        assert self.table.most_recent() is r2
+        self.table.get("r1")
+        assert self.table.most_recent() is r1
+
+    def test_rejects_empty_table(self):
+        with pytest.raises(ValueError):
+            RunStateTable(max_runs=0)
+
+    def test_pop_removes_run(self):
+        self.table.get("r1")
+        assert self.table.pop("r1") is not None
+        assert self.table.pop("r1") is None
+        assert "r1" not in self.table
+        assert self.table.stats()["completed"] == 1
+
+    def test_size_eviction_drops_least_recent(self):
+        for run_id in ("r1", "r2", "r3"):
+            self.table.get(run_id)
+        self.table.get("r1")  # r2 is now the least recently active
+        self.table.get("r4")
+        assert "r2" not in self.table
+        assert all(r in self.table for r in ("r1", "r3", "r4"))
+        assert self.table.stats()["evicted_size"] == 1
+
+    def test_ttl_expiry(self):
+        self.table.get("old")
+        self.clock.now += 45
+        self.table.get("fresh")
+        self.clock.now += 30
+        assert self.table.expire() == 1
+        assert "old" not in self.table
+        assert "fresh" in self.table
+        assert self.table.stats()["evicted_ttl"] == 1
+
+    def test_orphaned_counts_runs_with_pending_data(self):
+        self.table.get("quiet")
+        self.table.get("busy")["tools"].add("exec")
+        self.clock.now += 120
+        self.table.expire()
+        stats = self.table.stats()
+        assert stats["evicted_ttl"] == 2
+        assert stats["orphaned"] == 1
+
+
+class TestSpans:
+    def test_parse_log_timestamp(self):
+        assert parse_log_timestamp("2026-02-01T12:00:00.000Z") == parse_log_timestamp("2026-02-01T12:00:00+00:00")
+        assert parse_log_timestamp("") is None
+        assert parse_log_timestamp("not a date") is None
+
+    def test_tool_span_duration(self):
+        run = RunStateTable().get("r1")
+        start_tool(run, "exec", "t1", 100.0)
+        assert end_tool(run, "t1", 101.5) == pytest.approx(1500)
+        assert end_tool(run, "unknown", 102.0) is None
+
+    def test_segment_breakdown(self):
+        run = RunStateTable().get("r1")
+        run["started_at"] = 100.0
+        # Segment runs 101 → 111 (10s); two overlapping tools 103–106 and 105–108
+        start_tool(run, "exec", "t1", 103.0)
+        start_tool(run, "search", "t2", 105.0)
+        end_tool(run, "t1", 106.0)
+        end_tool(run, "t2", 108.0)
+        timings, breakdown = close_segment(run, 111.0, 10_000)
+
+        assert [t["tool"] for t in timings] == ["exec", "search"]
+        assert [t["duration_ms"] for t in timings] == [3000, 3000]
+        assert breakdown == {"llm_ms": 5000, "tool_ms": 5000, "idle_ms": 1000}
+
+    def test_open_tool_counts_until_segment_end(self):
+        run = RunStateTable().get("r1")
+        start_tool(run, "exec", "t1", 108.0)
+        _, breakdown = close_segment(run, 110.0, 4000)
+        assert breakdown["tool_ms"] == 2000
+        assert breakdown["llm_ms"] == 2000
+
+    def test_run_breakdown_includes_trailing_idle(self):
+        run = RunStateTable().get("r1")
+        run["started_at"] = 100.0
+        close_segment(run, 102.0, 2000)
+        close_segment(run, 106.0, 2000)
+        summary = run_breakdown(run, 8000)
+        assert summary == {"wall_ms": 8000, "llm_ms": 4000, "tool_ms": 0, "idle_ms": 4000, "prompts": 2}
+
+    def test_missing_timestamps_fall_back_to_durations(self):
+        run = RunStateTable().get("r1")
+        _, breakdown = close_segment(run, None, 500)
+        assert breakdown == {"llm_ms": 500, "tool_ms": 0, "idle_ms": 0}
@@ -1,11 +1,22 @@
 """Tests for agentpulse.sdk — event extraction and tracking."""
 
+import asyncio
+import contextvars
+import http.server
+import json
+import threading
+import time
+
 import pytest
+from agentpulse import aio, capture, overhead, sdk, tokens
 from agentpulse.sdk import (
     _extract_event_from_response,
     _extract_prompt_messages,
     _extract_anthropic_messages,
     _detect_provider_from_client,
+    _attach_ratelimit,
+    _last_ratelimit,
+    _record_ratelimit,
 )
 
 
@@ -133,3 +144,485 @@ class TestExtractAnthropicMessages:
         msgs = _extract_anthropic_messages(kwargs)
         assert len(msgs) == 1
         assert msgs[0]["role"] == "user"
+
+
+class TestRateLimitCapture:
+    class _Request:
+        def __init__(self, host, headers):
+            self.url = type("URL", (), {"host": host})()
+            self.headers = headers
+
+    class _Response:
+        def __init__(self, headers):
+            self.headers = headers
+
+    def test_response_headers_attached_to_event(self):
+        token = _last_ratelimit.set(None)
+        try:
+            request = self._Request("api.anthropic.com", {"x-api-key": "sk-ant"})
+            _record_ratelimit(request, self._Response({"anthropic-ratelimit-tokens-remaining": "900"}))
+            event = _attach_ratelimit({"model": "claude-sonnet-4-5"})
+            assert event["ratelimit"] == {"tokens_remaining": 900}
+        finally:
+            _last_ratelimit.reset(token)
+
+    def test_no_headers_no_field(self):
+        token = _last_ratelimit.set(None)
+        try:
+            request = self._Request("api.openai.com", {})
+            _record_ratelimit(request, self._Response({"content-type": "application/json"}))
+            assert "ratelimit" not in _attach_ratelimit({})
+        finally:
+            _last_ratelimit.reset(token)
+
+
+class _Model:
+    """Stand-in for the SDKs' pydantic models: fields declared on the class."""
+
+    model_fields = {}
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class _Chunk(_Model):
+    model_fields = {"model": None, "choices": None, "usage": None}
+
+
+class _Event(_Model):
+    model_fields = {"type": None}
+
+
+def _openai_chunk(content=None, usage=None):
+    delta = _Model(content=content, tool_calls=None)
+    return _Chunk(model="gpt-4o", choices=[_Model(delta=delta)] if content else [], usage=usage)
+
+
+class TestStreamWrappers:
+    @pytest.fixture
+    def events(self, monkeypatch):
+        captured = []
+        monkeypatch.setattr(sdk, "_add_event", lambda event, client=None: captured.append(event))
+        return captured
+
+    def _slow(self, chunks, gap):
+        for chunk in chunks:
+            time.sleep(gap)
+            yield chunk
+
+    def test_openai_fast_path_timing(self, events):
+        chunks = [_openai_chunk("Hel"), _openai_chunk("lo"), _openai_chunk("!")]
+        chunks.append(_openai_chunk(usage=_Model(prompt_tokens=10, completion_tokens=3)))
+        kwargs = {"model": "gpt-4o", "messages": [{"role": "user", "content": "Hi"}]}
+        wrapper = sdk._OpenAIStreamWrapper(self._slow(chunks, 0.02), kwargs, "openai", time.time())
+        assert list(wrapper) == chunks
+
+        event = events[0]
+        assert event["response_text"] == "Hello!"
+        assert (event["input_tokens"], event["output_tokens"]) == (10, 3)
+        assert event["ttft_ms"] >= 15
+        assert event["stream_duration_ms"] >= 30
+        assert event["inter_token_ms"]["p50"] >= 15
+        assert event["tokens_per_sec"] > 0
+
+    def test_openai_generic_objects(self, events):
+        # Plain object without declared fields: takes the getattr path
+        chunk = type("Chunk", (), {})()
+        chunk.model = "gpt-4o-mini"
+        chunk.choices = [_Model(delta=_Model(content="Hi there"))]
+        wrapper = sdk._OpenAIStreamWrapper(iter([chunk]), {"model": "gpt-4o"}, "openai", time.time())
+        list(wrapper)
+        assert events[0]["model"] == "gpt-4o-mini"
+        assert events[0]["response_text"] == "Hi there"
+        assert events[0]["inter_token_ms"] is None
+
+    def test_anthropic_stream(self, events):
+        stream = [
+            _Event(type="message_start", message=_Model(model="claude-sonnet-4-5", usage=_Model(input_tokens=7))),
+            _Event(type="content_block_delta", delta=_Model(text="Hi")),
+            _Event(type="content_block_delta", delta=_Model(text=" you")),
+            _Event(type="message_delta", usage=_Model(output_tokens=2)),
+        ]
+        wrapper = sdk._AnthropicStreamWrapper(iter(stream), {"model": "claude"}, time.time())
+        list(wrapper)
+        event = events[0]
+        assert event["provider"] == "anthropic"
+        assert event["model"] == "claude-sonnet-4-5"
+        assert event["response_text"] == "Hi you"
+        assert (event["input_tokens"], event["output_tokens"]) == (7, 2)
+        assert event["ttft_ms"] is not None
+
+    def test_async_wrapper(self, events):
+        async def stream():
+            for text in ("a", "b"):
+                yield _openai_chunk(text)
+
+        async def consume():
+            wrapper = sdk._OpenAIAsyncStreamWrapper(stream(), {"model": "gpt-4o"}, "openai", time.time())
+            return [chunk async for chunk in wrapper]
+
+        assert len(asyncio.run(consume())) == 2
+        assert events[0]["response_text"] == "ab"
+        assert events[0]["inter_token_ms"] is not None
+
+    def test_no_tokens_no_timing(self, events):
+        list(sdk._OpenAIStreamWrapper(iter([]), {"model": "gpt-4o"}, "openai", time.time()))
+        assert events[0]["ttft_ms"] is None
+        assert events[0]["tokens_per_sec"] is None
+
+    def test_missing_usage_counted_locally(self, events):
+        kwargs = {"model": "claude-sonnet-4-5", "system": "Be terse.", "messages": [{"role": "user", "content": "Hi"}]}
+        stream = [_Event(type="content_block_delta", delta=_Model(text="Hello, world"))]
+        list(sdk._AnthropicStreamWrapper(iter(stream), kwargs, time.time()))
+        event = events[0]
+        assert event["tokens_estimated"] is True
+        assert event["input_tokens"] == tokens.count_messages(kwargs["messages"], "claude-sonnet-4-5", "Be terse.")
+        assert event["output_tokens"] == tokens.count_text("Hello, world", "claude-sonnet-4-5")
+
+    def test_wrapper_forwards_attributes(self):
+        stream = _Model(response="raw")
+        wrapper = sdk._OpenAIStreamWrapper(stream, {}, "openai", time.time())
+        assert wrapper.response == "raw"
+        with pytest.raises(AttributeError):
+            object.__setattr__(wrapper, "extra", 1)  # __slots__, no instance dict
+
+
+class _SlowAPI:
+    """Event API stand-in on its own thread that takes `delay` seconds to answer."""
+
+    def __init__(self, delay=0.0, status=200):
+        self.delay = delay
+        self.status = status
+        self.batches = []
+        api = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                time.sleep(api.delay)
+                api.batches.append(json.loads(body))
+                self.send_response(api.status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api/events"
+
+    def events(self):
+        return [e for batch in self.batches for e in batch["events"]]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestAsyncExport:
+    @pytest.fixture
+    def api(self, monkeypatch):
+        api = _SlowAPI()
+        monkeypatch.setattr(sdk, "_config", {"api_key": "ap_test", "agent_name": "bot", "endpoint": api.url})
+        monkeypatch.setattr(aio, "_retired", dict.fromkeys(aio._retired, 0))
+        yield api
+        api.close()
+
+    def test_loop_never_blocks_on_export(self, api):
+        api.delay = 0.5
+
+        async def main():
+            lags = []
+
+            async def ticker():
+                while True:
+                    before = time.perf_counter()
+                    await asyncio.sleep(0.01)
+                    lags.append(time.perf_counter() - before - 0.01)
+
+            tick = asyncio.create_task(ticker())
+            for i in range(120):  # past the batch size, which used to flush inline
+                sdk._add_event({"n": i})
+            await asyncio.sleep(0.8)
+            await sdk.aflush()
+            tick.cancel()
+            return lags
+
+        lags = asyncio.run(main())
+        assert max(lags) < 0.2
+        assert sorted(e["n"] for e in api.events()) == list(range(120))
+        assert not sdk._exporter.pending()
+
+    def test_ashutdown_sends_remaining(self, api):
+        async def main():
+            sdk._add_event({"n": 1})
+            await sdk.ashutdown()
+
+        asyncio.run(main())
+        assert api.events() == [{"n": 1}]
+        assert aio.stats()["sent"] == 1
+
+    def test_failed_batch_kept_for_retry(self, api):
+        api.status = 500
+
+        async def main():
+            sdk._add_event({"n": 1})
+            assert not await aio.current_exporter().flush()
+            assert aio.current_exporter().pending() == 1
+            api.status = 200
+            await sdk.aflush()
+            assert aio.current_exporter().pending() == 0
+
+        asyncio.run(main())
+        assert api.events() == [{"n": 1}, {"n": 1}]
+
+    def test_rejected_batch_is_dropped(self, api):
+        api.status = 401
+
+        async def main():
+            sdk._add_event({"n": 1})
+            assert await aio.current_exporter().flush()
+            assert aio.current_exporter().pending() == 0
+            return aio.current_exporter().dropped
+
+        assert asyncio.run(main()) == 1
+        assert api.events() == [{"n": 1}]
+
+    def test_queue_handed_off_when_loop_exits(self, api, monkeypatch):
+        monkeypatch.setattr(sdk, "_exporter", sdk._Exporter())
+
+        async def main():
+            for i in range(3):
+                sdk._add_event({"n": i})
+            return asyncio.get_running_loop()
+
+        loop = asyncio.run(main())
+        assert loop not in aio._exporters
+        assert sdk._exporter.pending() == 3
+        sdk._exporter.flush()
+        assert sorted(e["n"] for e in api.events()) == [0, 1, 2]
+
+
+class TestContext:
+    @pytest.fixture(autouse=True)
+    def defaults(self, monkeypatch):
+        monkeypatch.setattr(sdk, "_global_user_id", "default-user")
+        monkeypatch.setattr(sdk, "_global_task_context", "default-task")
+
+    def test_globals_are_defaults(self):
+        assert sdk._attribution() == {"task_context": "default-task", "user_id": "default-user"}
+        with sdk.context(user_id="alice"):
+            assert sdk._attribution() == {"task_context": "default-task", "user_id": "alice"}
+        assert sdk._attribution()["user_id"] == "default-user"
+
+    def test_nesting_merges_tags(self):
+        with sdk.context(user_id="alice", tags={"team": "a", "route": "chat"}):
+            with sdk.context(task_context="summarise", tags={"route": "batch"}):
+                fields = sdk._attribution()
+        assert fields == {
+            "task_context": "summarise", "user_id": "alice", "tags": {"team": "a", "route": "batch"},
+        }
+
+    def test_concurrent_asyncio_tasks(self):
+        async def serve(user):
+            with sdk.context(user_id=user):
+                await asyncio.sleep(0.01)
+                return sdk._attribution()["user_id"]
+
+        async def main():
+            return await asyncio.gather(*(serve(f"user-{i}") for i in range(50)))
+
+        assert asyncio.run(main()) == [f"user-{i}" for i in range(50)]
+
+    def test_threads_and_copied_context(self):
+        results = {}
+
+        def worker(user):
+            with sdk.context(user_id=user):
+                time.sleep(0.01)
+                ctx = contextvars.copy_context()
+            # The copied context still carries the scope after the block ends
+            results[user] = ctx.run(lambda: sdk._attribution()["user_id"])
+
+        threads = [threading.Thread(target=worker, args=(f"t{i}",)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert results == {f"t{i}": f"t{i}" for i in range(8)}
+
+    def test_stream_attributed_to_its_creator(self, monkeypatch):
+        events = []
+        monkeypatch.setattr(sdk, "_add_event", lambda event, client=None: events.append(event))
+        with sdk.context(user_id="alice", task_context="chat"):
+            wrapper = sdk._OpenAIStreamWrapper(iter([_openai_chunk("hi")]), {"model": "gpt-4o"}, "openai", time.time())
+        list(wrapper)
+        assert (events[0]["user_id"], events[0]["task_context"]) == ("alice", "chat")
+
+
+class TestClients:
+    @pytest.fixture
+    def api(self, monkeypatch):
+        api = _SlowAPI()
+        monkeypatch.setattr(sdk, "_exporter", sdk._Exporter())
+        monkeypatch.setattr(sdk, "_config", {"api_key": "ap_default", "agent_name": "default", "endpoint": api.url})
+        yield api
+        sdk._exporter.stop()
+        api.close()
+
+    def test_rejected_batch_is_dropped(self, api):
+        api.status = 400
+        sdk._exporter.extend(sdk._config, [{"n": 1}])
+        sdk._exporter.flush()
+        assert sdk._exporter.pending() == 0
+        assert sdk._exporter.stats()["events_dropped"] == 1
+        assert api.events() == [{"n": 1}]
+
+    def _client(self, api, name, **kwargs):
+        return sdk.AgentPulse(api_key=f"ap_{name}", agent_name=name, endpoint=api.url, **kwargs)
+
+    def test_events_batched_per_agent(self, api):
+        support, billing = self._client(api, "support"), self._client(api, "billing")
+        with support.scope():
+            sdk._add_event({"n": 1})
+            with billing.scope():
+                sdk._add_event({"n": 2})
+            sdk._add_event({"n": 3})
+        sdk._add_event({"n": 4})
+        assert support.pending() == 2 and billing.pending() == 1
+
+        sdk._flush()
+        batches = {b["agent_name"]: (b["api_key"], [e["n"] for e in b["events"]]) for b in api.batches}
+        assert batches == {
+            "support": ("ap_support", [1, 3]),
+            "billing": ("ap_billing", [2]),
+            "default": ("ap_default", [4]),
+        }
+
+    def test_clients_share_one_thread(self, api):
+        before = threading.active_count()
+        clients = [self._client(api, f"agent-{i}") for i in range(20)]
+        assert threading.active_count() <= before + 1
+        for client in clients:
+            client.track({"model": "gpt-4o", "usage": {"prompt_tokens": 1, "completion_tokens": 1}})
+        clients[0].flush()
+        assert [b["agent_name"] for b in api.batches] == ["agent-0"]
+        assert sdk._exporter.pending() == 19
+
+    def test_client_user_is_a_default(self, api):
+        client = self._client(api, "support", user_id="support-bot")
+        with client.scope():
+            assert sdk._attribution()["user_id"] == "support-bot"
+            with sdk.context(user_id="alice"):
+                assert sdk._attribution()["user_id"] == "alice"
+                assert sdk._current_client() is client
+
+    def test_stream_reported_under_creating_client(self, api):
+        client = self._client(api, "support")
+        with client.scope():
+            wrapper = sdk._OpenAIStreamWrapper(iter([_openai_chunk("hi")]), {"model": "gpt-4o"}, "openai", time.time())
+        list(wrapper)
+        assert client.pending() == 1
+
+    def test_async_batches_per_agent(self, api):
+        support, billing = self._client(api, "support"), self._client(api, "billing")
+
+        async def main():
+            with support.scope():
+                sdk._add_event({"n": 1})
+            with billing.scope():
+                sdk._add_event({"n": 2})
+            await sdk.aflush()
+
+        asyncio.run(main())
+        assert sorted((b["agent_name"], len(b["events"])) for b in api.batches) == [("billing", 1), ("support", 1)]
+
+
+class TestOverheadAccounting:
+    @pytest.fixture
+    def monitor(self, monkeypatch):
+        monitor = overhead.OverheadMonitor(window=1000)
+        monkeypatch.setattr(sdk, "_overhead", monitor)
+        monkeypatch.setattr(sdk, "_exporter", sdk._Exporter(max_pending=3))
+        monkeypatch.setattr(sdk, "_config", {"api_key": "", "agent_name": "bot", "endpoint": "http://127.0.0.1:9"})
+        return monitor
+
+    def test_stream_records_its_overhead(self, monitor):
+        list(sdk._OpenAIStreamWrapper(iter([_openai_chunk("hi")] * 5), {"model": "gpt-4o"}, "openai", time.time()))
+        snap = monitor.snapshot()
+        assert snap["calls"] == 1
+        assert snap["overhead_ms"] > 0
+
+    def test_metrics_only_skips_prompt_copy(self, monitor):
+        monitor.level = 3
+
+        def extract(kwargs):
+            raise AssertionError("prompt copied")
+
+        sdk._capture({"response_text": "hi", "model": "gpt-4o"}, {}, extract)
+        [event] = [e for batch in sdk._exporter._batches.values() for e in batch]
+        assert event["prompt_messages"] == [] and event["response_text"] is None
+        assert event["capture_level"] == "metrics_only"
+
+    def test_stats_buffer_and_drops(self, monitor):
+        for i in range(5):
+            sdk._add_event({"n": i, "response_text": "x" * 100, "prompt_messages": []})
+        stats = sdk.stats()
+        assert stats["buffer_events"] == 3
+        assert stats["events_dropped"] == 2
+        assert stats["buffer_bytes"] == 3 * (overhead._EVENT_BASE_BYTES + 100)
+        assert stats["capture_level"] == "full"
+        sdk._flush()  # no api_key: discarded without a request
+        assert sdk.stats()["buffer_bytes"] == 0
+
+
+class TestCaptureBudgets:
+    @pytest.fixture
+    def events(self, monkeypatch):
+        captured = []
+        monkeypatch.setattr(sdk, "_add_event", lambda event, client=None: captured.append(event))
+        monkeypatch.setattr(sdk, "_capture_policy", capture.CapturePolicy(max_message_bytes=100, max_event_bytes=250))
+        monkeypatch.setattr(sdk, "_overhead", overhead.OverheadMonitor())
+        return captured
+
+    def test_response_first_then_newest_prompt(self, events):
+        kwargs = {"messages": [{"role": "user", "content": "old " * 100}, {"role": "user", "content": "new"}]}
+        sdk._capture({"response_text": "r" * 500}, kwargs, sdk._extract_prompt_messages)
+        [event] = events
+        assert event["response_text"].startswith("r" * 18) and "[464 bytes removed" in event["response_text"]
+        old, new = event["prompt_messages"]
+        assert new == {"role": "user", "content": "new"}
+        assert "[368 bytes removed" in old["content"]
+
+    def test_long_history_within_event_budget(self, events, monkeypatch):
+        monkeypatch.setattr(sdk, "_capture_policy", capture.CapturePolicy())
+        kwargs = {"messages": [{"role": "user", "content": f"turn {i} " + "y" * 300} for i in range(1000)]}
+        sdk._capture({"response_text": "r" * 5000}, kwargs, sdk._extract_prompt_messages)
+        [event] = events
+        bodies = capture.utf8_len(event["response_text"]) + len(json.dumps(event["prompt_messages"]).encode())
+        assert bodies <= capture.MAX_EVENT_BYTES
+        assert "messages, " in event["prompt_messages"][0]["content"]
+
+    def test_image_parts_not_copied(self, events):
+        image = {"type": "image_url", "image_url": {"url": "data:image/png;base64," + "A" * 100000}}
+        kwargs = {"messages": [{"role": "user", "content": [{"type": "text", "text": "what is this?"}, image]}]}
+        sdk._capture({"response_text": "a cat"}, kwargs, sdk._extract_prompt_messages)
+        assert events[0]["prompt_messages"] == [{"role": "user", "content": "what is this?"}]
+
+    def test_long_stream_held_bounded(self, events):
+        chunks = [_openai_chunk("word ") for _ in range(2000)]
+        wrapper = sdk._OpenAIStreamWrapper(iter(chunks), {"model": "gpt-4o"}, "openai", time.time())
+        for i, _ in enumerate(wrapper):
+            if i == 1000:
+                recorder = wrapper._recorder
+                assert len(recorder._content_parts) < sdk._COMPACT_EVERY
+        text = events[0]["response_text"]
+        assert text == capture.truncate("word " * 2000, 100)
+        assert 2000 <= events[0]["output_tokens"] <= 3000  # scaled up from the kept head and tail
+
+    def test_truncate_level_tightens_budget(self, events):
+        sdk._overhead.level = 1
+        sdk._capture({"response_text": "é" * 5000}, {}, sdk._extract_prompt_messages)
+        assert capture.utf8_len(events[0]["response_text"]) <= 100
+        assert events[0]["capture_level"] == "truncate"
@@ -104,3 +104,49 @@ class TestEventSender:
             assert payload["agent_name"] == "test-agent"
             assert payload["framework"] == "test"
             assert isinstance(payload["events"], list)
+
+
+class TestConnectionPool:
+    def setup_method(self):
+        import http.server
+        import threading
+
+        connections = self.connections = []
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                connections.append(self.client_address)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers["Content-Length"]))
+                body = b'{"success": true}'
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.endpoint = f"http://127.0.0.1:{self.server.server_address[1]}/api/events"
+
+    def teardown_method(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_senders_share_keepalive_connection(self):
+        senders = [
+            EventSender("ap_a", self.endpoint, "agent-a", "test"),
+            EventSender("ap_b", self.endpoint, "agent-b", "test"),
+        ]
+        for _ in range(3):
+            for sender in senders:
+                sender.add_event({"model": "gpt-4o"})
+                assert sender.flush() is True
+        assert sum(s.events_sent for s in senders) == 6
+        assert len(self.connections) == 1
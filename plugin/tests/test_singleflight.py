@@ -0,0 +1,56 @@
+"""Tests for agentpulse.singleflight — sharing one upstream call between identical requests."""
+
+import threading
+
+from agentpulse.singleflight import SingleFlight
+
+
+class TestSingleFlight:
+    def test_first_caller_leads_others_follow(self):
+        flights = SingleFlight()
+        leader, is_leader = flights.join("k")
+        follower, is_follower_leader = flights.join("k")
+        assert is_leader and not is_follower_leader
+        assert follower is leader
+        assert flights.coalesced == 1
+
+        flights.land("k", leader)
+        again, is_leader = flights.join("k")
+        assert is_leader and again is not leader
+
+    def test_followers_see_chunks_as_they_arrive(self):
+        flights = SingleFlight()
+        flight, _ = flights.join("k")
+        flights.join("k")
+        flight.start(200, [("Content-Type", "text/event-stream")])
+        flight.write(b"a")
+
+        received = []
+        first = threading.Event()
+
+        def follow():
+            assert flight.wait_start(timeout=5)
+            for chunk in flight.chunks():
+                received.append(chunk)
+                first.set()
+
+        thread = threading.Thread(target=follow)
+        thread.start()
+        assert first.wait(5)
+        assert received == [b"a"]  # delivered before the flight ended
+        flight.write(b"b")
+        flights.land("k", flight)
+        thread.join(5)
+        assert received == [b"a", b"b"]
+
+    def test_leader_failure_before_headers(self):
+        flights = SingleFlight()
+        flight, _ = flights.join("k")
+        flights.land("k", flight)
+        assert flight.wait_start(timeout=1) is False
+
+    def test_sampled_requests_not_coalesced_by_default(self):
+        request = {"model": "gpt-4o", "temperature": 0.7}
+        assert not SingleFlight().should_coalesce(request)
+        assert SingleFlight(deterministic_only=False).should_coalesce(request)
+        assert SingleFlight().should_coalesce({**request, "temperature": 0})
@@ -0,0 +1,166 @@
+"""Tests for startup cost — lazy `import agentpulse` and the `agentpulse run` bootstrap.
+
+Import costs come from `python -X importtime` in a fresh interpreter, with
+bytecode caching on (a warm-up run fills the cache) so they reflect what
+users see rather than compile time.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from agentpulse import cli, sdk
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOOTSTRAP = os.path.join(PLUGIN_DIR, "agentpulse", "_bootstrap_sitecustomize.py")
+
+# Never wanted in a process just because it runs under `agentpulse run`
+HEAVY_MODULES = ("yaml", "agentpulse.config", "agentpulse.parser", "urllib.request", "http.client", "orjson")
+
+
+def _importtime(code: str, tmp_path, env: dict = None, runs: int = 3) -> dict:
+    """{module: cumulative import seconds} for running code, best of runs."""
+    full_env = {k: v for k, v in os.environ.items() if k != "PYTHONDONTWRITEBYTECODE"}
+    full_env["PYTHONPYCACHEPREFIX"] = str(tmp_path / "pycache")
+    full_env.setdefault("PYTHONPATH", PLUGIN_DIR)
+    full_env.update(env or {})
+    best = None
+    for _ in range(runs + 1):  # the first run only warms the bytecode cache
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            env=full_env, capture_output=True, text=True, timeout=60, cwd=str(tmp_path),
+        )
+        assert result.returncode == 0, result.stderr
+        times = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            times[name.strip()] = int(cumulative) / 1e6
+        if best is None or sum(times.values()) < sum(best.values()):
+            best = times
+    return best
+
+
+def _bootstrap_env(tmp_path) -> dict:
+    """Environment cmd_run gives a child process."""
+    bootstrap_dir = tmp_path / "bootstrap"
+    bootstrap_dir.mkdir(exist_ok=True)
+    shutil.copy(BOOTSTRAP, bootstrap_dir / "sitecustomize.py")
+    config = {"api_key": "ap_test", "agent_name": "bot", "endpoint": "http://127.0.0.1:9/api/events",
+              "framework": "openclaw"}
+    return {"PYTHONPATH": str(bootstrap_dir), "_AGENTPULSE_PKG_PATH": PLUGIN_DIR, **cli._sdk_env(config)}
+
+
+class TestLazyImport:
+    def test_import_loads_nothing_else(self, tmp_path):
+        times = _importtime("import agentpulse", tmp_path)
+        assert [m for m in times if m.startswith("agentpulse")] == ["agentpulse"]
+        assert not set(HEAVY_MODULES) & set(times)
+
+    def test_attributes_load_on_demand(self):
+        code = (
+            "import sys, agentpulse\n"
+            "assert 'agentpulse.sdk' not in sys.modules\n"
+            "assert callable(agentpulse.init) and 'agentpulse.sdk' in sys.modules\n"
+            "assert agentpulse.metrics.REGISTRY\n"
+            "assert 'init' in dir(agentpulse)\n"
+            "try:\n"
+            "    agentpulse.nope\n"
+            "except AttributeError:\n"
+            "    pass\n"
+            "else:\n"
+            "    raise SystemExit('expected AttributeError')\n"
+        )
+        result = subprocess.run([sys.executable, "-c", code], env={**os.environ, "PYTHONPATH": PLUGIN_DIR},
+                                capture_output=True, text=True, timeout=60)
+        assert result.returncode == 0, result.stderr
+
+    def test_parser_still_exports_pricing_and_patterns(self):
+        from agentpulse import parser, pricing
+        assert parser.estimate_cost is pricing.estimate_cost
+        assert parser.MODEL_PRICING is pricing.MODEL_PRICING
+        assert parser.AGENT_END_RE.search("embedded run agent end: runId=abc").group(1) == "abc"
+
+
+class TestBootstrap:
+    def test_child_skips_config_and_http_stack(self, tmp_path):
+        times = _importtime("pass", tmp_path, _bootstrap_env(tmp_path))
+        assert "agentpulse.pricing" in times  # the SDK was loaded
+        assert not set(HEAVY_MODULES) & set(times)
+
+    def test_child_is_initialized_from_env(self, tmp_path):
+        code = (
+            "import sys\n"
+            "sdk = sys.modules['agentpulse.sdk']\n"
+            "assert sdk._initialized\n"
+            "assert sdk._config['agent_name'] == 'bot' and sdk._config['framework'] == 'openclaw', sdk._config\n"
+        )
+        env = {k: v for k, v in os.environ.items() if k != "PYTHONPATH"}
+        result = subprocess.run([sys.executable, "-c", code], env={**env, **_bootstrap_env(tmp_path)},
+                                capture_output=True, text=True, timeout=60, cwd=str(tmp_path))
+        assert result.returncode == 0, result.stderr
+
+    def test_startup_budget(self, tmp_path):
+        """Everything the bootstrap imports (was ~130ms with YAML and urllib)."""
+        times = _importtime("pass", tmp_path, _bootstrap_env(tmp_path))
+        added = times["sitecustomize"]
+        assert added < 0.1, f"bootstrap took {added * 1000:.1f}ms"
+
+
+class TestEnvConfig:
+    def test_env_settings_skip_config_file(self, monkeypatch):
+        import agentpulse.config
+
+        def no_file(*args, **kwargs):
+            raise AssertionError("config file read")
+
+        monkeypatch.setattr(agentpulse.config, "load_config", no_file)
+        for key, value in {"API_KEY": "ap_env", "AGENT_NAME": "env-bot", "ENDPOINT": "http://x/api"}.items():
+            monkeypatch.setenv(f"AGENTPULSE_{key}", value)
+        monkeypatch.delenv("AGENTPULSE_FRAMEWORK", raising=False)
+        config = sdk._load_agent_config(agent_name="explicit")
+        assert config == {"api_key": "ap_env", "agent_name": "explicit", "endpoint": "http://x/api",
+                          "framework": "python-sdk"}
+
+    def test_missing_identity_reads_config_file(self, monkeypatch):
+        import agentpulse.config
+
+        calls = []
+
+        def fake_load(*args, **kwargs):
+            calls.append(kwargs)
+            return {"api_key": "ap_file", "agent_name": "file-bot", "framework": "openclaw"}
+
+        monkeypatch.setattr(agentpulse.config, "load_config", fake_load)
+        for key in sdk._ENV_SETTINGS.values():
+            monkeypatch.delenv(key, raising=False)
+        config = sdk._load_agent_config()
+        assert calls == [{"detect_log_path": False}]
+        assert config["api_key"] == "ap_file" and config["endpoint"] == "https://agentpulses.com/api/events"
+
+
+class TestPatchOnImport:
+    @pytest.fixture
+    def fake_sdk(self, tmp_path, monkeypatch):
+        package = tmp_path / "fake_llm_sdk"
+        package.mkdir()
+        (package / "__init__.py").write_text("VALUE = 1\n")
+        monkeypatch.syspath_prepend(str(tmp_path))
+        yield "fake_llm_sdk"
+        sys.modules.pop("fake_llm_sdk", None)
+        sdk._import_hook.pending.pop("fake_llm_sdk", None)
+
+    def test_patched_after_first_import(self, fake_sdk, monkeypatch):
+        patched = []
+        monkeypatch.setattr(sdk._import_hook, "pending", {fake_sdk: lambda: patched.append(sys.modules[fake_sdk])})
+        monkeypatch.setattr(sys, "meta_path", [sdk._import_hook, *sys.meta_path])
+
+        import fake_llm_sdk
+        assert patched == [fake_llm_sdk]
+        assert fake_sdk not in sdk._import_hook.pending
+        assert not isinstance(fake_llm_sdk.__loader__, sdk._PatchingLoader)
+        assert fake_llm_sdk.__spec__.loader is fake_llm_sdk.__loader__
@@ -0,0 +1,133 @@
+"""Tests for local token counting."""
+
+import hashlib
+import sys
+import types
+
+import pytest
+
+from agentpulse import proxy, tokens
+
+
+@pytest.fixture
+def counted(monkeypatch):
+    """The ratio backend, recording each text it is asked to count."""
+    texts = []
+
+    def count(text, model=None):
+        texts.append(text)
+        return tokens._ratio_count(text, model)
+
+    tokens.set_backend(count)
+    yield texts
+    tokens.set_backend()
+
+
+class TestRatioCount:
+    def test_prose_uses_model_ratio(self):
+        text = "the quick brown fox jumps over the lazy dog " * 20
+        assert tokens._ratio_count(text, "gpt-4o") == round(len(text) / 4.2)
+        assert tokens._ratio_count(text, "anthropic/claude-sonnet-4-5") > tokens._ratio_count(text, "gpt-4o")
+
+    def test_code_denser_than_prose(self):
+        prose = "we return the first item of the list plus one"
+        code = 'return {"a": x[0] + 1, "b": f(y)};'
+        assert tokens._ratio_count(code) / len(code) > tokens._ratio_count(prose) / len(prose)
+
+    def test_non_english(self):
+        assert tokens._ratio_count("今日は良い天気ですね") == 10
+        assert tokens._ratio_count("Привет как дела") == round(13 * 0.45 + 2 / 3.8)
+
+    def test_empty(self):
+        assert tokens.count_text("") == 0
+        assert tokens.count_text(None) == 0
+
+
+class TestBackends:
+    def test_unknown_falls_back_to_ratio(self):
+        try:
+            assert tokens.set_backend("nope") == "ratio"
+        finally:
+            tokens.set_backend()
+
+    def test_tiktoken(self):
+        tiktoken = pytest.importorskip("tiktoken")
+        try:
+            if tokens.set_backend("tiktoken") != "tiktoken":
+                pytest.skip("tiktoken encoding files not cached")
+            encoding = tiktoken.encoding_for_model("gpt-4o")
+            assert tokens.count_text("hello world", "gpt-4o") == len(encoding.encode("hello world"))
+        finally:
+            tokens.set_backend()
+
+    def test_tiktoken_only_loads_cached_encodings(self, monkeypatch, tmp_path):
+        loaded = []
+        fake = types.ModuleType("tiktoken")
+        fake.model = types.ModuleType("tiktoken.model")
+        fake.model.encoding_name_for_model = {"gpt-4o": "o200k_base", "gpt-4": "cl100k_base"}.__getitem__
+        fake.get_encoding = lambda name: loaded.append(name) or types.SimpleNamespace(
+            encode=lambda text, disallowed_special: text.split()
+        )
+        monkeypatch.setitem(sys.modules, "tiktoken", fake)
+        monkeypatch.setitem(sys.modules, "tiktoken.model", fake.model)
+        monkeypatch.setenv("TIKTOKEN_CACHE_DIR", str(tmp_path))
+        try:
+            assert tokens.set_backend("tiktoken") == "ratio"
+
+            url = tokens._TIKTOKEN_BLOB_URL.format("cl100k_base")
+            (tmp_path / hashlib.sha1(url.encode()).hexdigest()).write_bytes(b"")
+            assert tokens.set_backend("tiktoken") == "tiktoken"
+            assert tokens.count_text("one two three", "gpt-4") == 3
+            assert tokens.count_text("one two three", "claude-sonnet-4-5") == 3
+            assert tokens.count_text("one two three", "gpt-4o") == tokens._ratio_count("one two three", "gpt-4o")
+            assert loaded == ["cl100k_base", "cl100k_base"]
+        finally:
+            monkeypatch.undo()
+            tokens.set_backend()
+
+
+class TestCountMessages:
+    def test_growing_conversation_counted_incrementally(self, counted):
+        history = [{"role": "system", "content": "be brief"}, {"role": "user", "content": "q1"}]
+        first = tokens.count_messages(history, "gpt-4o")
+        assert counted == ["be brief", "q1"]
+
+        history += [{"role": "assistant", "content": "a1"}, {"role": "user", "content": "q2"}]
+        second = tokens.count_messages(history, "gpt-4o")
+        assert counted[2:] == ["a1", "q2"]
+        assert second == first + 2 * (tokens.count_text("a1", "gpt-4o") + tokens.MESSAGE_TOKENS)
+
+    def test_changed_message_recounted(self, counted):
+        tokens.count_messages([{"role": "user", "content": "one"}, {"role": "user", "content": "two"}])
+        tokens.count_messages([{"role": "user", "content": "one"}, {"role": "user", "content": "TWO"}])
+        assert counted == ["one", "two", "TWO"]
+
+    def test_system_and_parts(self, counted):
+        messages = [{"role": "user", "content": [{"type": "text", "text": "look"}, {"type": "image", "source": {}}]}]
+        total = tokens.count_messages(messages, "claude-sonnet-4-5", system="sys")
+        assert counted == ["sys", "look"]
+        assert total == 2 + 2 * tokens.MESSAGE_TOKENS
+
+    def test_cache_bounded(self, counted, monkeypatch):
+        monkeypatch.setattr(tokens, "PREFIX_CACHE_SIZE", 10)
+        for i in range(50):
+            tokens.count_messages([{"role": "user", "content": f"message {i}"}])
+        assert len(tokens._prefix_counts) == 10
+
+
+class TestProxyEstimate:
+    def test_stream_without_usage_counted_from_request(self):
+        request = {"model": "gpt-4o", "stream": True, "messages": [{"role": "user", "content": "x " * 5000}]}
+        body = b'data: {"choices":[{"delta":{"content":"Hello there"}}]}\n\ndata: [DONE]\n\n'
+        capture = proxy.build_capture("openai", request, body, is_streaming=True)
+        assert capture["tokens_estimated"] is True
+        # The whole prompt, not the 2000-character copy kept in prompt_messages
+        assert capture["input_tokens"] == tokens.count_messages(request["messages"], "gpt-4o")
+        assert capture["input_tokens"] > 2000
+        assert capture["output_tokens"] == tokens.count_text("Hello there", "gpt-4o")
+        assert proxy.capture_to_event(capture)["tokens_estimated"] is True
+
+    def test_usage_reported(self):
+        body = b'{"choices":[{"message":{"content":"hi"}}],"usage":{"prompt_tokens":7,"completion_tokens":1}}'
+        capture = proxy.build_capture("openai", {"model": "gpt-4o", "messages": []}, body, is_streaming=False)
+        assert (capture["input_tokens"], capture["output_tokens"], capture["tokens_estimated"]) == (7, 1, False)